@@ -1,6 +1,7 @@
 # app/api/auth/auth_service.py
 
 import os
+import asyncio
 from supabase import create_client, Client
 from dotenv import load_dotenv
 from fastapi import HTTPException, status
@@ -39,14 +40,16 @@ class AuthService:
 
     async def sign_in_user(self, email: str, password: str, ip_address: str, user_agent: str):
         try:
-            auth_response = self.client.auth.sign_in_with_password({"email": email, "password": password})
+            # GoTrue por el cliente síncrono: en un hilo para no frenar el event loop
+            auth_response = await asyncio.to_thread(
+                self.client.auth.sign_in_with_password, {"email": email, "password": password}
+            )
             
             if not auth_response.user:
                 return False, "Credenciales inválidas.", None, None
 
             user_id = auth_response.user.id
-            decision = process_login_attempt(
-                supabase_service=self.service_client,
+            decision = await process_login_attempt(
                 user_id=user_id,
                 ip_address=ip_address,
                 user_agent=user_agent
@@ -1,14 +1,20 @@
-from fastapi import APIRouter, Depends, HTTPException
-from typing import Any, Dict
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from typing import Any, AsyncIterator, Dict, List, Optional, Set
+from app.core import chat_context, metrics, recurrence
 from app.core.auth import get_user_id
-from app.core.openai_client import get_openai
-from app.core.supabase_client import get_supabase_for_request
+from app.core.openai_client import get_async_openai
+from app.core.supabase_client import get_async_supabase_for_request
 from app.schemas.chat import ChatMessage
+import asyncio
+import calendar
 import json
 
 
 router = APIRouter(prefix="/chat", tags=["ChatBot - Message"])
 
+BULK_REPEAT_MAX = 500  # tope de copias por llamada de bulk_repeat
+
 TOOLS = [
   {
     "type": "function",
@@ -112,7 +118,7 @@ def _parse_tool_args(raw) -> Dict[str, Any]:
 # FIXED: Supabase v2 compatibility (no .select() after insert/update)
 # y validaciones amables para no romper por datos faltantes
 # ==================================================================
-def _call_tool(tool_name: str, args: Dict[str, Any], user_id: str, sb):
+async def _call_tool(tool_name: str, args: Dict[str, Any], user_id: str, sb):
     try:
         action = (tool_name or "").strip().lower()
 
@@ -147,13 +153,13 @@ def _call_tool(tool_name: str, args: Dict[str, Any], user_id: str, sb):
             data = _clean_dict(data)
 
             # insert v2
-            ins = sb.table("tasks").insert(data).execute()
+            ins = await sb.table("tasks").insert(data).execute()
             if getattr(ins, "data", None):
                 task = ins.data[0]
             else:
                 # SELECT separado (por si el backend no devolviera representación)
                 fetch = (
-                    sb.table("tasks")
+                    await sb.table("tasks")
                     .select("*")
                     .eq("user_id", user_id)
                     .eq("title", title)
@@ -188,11 +194,11 @@ def _call_tool(tool_name: str, args: Dict[str, Any], user_id: str, sb):
                 return {"ok": False, "ask": True, "message": "¿Qué campo deseas actualizar? (title/description/tag/status/start_ts/end_ts)"}
 
             # update v2
-            sb.table("tasks").update(updates).eq("id", tid).eq("user_id", user_id).execute()
+            await sb.table("tasks").update(updates).eq("id", tid).eq("user_id", user_id).execute()
 
             # SELECT separado
             fetch = (
-                sb.table("tasks")
+                await sb.table("tasks")
                 .select("*")
                 .eq("id", tid)
                 .eq("user_id", user_id)
@@ -210,15 +216,64 @@ def _call_tool(tool_name: str, args: Dict[str, Any], user_id: str, sb):
             tid = args.get("id")
             if not tid:
                 return {"ok": False, "ask": True, "message": "Necesito el id de la tarea a eliminar."}
-            sb.table("tasks").delete().eq("id", tid).eq("user_id", user_id).execute()
+            await sb.table("tasks").delete().eq("id", tid).eq("user_id", user_id).execute()
             return {"ok": True, "deleted_id": tid}
 
         # ----------------------------------------------------------
-        # BULK REPEAT (placeholder)
+        # BULK REPEAT
         # ----------------------------------------------------------
         if action == "bulk_repeat":
-            # TODO: Implementar duplicación real (según months/weekdays)
-            return {"ok": True, "created": 0}
+            tid = args.get("id")
+            if not tid:
+                return {"ok": False, "ask": True, "message": "Necesito el id de la tarea a repetir."}
+            months = int(args.get("months") or 0)
+            if months < 1:
+                return {"ok": False, "ask": True, "message": "¿Por cuántos meses repito la tarea?"}
+
+            seed_resp = (
+                await sb.table("tasks")
+                .select("*")
+                .eq("id", tid)
+                .eq("user_id", user_id)
+                .limit(1)
+                .execute()
+            )
+            if not seed_resp.data:
+                return {"ok": False, "message": "No encontré la tarea a repetir."}
+            seed = seed_resp.data[0]
+            if not seed.get("start_ts"):
+                return {"ok": False, "message": "La tarea no tiene fecha de inicio."}
+
+            # Semanal en los días pedidos (o el día de la semilla) durante `months` meses;
+            # el motor de recurrencia calcula las fechas y se insertan en un solo round trip.
+            seed_start = recurrence.parse_ts(seed["start_ts"])
+            duration = recurrence.parse_ts(seed["end_ts"]) - seed_start if seed.get("end_ts") else None
+            weekdays = tuple(sorted({int(d) for d in args.get("weekdays") or () if 0 <= int(d) <= 6}))
+            rule = recurrence.Rule("WEEKLY", byweekday=weekdays)
+            y, m = divmod(seed_start.month - 1 + months, 12)
+            until = seed_start.replace(
+                year=seed_start.year + y, month=m + 1,
+                day=min(seed_start.day, calendar.monthrange(seed_start.year + y, m + 1)[1]),
+            )
+            rows = [
+                _clean_dict({
+                    "user_id": user_id,
+                    "title": seed.get("title"),
+                    "description": seed.get("description"),
+                    "tag": seed.get("tag"),
+                    "priority": seed.get("priority"),
+                    "status": "pending",
+                    "start_ts": occ.isoformat(),
+                    "end_ts": (occ + duration).isoformat() if duration is not None else None,
+                })
+                for occ in recurrence.occurrences(seed_start, rule, seed_start, until, limit=BULK_REPEAT_MAX + 1)
+                if occ != seed_start
+            ][:BULK_REPEAT_MAX]
+            if not rows:
+                return {"ok": True, "created": 0}
+
+            ins = await sb.table("tasks").insert(rows, default_to_null=False).execute()
+            return {"ok": True, "created": len(ins.data or [])}
 
         return {"ok": False, "message": f"Acción no reconocida: {tool_name}"}
 
@@ -226,33 +281,53 @@ def _call_tool(tool_name: str, args: Dict[str, Any], user_id: str, sb):
         # Captura limpia para no romper el flujo del chat
         return {"ok": False, "message": f"[chat._call_tool] {e}"}
 
+CLARIFY_TEXT = "¿Podrías indicar título y fecha/hora (ISO) para la tarea?"
+
+
+def _reply_text(tool_name: str, result: Dict[str, Any]) -> str:
+    if result.get("ok"):
+        return "He creado tu tarea." if tool_name == "create_task" else "He actualizado tus tareas."
+    # Si el tool pide aclaración, muestra el mensaje de ask
+    return result.get("message") or "Necesito un dato adicional para continuar."
+
+
+def _count_usage(usage) -> None:
+    """Tokens que facturó OpenAI por la request del chat (incluye el schema de TOOLS)."""
+    if usage is None:
+        return
+    metrics.inc("chat.llm.requests")
+    metrics.inc("chat.llm.prompt_tokens", usage.prompt_tokens or 0)
+    metrics.inc("chat.llm.completion_tokens", usage.completion_tokens or 0)
+
 # ==================================================================
 # Endpoint principal
 # ==================================================================
 @router.post("/message")
-def chat_message(
+async def chat_message(
     payload: ChatMessage,
     user_id: str = Depends(get_user_id),
-    sb = Depends(get_supabase_for_request)
+    sb = Depends(get_async_supabase_for_request)
 ):
-    client = get_openai()
+    client = get_async_openai()
+
+    # Contexto ANTES de guardar el mensaje: sin snapshot se arranca desde
+    # chat_messages, y el mensaje nuevo no debe quedar ya en la ventana
+    ctx = await chat_context.load(sb, user_id)
 
     # Guarda mensaje de usuario (content.message)
-    sb.table("chat_messages").insert({
+    await sb.table("chat_messages").insert({
         "user_id": user_id, "role": "user", "content": {"message": payload.message}
     }).execute()
 
-    # Pide decisión al modelo
-    resp = client.chat.completions.create(
+    # Pide decisión al modelo (con resumen + turnos recientes)
+    resp = await client.chat.completions.create(
         model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": SYSTEM},
-            {"role": "user", "content": payload.message}
-        ],
+        messages=ctx.messages(SYSTEM, payload.message),
         tools=TOOLS,
         tool_choice="auto",
         temperature=0.2
     )
+    _count_usage(getattr(resp, "usage", None))
 
     msg = resp.choices[0].message
 
@@ -260,25 +335,23 @@ def chat_message(
     if getattr(msg, "tool_calls", None):
         tool = msg.tool_calls[0]
         args = _parse_tool_args(tool.function.arguments)
-        result = _call_tool(tool.function.name, args, user_id, sb)
+        result = await _call_tool(tool.function.name, args, user_id, sb)
 
         # Guarda rastro de tool
-        sb.table("chat_messages").insert({
+        await sb.table("chat_messages").insert({
             "user_id": user_id,
             "role": "tool",
             "content": {"tool": tool.function.name, "args": args, "result": result}
         }).execute()
 
         # Respuesta del assistant según resultado
-        if result.get("ok"):
-            text = "He creado tu tarea." if tool.function.name == "create_task" else "He actualizado tus tareas."
-        else:
-            # Si el tool pide aclaración, muestra el mensaje de ask
-            text = result.get("message") or "Necesito un dato adicional para continuar."
+        text = _reply_text(tool.function.name, result)
 
-        sb.table("chat_messages").insert({
+        await sb.table("chat_messages").insert({
             "user_id": user_id, "role": "assistant", "content": {"message": text}
         }).execute()
+        ctx.record(payload.message, text, tool.function.name, result)
+        chat_context.commit(sb, ctx)
 
         if not result.get("ok") and not result.get("ask"):
             # error real (no es una simple aclaración)
@@ -286,9 +359,191 @@ def chat_message(
 
         return {"reply": text, "tool_result": result}
 
-    # Sin tool calls → pregunta aclaratoria genérica
-    assistant_text = "¿Podrías indicar título y fecha/hora (ISO) para la tarea?"
-    sb.table("chat_messages").insert({
+    # Sin tool calls → la pregunta concreta del modelo (SYSTEM se la pide), o la
+    # aclaratoria genérica si no escribió nada (igual que /chat/message/stream)
+    assistant_text = (msg.content or "").strip() or CLARIFY_TEXT
+    await sb.table("chat_messages").insert({
         "user_id": user_id, "role": "assistant", "content": {"message": assistant_text}
     }).execute()
+    ctx.record(payload.message, assistant_text)
+    chat_context.commit(sb, ctx)
     return {"reply": assistant_text}
+
+
+# ==================================================================
+# Variante streaming (SSE)
+# ==================================================================
+# Mismo flujo que /chat/message, pero:
+#   - los tokens de texto del modelo salen como `event: token` en cuanto llegan
+#     (sin tool, ese texto es la respuesta; vacío => la aclaratoria genérica)
+#   - el tool (el primero, como arriba) se ejecuta apenas sus arguments forman
+#     un JSON completo, sin esperar el fin del stream
+#   - el transcript (user / tool / assistant) se escribe en background al
+#     terminar la respuesta, en el mismo orden de antes
+#   - el contexto (app.core.chat_context) se carga antes de abrir el stream y
+#     el turno se registra al emitir `done` / `error`
+#   - si el cliente se desconecta (o el stream de OpenAI falla) con el tool ya
+#     lanzado, el tool termina igual (shield) y su resultado se registra en el
+#     transcript y el contexto desde una tarea aparte: la acción nunca queda
+#     fuera del historial
+# Eventos: token {"text"}, tool {"name", "result"}, done {"reply", "tool_result"?},
+# error {"detail"} (el status ya salió como 200: los errores van en el stream).
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+def _complete_args(raw: str) -> Optional[Dict[str, Any]]:
+    """Los arguments ya forman un objeto JSON completo (un prefijo nunca lo es)."""
+    if not raw.rstrip().endswith("}"):
+        return None
+    try:
+        args = json.loads(raw)
+    except ValueError:
+        return None
+    return args if isinstance(args, dict) else None
+
+
+_detached: Set[asyncio.Task] = set()  # tools que terminan después de cortado el stream
+
+
+async def _write_transcript(sb, rows: List[Dict[str, Any]]) -> None:
+    for row in rows:
+        try:
+            await sb.table("chat_messages").insert(row).execute()
+        except Exception as e:
+            print(f"[chat.stream] transcript write failed ({row.get('role')}): {e}")
+
+
+@router.post("/message/stream")
+async def chat_message_stream(
+    payload: ChatMessage,
+    background: BackgroundTasks,
+    user_id: str = Depends(get_user_id),
+    sb = Depends(get_async_supabase_for_request)
+):
+    """
+    /chat/message en Server-Sent Events: texto del modelo token a token, el tool
+    en cuanto sus argumentos están completos y el resultado final en `done`.
+    """
+    client = get_async_openai()
+    ctx = await chat_context.load(sb, user_id)
+    transcript: List[Dict[str, Any]] = [
+        {"user_id": user_id, "role": "user", "content": {"message": payload.message}}
+    ]
+    settling: List[asyncio.Task] = []
+    written = {"done": False}
+
+    async def write_transcript() -> None:
+        if settling or written["done"]:
+            return  # ya escrito, o lo escribe settle_later cuando termine el tool
+        written["done"] = True
+        await _write_transcript(sb, transcript)
+
+    # BackgroundTasks corre después de enviar el último byte del stream; si el
+    # cliente corta antes, lo agenda el finally de events()
+    background.add_task(write_transcript)
+
+    def settle(tool_name: str, args: Optional[Dict[str, Any]], result: Dict[str, Any]) -> str:
+        text = _reply_text(tool_name, result)
+        transcript.append({
+            "user_id": user_id, "role": "tool",
+            "content": {"tool": tool_name, "args": args, "result": result}
+        })
+        transcript.append({"user_id": user_id, "role": "assistant", "content": {"message": text}})
+        ctx.record(payload.message, text, tool_name, result)
+        chat_context.commit(sb, ctx)
+        return text
+
+    async def settle_later(tool_task: asyncio.Task, tool_name: str, args: Optional[Dict[str, Any]]) -> None:
+        try:
+            result = await tool_task
+        except asyncio.CancelledError:  # _call_tool ya atrapa sus propios errores
+            result = {"ok": False, "message": "[chat._call_tool] cancelled"}
+        settle(tool_name, args, result)
+        written["done"] = True
+        await _write_transcript(sb, transcript)
+
+    def detach(coro) -> asyncio.Task:
+        task = asyncio.create_task(coro)
+        _detached.add(task)
+        task.add_done_callback(_detached.discard)
+        return task
+
+    async def events() -> AsyncIterator[str]:
+        tool_name: Optional[str] = None
+        raw_args = ""
+        args: Optional[Dict[str, Any]] = None
+        tool_task: Optional[asyncio.Task] = None
+        text_parts: List[str] = []
+        settled = finished = False
+        try:
+            try:
+                stream = await client.chat.completions.create(
+                    model="gpt-4o-mini",
+                    messages=ctx.messages(SYSTEM, payload.message),
+                    tools=TOOLS,
+                    tool_choice="auto",
+                    temperature=0.2,
+                    stream=True,
+                    stream_options={"include_usage": True},
+                )
+                async for chunk in stream:
+                    _count_usage(getattr(chunk, "usage", None))  # solo el último chunk la trae
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta
+                    if delta.content:
+                        text_parts.append(delta.content)
+                        yield _sse("token", {"text": delta.content})
+                    for tc in delta.tool_calls or []:
+                        if tc.index != 0 or tool_task is not None:
+                            continue  # solo el primer tool, como /chat/message
+                        if tc.function and tc.function.name:
+                            tool_name = tc.function.name
+                        if tc.function and tc.function.arguments:
+                            raw_args += tc.function.arguments
+                            args = _complete_args(raw_args)
+                        if tool_name and args is not None:
+                            tool_task = asyncio.create_task(_call_tool(tool_name, args, user_id, sb))
+                if tool_name and tool_task is None:
+                    args = _parse_tool_args(raw_args)
+                    tool_task = asyncio.create_task(_call_tool(tool_name, args, user_id, sb))
+            except Exception as e:
+                # un tool ya lanzado no se cancela (pudo haber escrito): lo registra el finally
+                yield _sse("error", {"detail": f"[chat.stream] {e}"})
+                finished = True
+                return
+
+            if tool_task is None:
+                # sin tool: lo que escribió el modelo, o la aclaratoria genérica (como /chat/message)
+                reply = "".join(text_parts).strip() or CLARIFY_TEXT
+                transcript.append({"user_id": user_id, "role": "assistant", "content": {"message": reply}})
+                ctx.record(payload.message, reply)
+                chat_context.commit(sb, ctx)
+                yield _sse("done", {"reply": reply})
+                finished = True
+                return
+
+            # shield: si el cliente corta aquí, el tool no se cancela a medio escribir
+            result = await asyncio.shield(tool_task)
+            text = settle(tool_name, args, result)
+            settled = True
+            yield _sse("tool", {"name": tool_name, "result": result})
+            if not result.get("ok") and not result.get("ask"):
+                # error real (no es una simple aclaración)
+                yield _sse("error", {"detail": text})
+                finished = True
+                return
+            yield _sse("done", {"reply": text, "tool_result": result})
+            finished = True
+        finally:
+            if tool_task is not None and not settled:
+                settling.append(detach(settle_later(tool_task, tool_name, args)))
+            elif not finished:
+                detach(write_transcript())  # cliente desconectado: BackgroundTasks puede no correr
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -2,13 +2,14 @@
 
 from fastapi import APIRouter, Depends, HTTPException, Body, Path
 from pydantic import BaseModel, Field
-from typing import Optional, List, Dict, Any
+from typing import Optional, List
 from datetime import datetime, timezone
 
 from app.core.auth import get_user_id  # devuelve el user_id a partir del Bearer
 from app.core.supabase_client import get_supabase_for_request
 from app.api.models.user import UserOut  # solo para type hints opcionales (no obligatorio)
-from app.integrations.whatsapp_client import send_text, send_template
+from app.core import wa_templates
+from app.integrations.whatsapp_client import send_text, send_template, send_payload
 
 router = APIRouter(prefix="/api/notify/whatsapp", tags=["Notifications - WhatsApp"])
 
@@ -48,7 +49,7 @@ class ByTaskTemplateIn(BaseModel):
     template_name: str = Field("rm_task_summary", description="Nombre exacto del template aprobado")
     lang_code: str = Field("en", description="Código de idioma del template (ej. en, es_MX)")
     header_hint: Optional[str] = Field(None, description="Texto para Header {{1}} (ej. '30 min')")
-    include_button: bool = Field(True, description="Si el template tiene botón URL dinámico {{1}}, enviar task_id")
+    include_button: bool = Field(True, description="Si el template tiene botón URL dinámico {{1}}, enviar task_id (si no, '-')")
     tz_hint: Optional[str] = Field(None, description="Etiqueta de zona horaria (ej. PDT, CST)")
 
 # =========================
@@ -142,8 +143,9 @@ def send_template_by_task(
 ):
     """
     Carga la tarea (RLS) y envía un template usando los campos mapeados.
-    Soporta 'rm_task_summary' (header/body) y 'hello_world' (sin parámetros).
-    Para nombres distintos, hace un fallback de body compacto.
+    El esquema de parámetros sale de app.core.wa_templates: 'rm_task_summary'
+    (header/body), 'hello_world' (sin parámetros), los del WA_TEMPLATES_FILE y,
+    para nombres desconocidos, un fallback de body compacto.
     """
     # 1) Cargar la tarea del usuario
     q = (
@@ -159,73 +161,24 @@ def send_template_by_task(
         raise HTTPException(status_code=404, detail="Task not found")
     t = rows[0]
 
-    # 2) Preparar strings legibles y NO vacíos
-    title = (t.get("title") or "(no title)").strip() or "(no title)"
-    description = (t.get("description") or "").strip()
-    if not description:
-        description = "-"  # evita parámetro vacío en {{7}}
-    tag = (t.get("tag") or "Other").strip() or "Other"
-    status = (t.get("status") or "pending").strip() or "pending"
-
-    from datetime import datetime
-    def _fmt(ts: Optional[str]) -> str:
-        if not ts:
-            return "-"
-        try:
-            return datetime.fromisoformat(ts.replace("Z", "+00:00")).strftime("%Y-%m-%d %H:%M")
-        except Exception:
-            return ts or "-"
-
-    start_s = _fmt(t.get("start_ts"))
-    end_s = _fmt(t.get("end_ts")) if t.get("end_ts") else start_s or "-"  # nunca vacío
-    tz_s = (payload.tz_hint or "UTC").strip() or "UTC"
-
-    header_text = (payload.header_hint or "30 min").strip() or "30 min"
-
-    # 3) Construir components según el template
-    components: List[Dict[str, Any]] = []
-
-    if payload.template_name == "rm_task_summary":
-        # Header {{1}} + Body {{1..7}} (todos como textos NO vacíos)
-        components.append({
-            "type": "header",
-            "parameters": [ {"type": "text", "text": header_text} ]
-        })
-        components.append({
-            "type": "body",
-            "parameters": [
-                {"type": "text", "text": title},        # {{1}}
-                {"type": "text", "text": start_s},      # {{2}}
-                {"type": "text", "text": end_s},        # {{3}}
-                {"type": "text", "text": tz_s},         # {{4}}
-                {"type": "text", "text": tag},          # {{5}}
-                {"type": "text", "text": status},       # {{6}}
-                {"type": "text", "text": description},  # {{7}}
-            ]
-        })
-        # Si más adelante agregas botón URL dinámico con {{1}}, podrás añadir aquí un bloque "button" con sub_type/index/parameters
-
-    elif payload.template_name == "hello_world":
-        components = []  # no requiere parámetros
+    # 2) Campos de la tarea (el renderer evita parámetros vacíos)
+    fields = wa_templates.task_fields(
+        t,
+        header_hint=payload.header_hint or "30 min",
+        tz_hint=payload.tz_hint or "UTC",
+        button_text=None if payload.include_button else wa_templates.EMPTY_PARAM,
+    )
 
-    else:
-        # Fallback genérico (4 params) igualmente con strings no vacíos
-        compact = [
-            title,
-            f"{start_s} — {end_s}".strip(),
-            f"{tag} / {status}",
-            description
-        ]
-        components.append({
-            "type": "body",
-            "parameters": [{"type": "text", "text": s if s else "-"} for s in compact]
-        })
+    # 3) Payload según el esquema del template
+    try:
+        message = wa_templates.renderer(payload.template_name, payload.lang_code).render_fields(payload.to, fields)
+    except wa_templates.TemplateError as e:
+        raise HTTPException(status_code=422, detail=str(e))
 
     # 4) Enviar
-    comps = components if components else None
-    res = send_template(payload.to, payload.template_name, payload.lang_code, comps)
+    res = send_payload(message)
     if not res.get("ok"):
         # Debug útil: descomenta para ver exactamente lo que se envía a Graph si hay error
-        # import json; print("DEBUG WA payload:", json.dumps({"to": payload.to, "template": payload.template_name, "lang": payload.lang_code, "components": comps}, ensure_ascii=False))
+        # import json; print("DEBUG WA payload:", json.dumps(message, ensure_ascii=False))
         raise HTTPException(status_code=400, detail=res)
     return {"ok": True, "data": res.get("data"), "task_id": payload.task_id}
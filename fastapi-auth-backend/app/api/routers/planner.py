@@ -1,41 +1,101 @@
 # PATCH /api/planner/{task_id}/recurrence
 
+import asyncio
 from typing import Annotated, Optional
-from fastapi import APIRouter, Path, Depends, HTTPException, Request, status
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from fastapi import APIRouter, Path, Query, Depends, HTTPException, Request, status
+from app.core import recurrence
 from app.core.auth import get_user_id
-from app.core.supabase_client import get_supabase_for_request
+from app.core.supabase_client import get_async_supabase_for_request
+from app.core.writes import write_returning
 from app.schemas.tasks import ShiftRange, RecurrenceUpsert
 
 router = APIRouter(prefix="/planner", tags=["Calendar-Planner"])
 
 @router.get("/range")
-def get_tasks_in_range(
+async def get_tasks_in_range(
     start: str,
     end: str,
+    tz: Optional[str] = Query(None, description="Zona IANA para la hora de pared de las repeticiones (default UTC)"),
+    expand: bool = Query(True, description="Incluir ocurrencias virtuales de task_recurrence"),
     user_id: str = Depends(get_user_id),
-    sb = Depends(get_supabase_for_request)
+    sb = Depends(get_async_supabase_for_request)
 ):
-    resp = (
+    """
+    Tasks reales con start_ts en [start, end] + (si expand) las ocurrencias
+    virtuales de las reglas de recurrencia, calculadas aquí sin materializar
+    filas. Las virtuales llevan is_virtual=True, recurrence_of=<id semilla> y
+    occurrence_id="<id semilla>:<fecha>"; su id es el de la semilla.
+    """
+    tasks_q = (
         sb.table("tasks")
           .select("*")
           .eq("user_id", user_id)
           .gte("start_ts", start)
           .lte("start_ts", end)
           .order("start_ts", desc=False)
-          .execute()
     )
-    return resp.data or []
+    if not expand:
+        resp = await tasks_q.execute()
+        return resp.data or []
+
+    try:
+        win_start, win_end = recurrence.parse_ts(start), recurrence.parse_ts(end)
+        zone = ZoneInfo(tz) if tz else recurrence.UTC
+    except (ValueError, ZoneInfoNotFoundError):
+        raise HTTPException(status_code=400, detail="Invalid start/end/tz")
+
+    # Semillas con regla que pueden caer en la ventana: empezaron antes de `end`
+    # (la regla se expande aunque la semilla sea de hace años).
+    seeds_q = (
+        sb.table("tasks")
+          .select("*, task_recurrence!inner(*)")
+          .eq("user_id", user_id)
+          .is_("deleted_at", "null")
+          .lte("start_ts", end)
+    )
+    tasks_resp, seeds_resp = await asyncio.gather(tasks_q.execute(), seeds_q.execute())
+    rows = tasks_resp.data or []
+
+    taken = {(r.get("title"), recurrence.parse_ts(r["start_ts"])) for r in rows if r.get("start_ts")}
+    virtual = []
+    for seed in seeds_resp.data or []:
+        rule_row = seed.pop("task_recurrence", None)
+        if isinstance(rule_row, list):
+            rule_row = rule_row[0] if rule_row else None
+        if not rule_row or not seed.get("start_ts"):
+            continue
+        seed_start = recurrence.parse_ts(seed["start_ts"])
+        duration = recurrence.parse_ts(seed["end_ts"]) - seed_start if seed.get("end_ts") else None
+        for occ in recurrence.expand(seed["id"], seed_start, recurrence.Rule.from_row(rule_row), win_start, win_end, zone):
+            # la semilla ya viene como task real; y no duplicar una ocurrencia ya materializada
+            if occ == seed_start or (seed.get("title"), occ) in taken:
+                continue
+            virtual.append({
+                **seed,
+                "start_ts": occ.isoformat(),
+                "end_ts": (occ + duration).isoformat() if duration is not None else None,
+                "is_virtual": True,
+                "recurrence_of": seed["id"],
+                "occurrence_id": f"{seed['id']}:{occ.astimezone(zone).date().isoformat()}",
+            })
+
+    if not virtual:
+        return rows
+    merged = rows + virtual
+    merged.sort(key=lambda r: recurrence.parse_ts(r["start_ts"]) if r.get("start_ts") else win_end)
+    return merged
 
 @router.post("/{task_id}/recurrence")
-def upsert_recurrence(
+async def upsert_recurrence(
     task_id: str,
     payload: RecurrenceUpsert,
     user_id: str = Depends(get_user_id),
-    sb = Depends(get_supabase_for_request)
+    sb = Depends(get_async_supabase_for_request)
 ):
     # Verificar que la tarea pertenezca al usuario (RLS friendly)
     owner_resp = (
-        sb.table("tasks")
+        await sb.table("tasks")
           .select("id")
           .eq("id", task_id)
           .eq("user_id", user_id)
@@ -46,36 +106,26 @@ def upsert_recurrence(
     if not owner_rows:
         raise HTTPException(status_code=404, detail="Task not found")
 
-    # Limpiar cualquier regla previa para esa task_id (tu esquema usa PK = task_id)
-    sb.table("task_recurrence").delete().eq("task_id", task_id).execute()
-
-    # Insertar la nueva regla (SIN .select() encadenado en v2)
+    # Upsert por PK (task_id): reemplaza la regla previa si la hay y devuelve
+    # la fila escrita (return=representation) en el mismo round trip.
+    # model_dump() manda todas las columnas, así que no queda nada de la regla vieja.
     rec = {"task_id": task_id, **payload.model_dump()}
-    sb.table("task_recurrence").insert(rec).execute()
-
-    # Leer la representación con un SELECT aparte
-    fetch = (
-        sb.table("task_recurrence")
-          .select("*")
-          .eq("task_id", task_id)
-          .limit(1)
-          .execute()
-    )
-    rows = fetch.data or []
-    if not rows:
+    row = await write_returning(sb.table("task_recurrence").upsert(rec, on_conflict="task_id"))
+    if not row:
         # Si llegamos aquí, puede ser RLS o un fallo inusual de inserción
         raise HTTPException(status_code=404, detail="Recurrence not found for this task")
 
-    return rows[0]
+    recurrence.invalidate(task_id)
+    return row
 
 @router.post("/shift")
-def shift_range(
+async def shift_range(
     payload: ShiftRange,
     user_id: str = Depends(get_user_id),
-    sb = Depends(get_supabase_for_request)
+    sb = Depends(get_async_supabase_for_request)
 ):
     resp = (
-        sb.table("tasks")
+        await sb.table("tasks")
           .select("id")
           .eq("user_id", user_id)
           .gte("start_ts", payload.start.isoformat())
@@ -87,20 +137,20 @@ def shift_range(
 
 # PATCH /api/planner/{task_id}/recurrence
 @router.patch("/{task_id}/recurrence")
-def update_recurrence(
+async def update_recurrence(
     task_id: str = Path(..., description="Task UUID"),
     payload: RecurrenceUpsert = ...,
     user_id: str = Depends(get_user_id),
-    sb = Depends(get_supabase_for_request),
+    sb = Depends(get_async_supabase_for_request),
 ):
     """
     Actualiza por completo la regla de recurrencia de una task existente.
-    Nota v2: NO encadenar .select() tras update(); hacemos SELECT aparte.
+    Nota v2: NO encadenar .select() tras update(); la fila viene en la respuesta.
     Acepta `until` como date o como string 'YYYY-MM-DD'.
     """
     # Verifica que la task sea del usuario (RLS-friendly)
     owner = (
-        sb.table("tasks")
+        await sb.table("tasks")
           .select("id")
           .eq("id", task_id)
           .eq("user_id", user_id)
@@ -110,17 +160,6 @@ def update_recurrence(
     if not owner:
         raise HTTPException(status_code=404, detail="Task not found")
 
-    # Asegura que exista la fila de recurrencia
-    exists = (
-        sb.table("task_recurrence")
-          .select("task_id")
-          .eq("task_id", task_id)
-          .limit(1)
-          .execute()
-    ).data or []
-    if not exists:
-        raise HTTPException(status_code=404, detail="Recurrence not found for this task")
-
     # Normaliza byweekday y until
     byweekday = payload.byweekday if (payload.freq == "WEEKLY") else None
 
@@ -145,36 +184,30 @@ def update_recurrence(
         "until": until_iso,
     }
 
-    # v2: update() sin .select(), luego SELECT para devolver representación
-    sb.table("task_recurrence").update(updates).eq("task_id", task_id).execute()
-
-    fetch = (
-        sb.table("task_recurrence")
-          .select("*")
-          .eq("task_id", task_id)
-          .limit(1)
-          .execute()
+    # v2: update() devuelve la fila; 0 filas = no existe la regla para esa task
+    row = await write_returning(
+        sb.table("task_recurrence").update(updates).eq("task_id", task_id)
     )
-    rows = fetch.data or []
-    if not rows:
-        raise HTTPException(status_code=404, detail="Recurrence not found after update")
-    return rows[0]
+    if not row:
+        raise HTTPException(status_code=404, detail="Recurrence not found for this task")
+    recurrence.invalidate(task_id)
+    return row
 
 
 
 # DELETE /api/planner/{task_id}/recurrence
 @router.delete("/{task_id}/recurrence", status_code=status.HTTP_204_NO_CONTENT)
-def delete_recurrence(
+async def delete_recurrence(
     task_id: str = Path(..., description="Task UUID"),
     user_id: str = Depends(get_user_id),
-    sb = Depends(get_supabase_for_request),
+    sb = Depends(get_async_supabase_for_request),
 ):
     """
     Elimina la regla de recurrencia (conserva la task semilla).
     """
     # Verifica ownership de la task
     owner = (
-        sb.table("tasks")
+        await sb.table("tasks")
           .select("id")
           .eq("id", task_id)
           .eq("user_id", user_id)
@@ -185,5 +218,6 @@ def delete_recurrence(
         raise HTTPException(status_code=404, detail="Task not found")
 
     # Borra la fila de recurrencia (si no existe, 204 igualmente)
-    sb.table("task_recurrence").delete().eq("task_id", task_id).execute()
+    await sb.table("task_recurrence").delete().eq("task_id", task_id).execute()
+    recurrence.invalidate(task_id)
     return
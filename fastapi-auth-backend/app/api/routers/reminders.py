@@ -1,8 +1,9 @@
 # app/api/routers/reminders.py
-from typing import List, Annotated
+from typing import List, Annotated, Optional
 from uuid import UUID
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from app.core.db import get_supabase
+from app.core.pagination import NEXT_CURSOR_HEADER, apply_keyset, decode_cursor, keyset_cursor, set_next_cursor
 from app.schemas.reminders import ReminderCreate, ReminderOut
 
 # auth
@@ -26,20 +27,28 @@ def _exec_or_400(res, fallback_msg="Operation failed"):
     return data
 
 @router.get("", response_model=List[ReminderOut])
-def list_reminders(
+async def list_reminders(
+    response: Response,
     supa = Depends(get_supabase),
     active: bool = Query(True),
-    page: int = 1,
-    limit: int = 50
+    page: int = Query(1, ge=1, deprecated=True, description="Legacy (OFFSET); usa `cursor`"),
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = Query(None, description=f"Cursor opaco de la página siguiente (header {NEXT_CURSOR_HEADER})"),
 ):
-    start = (page - 1) * limit
-    end = start + limit - 1
-    q = supa.table("reminders").select("*").eq("active", active).order("next_fire_at", desc=False).range(start, end)
-    res = q.execute()
-    return getattr(res, "data", []) or []
+    q = supa.table("reminders").select("*").eq("active", active).order("next_fire_at", desc=False).order("id", desc=False)
+    after = decode_cursor(cursor, "reminders", "next_fire_at", "id")
+    if after or page == 1:
+        q = apply_keyset(q, "next_fire_at", after).limit(limit)
+    else:
+        start = (page - 1) * limit
+        q = q.range(start, start + limit - 1)
+    res = await q.execute()
+    data = getattr(res, "data", []) or []
+    set_next_cursor(response, keyset_cursor("reminders", data, limit, "next_fire_at"))
+    return data
 
 @router.post("", response_model=ReminderOut, status_code=201)
-def create_reminder(
+async def create_reminder(
     body: ReminderCreate,
     supa = Depends(get_supabase),
     current_user: Annotated[UserOut, Depends(get_current_user)] = None
@@ -53,13 +62,13 @@ def create_reminder(
         "next_fire_at": body.remind_at.isoformat(),
         "active": True,
     }
-    ins = supa.table("reminders").insert(payload).execute()
+    ins = await supa.table("reminders").insert(payload).execute()
     data = _exec_or_400(ins, "Cannot create reminder")
     if isinstance(data, list) and len(data) > 0:
         return data[0]
     # fallback select
     sel = (
-        supa.table("reminders")
+        await supa.table("reminders")
         .select("*")
         .eq("user_id", current_user.id)
         .eq("task_id", str(body.task_id))
@@ -70,7 +79,7 @@ def create_reminder(
     return _exec_or_400(sel, "Reminder created but not found")[0]
 
 @router.post("/{reminder_id}/cancel", status_code=204)
-def cancel_reminder(reminder_id: UUID, supa = Depends(get_supabase)):
-    res = supa.table("reminders").update({"active": False}).eq("id", str(reminder_id)).execute()
+async def cancel_reminder(reminder_id: UUID, supa = Depends(get_supabase)):
+    res = await supa.table("reminders").update({"active": False}).eq("id", str(reminder_id)).execute()
     _exec_or_400(res, "Cannot cancel reminder")
     return
@@ -4,8 +4,10 @@ from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 from typing import Optional
 
-from app.core.supabase_client import get_supabase_for_request
+from app.core import profile_cache
+from app.core.supabase_client import get_async_supabase_for_request
 from app.core.auth import get_user_id
+from app.core.writes import write_returning
 
 router = APIRouter(prefix="/api/settings", tags=["Configuration"])
 
@@ -14,13 +16,13 @@ class NotificationSettingsIn(BaseModel):
     notify_enabled: bool = True
 
 @router.get("/notifications")
-def get_notification_settings(
+async def get_notification_settings(
     user_id: str = Depends(get_user_id),
-    sb = Depends(get_supabase_for_request),
+    sb = Depends(get_async_supabase_for_request),
 ):
     try:
         resp = (
-            sb.table("profiles")
+            await sb.table("profiles")
             .select("phone, notify_enabled")
             .eq("id", user_id)
             .limit(1)
@@ -35,10 +37,10 @@ def get_notification_settings(
         raise HTTPException(status_code=500, detail=f"[settings.get] {e}")
 
 @router.put("/notifications")
-def set_notification_settings(
+async def set_notification_settings(
     payload: NotificationSettingsIn,
     user_id: str = Depends(get_user_id),
-    sb = Depends(get_supabase_for_request),
+    sb = Depends(get_async_supabase_for_request),
 ):
     try:
         # upsert para crear la fila si no existe (RLS: id = auth.uid())
@@ -47,20 +49,13 @@ def set_notification_settings(
             "phone": payload.phone,
             "notify_enabled": payload.notify_enabled,
         }
-        sb.table("profiles").upsert(row, on_conflict="id").execute()
-
-        # lee en una segunda consulta (no encadenar .select() tras update/upsert)
-        sel = (
-            sb.table("profiles")
-            .select("phone, notify_enabled")
-            .eq("id", user_id)
-            .limit(1)
-            .execute()
-        )
-        rows = sel.data or []
-        if not rows:
+        # El upsert devuelve la fila completa: recortamos a los campos públicos
+        saved = await write_returning(sb.table("profiles").upsert(row, on_conflict="id"))
+        # los workers de este proceso dejan de usar el teléfono/flag anterior
+        profile_cache.invalidate(user_id)
+        if not saved:
             # extremadamente raro si la RLS/trigger fallara
             return {"phone": payload.phone, "notify_enabled": payload.notify_enabled}
-        return rows[0]
+        return {"phone": saved.get("phone"), "notify_enabled": saved.get("notify_enabled")}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"[settings.put] {e}")
@@ -3,6 +3,7 @@ from typing import List, Annotated
 from uuid import UUID
 from fastapi import APIRouter, Depends, HTTPException
 from app.core.db import get_supabase
+from app.core.writes import write_returning
 from app.schemas.subtasks import SubtaskCreate, SubtaskUpdate, SubtaskOut
 
 # auth (para obtener user_id)
@@ -26,12 +27,12 @@ def _exec_or_400(res, fallback_msg="Operation failed"):
     return data
 
 @router.get("/by-task/{task_id}", response_model=List[SubtaskOut])
-def list_by_task(task_id: UUID, supa = Depends(get_supabase)):
-    res = supa.table("subtasks").select("*").eq("task_id", str(task_id)).order("position", desc=False).execute()
+async def list_by_task(task_id: UUID, supa = Depends(get_supabase)):
+    res = await supa.table("subtasks").select("*").eq("task_id", str(task_id)).order("position", desc=False).execute()
     return getattr(res, "data", []) or []
 
 @router.post("/{task_id}", response_model=SubtaskOut, status_code=201)
-def create_subtask(
+async def create_subtask(
     task_id: UUID,
     body: SubtaskCreate,
     supa = Depends(get_supabase),
@@ -43,14 +44,14 @@ def create_subtask(
         "task_id": str(task_id),
         "title": body.title,
     }
-    ins = supa.table("subtasks").insert(payload).execute()
+    ins = await supa.table("subtasks").insert(payload).execute()
     data = _exec_or_400(ins, "Cannot create subtask")
     # Algunos setups devuelven lista; otros, nada. Si no hay fila, leer por última creada del usuario y task.
     if isinstance(data, list) and len(data) > 0:
         return data[0]
     # fallback de lectura
     sel = (
-        supa.table("subtasks")
+        await supa.table("subtasks")
         .select("*")
         .eq("user_id", current_user.id)
         .eq("task_id", str(task_id))
@@ -61,7 +62,7 @@ def create_subtask(
     return _exec_or_400(sel, "Subtask created but not found")[0]
 
 @router.patch("/{subtask_id}", response_model=SubtaskOut)
-def update_subtask(
+async def update_subtask(
     subtask_id: UUID,
     body: SubtaskUpdate,
     supa = Depends(get_supabase),
@@ -70,23 +71,19 @@ def update_subtask(
     payload = {k: v for k, v in body.model_dump(exclude_none=True).items()}
     if not payload:
         raise HTTPException(400, "No fields to update")
-    _ = supa.table("subtasks").update(payload).eq("id", str(subtask_id)).execute()
-    # leer aparte (sin encadenar .select)
-    sel = (
+    # update devuelve la fila (return=representation): sin SELECT aparte
+    row = await write_returning(
         supa.table("subtasks")
-        .select("*")
+        .update(payload)
         .eq("id", str(subtask_id))
         .eq("user_id", current_user.id)
-        .limit(1)
-        .execute()
     )
-    data = getattr(sel, "data", None)
-    if not data:
+    if not row:
         raise HTTPException(404, "Subtask not found")
-    return data[0]
+    return row
 
 @router.delete("/{subtask_id}", status_code=204)
-def delete_subtask(subtask_id: UUID, supa = Depends(get_supabase)):
-    res = supa.table("subtasks").delete().eq("id", str(subtask_id)).execute()
+async def delete_subtask(subtask_id: UUID, supa = Depends(get_supabase)):
+    res = await supa.table("subtasks").delete().eq("id", str(subtask_id)).execute()
     _exec_or_400(res, "Cannot delete subtask")
     return
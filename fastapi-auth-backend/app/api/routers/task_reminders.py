@@ -4,12 +4,14 @@ from typing import Annotated, Optional, List
 from datetime import datetime, timedelta, timezone
 from zoneinfo import ZoneInfo  # 👈 NUEVO: para convertir hora LOCAL -> UTC
 
-from fastapi import APIRouter, Depends, HTTPException, Request, status, Path, Query
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status, Path, Query
 from pydantic import BaseModel, Field, ConfigDict
 
 from app.api.models.user import UserOut
 from app.core.auth import get_current_user
-from app.core.supabase_client import get_supabase_for_request
+from app.core.supabase_client import get_async_supabase_for_request
+from app.core.writes import write_returning
+from app.core.pagination import NEXT_CURSOR_HEADER, apply_keyset, decode_cursor, keyset_cursor, set_next_cursor
 
 router = APIRouter(prefix="/api/reminders", tags=["Reminders"])
 
@@ -74,16 +76,16 @@ class ReminderPatch(BaseModel):
 # 1) Crear reminder para una tarea (notificación WA)
 # ===================================================
 @router.post("/by-task", response_model=ReminderOut, status_code=status.HTTP_201_CREATED)
-def create_reminder_by_task(
+async def create_reminder_by_task(
     request: Request,
     body: ReminderCreateByTask,
     current_user: Annotated[UserOut, Depends(get_current_user)],
 ):
-    sb = get_supabase_for_request(request)
+    sb = get_async_supabase_for_request(request)
 
     # 1) Traer la tarea (del mismo usuario) para calcular la hora
     t = (
-        sb.table("tasks")
+        await sb.table("tasks")
         .select("id,title,description,tag,status,start_ts,end_ts")
         .eq("id", body.task_id)
         .eq("user_id", current_user.id)
@@ -147,7 +149,7 @@ def create_reminder_by_task(
         },
     }
 
-    ins = (
+    created = await write_returning(
         sb.table("notifications")
         .insert({
             "user_id": current_user.id,
@@ -157,47 +159,48 @@ def create_reminder_by_task(
             "status": "scheduled",
             "payload": reminder_payload,
         })
-        .execute()
     )
-    if not ins.data:
+    if not created:
         raise HTTPException(status_code=500, detail="Insert failed")
-    new_id = ins.data[0]["id"]
-
-    out = sb.table("notifications").select("*").eq("id", new_id).limit(1).execute()
-    if not out.data:
-        raise HTTPException(status_code=500, detail="Could not reload reminder")
-    return out.data[0]
+    return created
 
 
 # ===========================
 # 2) Listar reminders
 # ===========================
 @router.get("", response_model=List[ReminderOut])
-def list_reminders(
+async def list_reminders(
     request: Request,
+    response: Response,
     current_user: Annotated[UserOut, Depends(get_current_user)],
     only_active: bool = Query(True),
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = Query(None, description=f"Cursor opaco de la página siguiente (header {NEXT_CURSOR_HEADER})"),
 ):
-    sb = get_supabase_for_request(request)
+    sb = get_async_supabase_for_request(request)
     q = sb.table("notifications").select("*").eq("user_id", current_user.id)
     if only_active:
         q = q.eq("status", "scheduled")
-    q = q.order("scheduled_for", desc=False)
-    res = q.execute()
-    return res.data or []
+    # keyset sobre (scheduled_for, id), con tope por página
+    after = decode_cursor(cursor, "notifications", "scheduled_for", "id")
+    q = apply_keyset(q.order("scheduled_for", desc=False).order("id", desc=False), "scheduled_for", after)
+    res = await q.limit(limit).execute()
+    data = res.data or []
+    set_next_cursor(response, keyset_cursor("notifications", data, limit, "scheduled_for"))
+    return data
 
 
 # ===========================
 # 3) Actualizar un reminder
 # ===========================
 @router.patch("/{reminder_id}", response_model=ReminderOut)
-def update_reminder(
+async def update_reminder(
     request: Request,
     reminder_id: str = Path(...),
     body: ReminderPatch = None,
     current_user: Annotated[UserOut, Depends(get_current_user)] = None,
 ):
-    sb = get_supabase_for_request(request)
+    sb = get_async_supabase_for_request(request)
     updates = {}
     if body is not None:
         if body.scheduled_for is not None:
@@ -212,7 +215,7 @@ def update_reminder(
 
     if not updates:
         r = (
-            sb.table("notifications")
+            await sb.table("notifications")
             .select("*")
             .eq("id", reminder_id)
             .eq("user_id", current_user.id)
@@ -223,40 +226,28 @@ def update_reminder(
             raise HTTPException(status_code=404, detail="Reminder not found")
         return r.data[0]
 
-    upd = (
+    updated = await write_returning(
         sb.table("notifications")
         .update(updates)
         .eq("id", reminder_id)
         .eq("user_id", current_user.id)
-        .execute()
     )
-    if not getattr(upd, "data", None):
+    if not updated:
         raise HTTPException(status_code=404, detail="Reminder not found or not updated")
-
-    r = (
-        sb.table("notifications")
-        .select("*")
-        .eq("id", reminder_id)
-        .eq("user_id", current_user.id)
-        .limit(1)
-        .execute()
-    )
-    if not r.data:
-        raise HTTPException(status_code=404, detail="Reminder not found")
-    return r.data[0]
+    return updated
 
 # ===========================
 # 4) Eliminar un reminder
 # ===========================
 @router.delete("/{reminder_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_reminder(
+async def delete_reminder(
     request: Request,
     reminder_id: str = Path(...),
     current_user: Annotated[UserOut, Depends(get_current_user)] = None,
 ):
-    sb = get_supabase_for_request(request)
+    sb = get_async_supabase_for_request(request)
     _ = (
-        sb.table("notifications")
+        await sb.table("notifications")
         .delete()
         .eq("id", reminder_id)
         .eq("user_id", current_user.id)
@@ -1,14 +1,25 @@
 # app/api/routes/tasks.py
-from typing import Annotated, Optional, List
+import asyncio
+import csv
+import io
+import json
+import os
+from typing import Annotated, Optional, List, Literal
 from datetime import datetime
+from uuid import UUID
 from zoneinfo import ZoneInfo  # 👈 añadido para conversión local->UTC
 
-from fastapi import APIRouter, Depends, HTTPException, Request, status, Path, Query
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status, Path, Query
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field, model_validator, ConfigDict
 
 from app.api.models.user import UserOut
 from app.core.auth import get_current_user
-from app.core.supabase_client import get_supabase_for_request
+from app.core.supabase_client import get_async_supabase_for_request
+from app.core.writes import write_returning, tasks_api_row
+from app.core.pagination import (
+    NEXT_CURSOR_HEADER, apply_keyset, cursor_kind, decode_cursor, encode_cursor, keyset_cursor, set_next_cursor,
+)
 
 router = APIRouter(prefix="", tags=["Tasks [To-Do]"])
 
@@ -79,38 +90,56 @@ class TaskOut(BaseModel):
 # List Tasks
 # ===========
 @router.get("/tasks", response_model=List[TaskOut])
-def list_tasks(
+async def list_tasks(
     request: Request,
+    response: Response,
     current_user: Annotated[UserOut, Depends(get_current_user)],
     limit: int = Query(50, ge=1, le=200),
-    page: int = Query(1, ge=1),
+    page: int = Query(1, ge=1, deprecated=True, description="Legacy (OFFSET); usa `cursor`"),
     q: Optional[str] = Query(None, description="Búsqueda por texto (fallback ILIKE si no usas RPC)"),
     status_filter: Optional[TaskStatus] = Query(None),
     tag_filter: Optional[TaskTag] = Query(None),
     priority: Optional[TaskPriority] = Query(None),
+    cursor: Optional[str] = Query(
+        None,
+        description=f"Cursor opaco de la página siguiente (header {NEXT_CURSOR_HEADER}); reemplaza a `page`",
+    ),
 ):
     try:
-        sb = get_supabase_for_request(request)
+        sb = get_async_supabase_for_request(request)
 
-        # Si activas el RPC de FTS:
-        if q:
+        # Búsqueda FTS con filtros y keyset en el server (sql/search_tasks_rpc.sql).
+        # Un cursor "tasks" junto con q viene del fallback ILIKE: seguir por ahí.
+        if q and cursor_kind(cursor) != "tasks":
+            after = decode_cursor(cursor, "search", "rank", "start_ts", "id") or {}
             try:
-                res = sb.rpc(
-                    "search_tasks",
-                    {"q": q, "p_limit": limit, "p_offset": (page - 1) * limit},
+                res = await sb.rpc(
+                    "search_tasks_v2",
+                    {
+                        "q": q,
+                        "p_status": status_filter,
+                        "p_tag": tag_filter,
+                        "p_priority": priority,
+                        "p_limit": limit,
+                        "p_after_rank": after.get("rank"),
+                        "p_after_start": after.get("start_ts"),
+                        "p_after_id": after.get("id"),
+                    },
                 ).execute()
+            except Exception as e:
+                # cae a fallback (ILIKE + page) solo si no existe el RPC; cualquier
+                # otro error (params, timeout, RLS) sube al handler de abajo
+                if getattr(e, "code", None) != "PGRST202":
+                    raise
+                res = None
+            if res is not None:
                 data = res.data or []
-                # Filtros adicionales (opcional, o muévelos al RPC si quieres)
-                if status_filter:
-                    data = [d for d in data if d.get("status") == status_filter]
-                if tag_filter:
-                    data = [d for d in data if d.get("tag") == tag_filter]
-                if priority:
-                    data = [d for d in data if d.get("priority") == priority]
+                if len(data) == limit:
+                    last = data[-1]
+                    set_next_cursor(response, encode_cursor(
+                        "search", rank=last["rank"], start_ts=last["start_ts"], id=last["id"],
+                    ))
                 return data
-            except Exception:
-                # cae a fallback si no existe el RPC
-                pass
 
         query = sb.table("tasks_api").select("*").eq("user_id", current_user.id)
 
@@ -126,109 +155,109 @@ def list_tasks(
                 f"title.ilike.%{q}%,description.ilike.%{q}%"
             )
 
-        # orden y paginado
-        query = (
-            query.order("start_ts", desc=False)
-            .range((page - 1) * limit, (page - 1) * limit + (limit - 1))
-        )
-        res = query.execute()
-        return res.data or []
+        # orden estable (start_ts, id) y paginado por keyset: sin OFFSET, el
+        # costo no crece con la profundidad. `page` queda solo por compat.
+        query = query.order("start_ts", desc=False).order("id", desc=False)
+        after = decode_cursor(cursor, "tasks", "start_ts", "id")
+        if after or page == 1:
+            query = apply_keyset(query, "start_ts", after).limit(limit)
+        else:
+            query = query.range((page - 1) * limit, (page - 1) * limit + (limit - 1))
+        res = await query.execute()
+        data = res.data or []
+        set_next_cursor(response, keyset_cursor("tasks", data, limit, "start_ts"))
+        return data
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"[tasks.list] {e}")
 
 
+def _create_row(payload: TaskCreate, user_id: str) -> dict:
+    """Fila para insertar en `tasks` (local->UTC + validación). 400 si no cuadra."""
+    # Conversión local -> UTC si llega start_ts_local/end_ts_local + tz
+    start_ts_dt = payload.start_ts
+    end_ts_dt = payload.end_ts
+    if (payload.start_ts_local or payload.end_ts_local) and payload.tz:
+        try:
+            tz = ZoneInfo(payload.tz)
+        except Exception:
+            raise HTTPException(status_code=400, detail="Invalid tz. Use an IANA TZ like 'America/Tijuana'.")
+        if payload.start_ts_local:
+            try:
+                local_dt = datetime.fromisoformat(payload.start_ts_local)
+            except Exception:
+                raise HTTPException(status_code=400, detail="start_ts_local must be ISO8601 like 'YYYY-MM-DDTHH:MM:SS'")
+            if local_dt.tzinfo is None:
+                local_dt = local_dt.replace(tzinfo=tz)
+            else:
+                # Coerce a la TZ indicada por el cliente
+                local_dt = local_dt.astimezone(tz)
+            start_ts_dt = local_dt.astimezone(ZoneInfo("UTC"))
+        if payload.end_ts_local:
+            try:
+                local_dt = datetime.fromisoformat(payload.end_ts_local)
+            except Exception:
+                raise HTTPException(status_code=400, detail="end_ts_local must be ISO8601 like 'YYYY-MM-DDTHH:MM:SS'")
+            if local_dt.tzinfo is None:
+                local_dt = local_dt.replace(tzinfo=tz)
+            else:
+                local_dt = local_dt.astimezone(tz)
+            end_ts_dt = local_dt.astimezone(ZoneInfo("UTC"))
+
+    if not start_ts_dt:
+        raise HTTPException(status_code=400, detail="start_ts (or start_ts_local + tz) is required")
+    # Validación simple si ambos están presentes
+    if start_ts_dt and end_ts_dt and end_ts_dt < start_ts_dt:
+        raise HTTPException(status_code=400, detail="end_ts must be >= start_ts")
+
+    row = {
+        "user_id": user_id,  # mantienes tu asignación explícita (además de RLS)
+        "title": payload.title,
+        "description": payload.description,
+        "tag": payload.tag,
+        "start_ts": start_ts_dt.isoformat(),
+        "end_ts": (end_ts_dt.isoformat() if end_ts_dt else None),
+        "status": payload.status,
+        "priority": payload.priority,  # NUEVO
+    }
+    return {k: v for k, v in row.items() if v is not None}
+
+
 # ===========
 # Create Task
 # ===========
 @router.post("/tasks", response_model=TaskOut, status_code=status.HTTP_201_CREATED)
-def create_task(
+async def create_task(
     request: Request,
     payload: TaskCreate,
     current_user: Annotated[UserOut, Depends(get_current_user)],
 ):
     try:
-        sb = get_supabase_for_request(request)
-
-        # Conversión local -> UTC si llega start_ts_local/end_ts_local + tz
-        start_ts_dt = payload.start_ts
-        end_ts_dt = payload.end_ts
-        if (payload.start_ts_local or payload.end_ts_local) and payload.tz:
-            try:
-                tz = ZoneInfo(payload.tz)
-            except Exception:
-                raise HTTPException(status_code=400, detail="Invalid tz. Use an IANA TZ like 'America/Tijuana'.")
-            if payload.start_ts_local:
-                try:
-                    local_dt = datetime.fromisoformat(payload.start_ts_local)
-                except Exception:
-                    raise HTTPException(status_code=400, detail="start_ts_local must be ISO8601 like 'YYYY-MM-DDTHH:MM:SS'")
-                if local_dt.tzinfo is None:
-                    local_dt = local_dt.replace(tzinfo=tz)
-                else:
-                    # Coerce a la TZ indicada por el cliente
-                    local_dt = local_dt.astimezone(tz)
-                start_ts_dt = local_dt.astimezone(ZoneInfo("UTC"))
-            if payload.end_ts_local:
-                try:
-                    local_dt = datetime.fromisoformat(payload.end_ts_local)
-                except Exception:
-                    raise HTTPException(status_code=400, detail="end_ts_local must be ISO8601 like 'YYYY-MM-DDTHH:MM:SS'")
-                if local_dt.tzinfo is None:
-                    local_dt = local_dt.replace(tzinfo=tz)
-                else:
-                    local_dt = local_dt.astimezone(tz)
-                end_ts_dt = local_dt.astimezone(ZoneInfo("UTC"))
-
-        # Validación simple si ambos están presentes
-        if start_ts_dt and end_ts_dt and end_ts_dt < start_ts_dt:
-            raise HTTPException(status_code=400, detail="end_ts must be >= start_ts")
-
-        row = {
-            "user_id": current_user.id,  # mantienes tu asignación explícita (además de RLS)
-            "title": payload.title,
-            "description": payload.description,
-            "tag": payload.tag,
-            "start_ts": (start_ts_dt or payload.start_ts).isoformat(),
-            "end_ts": (end_ts_dt.isoformat() if end_ts_dt else None),
-            "status": payload.status,
-            "priority": payload.priority,  # NUEVO
-        }
-        row = {k: v for k, v in row.items() if v is not None}
-
-        # Insert en tabla base (no encadenar .select() en v2)
-        resp = sb.table("tasks").insert(row).execute()
+        sb = get_async_supabase_for_request(request)
 
-        # Normalmente v2 devuelve la fila insertada
-        if getattr(resp, "data", None):
-            inserted_id = resp.data[0]["id"]
-        else:
-            # Fallback (raro): buscar por (user_id, title) más reciente
-            fetch = (
-                sb.table("tasks")
-                .select("id")
-                .eq("user_id", current_user.id)
-                .eq("title", payload.title)
-                .order("created_at", desc=True)
-                .limit(1)
-                .execute()
-            )
-            if not fetch.data:
-                raise HTTPException(status_code=500, detail="Insert did not return data")
-            inserted_id = fetch.data[0]["id"]
+        row = _create_row(payload, current_user.id)
 
-        # Releer desde la vista (para due_at)
-        out = sb.table("tasks_api").select("*").eq("id", inserted_id).limit(1).execute()
-        if out.data:
-            return out.data[0]
+        # Insert en tabla base: PostgREST devuelve la fila (return=representation),
+        # así que la proyectamos a la forma de tasks_api sin releer.
+        created = await write_returning(sb.table("tasks").insert(row))
+        if created:
+            return tasks_api_row(created)
 
-        # Si falla la vista por alguna razón, devolvemos la fila base
-        base = sb.table("tasks").select("*").eq("id", inserted_id).limit(1).execute()
-        if base.data:
-            return base.data[0]
+        # Fallback (raro, p.ej. RLS sin SELECT): buscar por (user_id, title) más reciente
+        fetch = (
+            await sb.table("tasks_api")
+            .select("*")
+            .eq("user_id", current_user.id)
+            .eq("title", payload.title)
+            .order("created_at", desc=True)
+            .limit(1)
+            .execute()
+        )
+        if fetch.data:
+            return fetch.data[0]
 
-        raise HTTPException(status_code=500, detail="Could not fetch created task")
+        raise HTTPException(status_code=500, detail="Insert did not return data")
     except HTTPException:
         raise
     except Exception as e:
@@ -270,104 +299,93 @@ class TaskUpdate(BaseModel):
     })
 
 
+def _update_fields(payload: TaskUpdate) -> dict:
+    """SET del PATCH: solo campos presentes (local->UTC + validación). 400 si no cuadra."""
+    # Conversión local -> UTC si llega *_local + tz
+    if (payload.start_ts_local or payload.end_ts_local) and payload.tz:
+        try:
+            tz = ZoneInfo(payload.tz)
+        except Exception:
+            raise HTTPException(status_code=400, detail="Invalid tz. Use an IANA TZ like 'America/Tijuana'.")
+        if payload.start_ts_local:
+            try:
+                local_dt = datetime.fromisoformat(payload.start_ts_local)
+            except Exception:
+                raise HTTPException(status_code=400, detail="start_ts_local must be ISO8601 like 'YYYY-MM-DDTHH:MM:SS'")
+            if local_dt.tzinfo is None:
+                local_dt = local_dt.replace(tzinfo=tz)
+            else:
+                local_dt = local_dt.astimezone(tz)
+            payload.start_ts = local_dt.astimezone(ZoneInfo("UTC"))
+        if payload.end_ts_local:
+            try:
+                local_dt = datetime.fromisoformat(payload.end_ts_local)
+            except Exception:
+                raise HTTPException(status_code=400, detail="end_ts_local must be ISO8601 like 'YYYY-MM-DDTHH:MM:SS'")
+            if local_dt.tzinfo is None:
+                local_dt = local_dt.replace(tzinfo=tz)
+            else:
+                local_dt = local_dt.astimezone(tz)
+            payload.end_ts = local_dt.astimezone(ZoneInfo("UTC"))
+    # Validación sencilla
+    if payload.start_ts and payload.end_ts and payload.end_ts < payload.start_ts:
+        raise HTTPException(status_code=400, detail="end_ts must be >= start_ts")
+
+    # Construir SET solo con campos presentes
+    updates = {}
+    if payload.title is not None:
+        updates["title"] = payload.title
+    if payload.description is not None:
+        updates["description"] = payload.description
+    if payload.tag is not None:
+        updates["tag"] = payload.tag
+    if payload.start_ts is not None:
+        updates["start_ts"] = payload.start_ts.isoformat()
+    if payload.end_ts is not None:
+        updates["end_ts"] = payload.end_ts.isoformat()
+    if payload.status is not None:
+        updates["status"] = payload.status
+    if payload.priority is not None:
+        updates["priority"] = payload.priority
+    if payload.position is not None:
+        updates["position"] = payload.position
+    return updates
+
+
 # ===========
 # Update Task
 # ===========
 @router.patch("/tasks/{task_id}", response_model=TaskOut)
-def update_task(
+async def update_task(
     request: Request,
     task_id: Annotated[str, Path(..., description="Task UUID")],
     payload: TaskUpdate,
     current_user: Annotated[UserOut, Depends(get_current_user)],
 ):
     try:
-        sb = get_supabase_for_request(request)
+        sb = get_async_supabase_for_request(request)
 
-        # Conversión local -> UTC si llega *_local + tz
-        if (payload.start_ts_local or payload.end_ts_local) and payload.tz:
-            try:
-                tz = ZoneInfo(payload.tz)
-            except Exception:
-                raise HTTPException(status_code=400, detail="Invalid tz. Use an IANA TZ like 'America/Tijuana'.")
-            if payload.start_ts_local:
-                try:
-                    local_dt = datetime.fromisoformat(payload.start_ts_local)
-                except Exception:
-                    raise HTTPException(status_code=400, detail="start_ts_local must be ISO8601 like 'YYYY-MM-DDTHH:MM:SS'")
-                if local_dt.tzinfo is None:
-                    local_dt = local_dt.replace(tzinfo=tz)
-                else:
-                    local_dt = local_dt.astimezone(tz)
-                payload.start_ts = local_dt.astimezone(ZoneInfo("UTC"))
-            if payload.end_ts_local:
-                try:
-                    local_dt = datetime.fromisoformat(payload.end_ts_local)
-                except Exception:
-                    raise HTTPException(status_code=400, detail="end_ts_local must be ISO8601 like 'YYYY-MM-DDTHH:MM:SS'")
-                if local_dt.tzinfo is None:
-                    local_dt = local_dt.replace(tzinfo=tz)
-                else:
-                    local_dt = local_dt.astimezone(tz)
-                payload.end_ts = local_dt.astimezone(ZoneInfo("UTC"))
-        # Validación sencilla
-        if payload.start_ts and payload.end_ts and payload.end_ts < payload.start_ts:
-            raise HTTPException(status_code=400, detail="end_ts must be >= start_ts")
-
-        # Construir SET solo con campos presentes
-        updates = {}
-        if payload.title is not None:
-            updates["title"] = payload.title
-        if payload.description is not None:
-            updates["description"] = payload.description
-        if payload.tag is not None:
-            updates["tag"] = payload.tag
-        if payload.start_ts is not None:
-            updates["start_ts"] = payload.start_ts.isoformat()
-        if payload.end_ts is not None:
-            updates["end_ts"] = payload.end_ts.isoformat()
-        if payload.status is not None:
-            updates["status"] = payload.status
-        if payload.priority is not None:
-            updates["priority"] = payload.priority
-        if payload.position is not None:
-            updates["position"] = payload.position
+        updates = _update_fields(payload)
 
         if not updates:
             # nada que actualizar
             current = (
-                sb.table("tasks_api").select("*").eq("id", task_id).eq("user_id", current_user.id).limit(1).execute()
+                await sb.table("tasks_api").select("*").eq("id", task_id).eq("user_id", current_user.id).limit(1).execute()
             )
             if not current.data:
                 raise HTTPException(status_code=404, detail="Task not found")
             return current.data[0]
 
-        # Aplicar update
-        upd = (
+        # Aplicar update: la respuesta ya trae la fila actualizada (un solo round trip)
+        updated = await write_returning(
             sb.table("tasks")
             .update(updates)
             .eq("id", task_id)
             .eq("user_id", current_user.id)
-            .execute()
         )
-        if getattr(upd, "data", None):
-            # re-leer desde la vista
-            fetch = sb.table("tasks_api").select("*").eq("id", task_id).limit(1).execute()
-            if fetch.data:
-                return fetch.data[0]
-
-        # Fallback: desde la tabla
-        base = (
-            sb.table("tasks")
-            .select("*")
-            .eq("id", task_id)
-            .eq("user_id", current_user.id)
-            .limit(1)
-            .execute()
-        )
-        if base.data:
-            return base.data[0]
-
-        raise HTTPException(status_code=404, detail="Task not found after update")
+        if not updated:
+            raise HTTPException(status_code=404, detail="Task not found")
+        return tasks_api_row(updated)
     except HTTPException:
         raise
     except Exception as e:
@@ -378,15 +396,15 @@ def update_task(
 # Delete Task
 # ===========
 @router.delete("/tasks/{task_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_task(
+async def delete_task(
     request: Request,
     task_id: Annotated[str, Path(..., description="Task UUID")],
     current_user: Annotated[UserOut, Depends(get_current_user)],
 ):
     try:
-        sb = get_supabase_for_request(request)
+        sb = get_async_supabase_for_request(request)
         resp = (
-            sb.table("tasks")
+            await sb.table("tasks")
             .delete()
             .eq("id", task_id)
             .eq("user_id", current_user.id)
@@ -398,3 +416,288 @@ def delete_task(
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"[tasks.delete] {e}")
+
+
+# ===========
+# Batch (create/update/delete)
+# ===========
+BATCH_MAX_OPS = 500
+BATCH_IN_CHUNK = 100  # ids por filtro `in.(...)`: mantiene la URL en un tamaño razonable
+
+
+class TaskBatchOp(BaseModel):
+    op: Literal["create", "update", "delete"]
+    id: Optional[str] = None     # update / delete
+    data: Optional[dict] = None  # create: TaskCreate · update: TaskUpdate
+
+
+class TaskBatchIn(BaseModel):
+    ops: List[TaskBatchOp] = Field(..., min_length=1, max_length=BATCH_MAX_OPS)
+
+    model_config = ConfigDict(json_schema_extra={
+        "example": {
+            "ops": [
+                {"op": "create", "data": {"title": "Gym", "start_ts": "2025-10-23T14:00:00Z", "tag": "Workout"}},
+                {"op": "update", "id": "3d4ac02c-5f8a-4c14-970f-7da20e46af97", "data": {"position": 2}},
+                {"op": "delete", "id": "0b6e3c55-2d7e-4f4e-9f3f-6f0f3c1f2a10"},
+            ]
+        }
+    })
+
+
+class TaskBatchItem(BaseModel):
+    index: int            # posición en `ops`
+    op: str
+    status: int           # 201 / 200 / 204 / 400 / 404 / 422 / 502
+    id: Optional[str] = None
+    task: Optional[TaskOut] = None
+    error: Optional[str] = None
+
+
+class TaskBatchOut(BaseModel):
+    results: List[TaskBatchItem]
+
+
+def _item(index: int, op: str, status_code: int, id=None, task=None, error=None) -> dict:
+    return {"index": index, "op": op, "status": status_code, "id": id, "task": task, "error": error}
+
+
+def _chunks(items: list, size: int):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+async def _batch_create(sb, creates, results):
+    # Un solo INSERT con todas las filas (default_to_null=False: lo que falte toma el DEFAULT).
+    # Las filas ya pasaron por TaskCreate; si igual una tumba el INSERT (nada quedó
+    # escrito), se parte el bloque en mitades hasta aislarla: con k filas malas son
+    # O(k·log2 N) round trips, nunca uno por fila.
+    try:
+        res = await sb.table("tasks").insert([row for _, row in creates], default_to_null=False).execute()
+    except Exception as e:
+        if not getattr(e, "code", None):
+            # sin código de PostgREST (timeout, red): pudo haberse escrito, no reintentar
+            for i, _ in creates:
+                results[i] = _item(i, "create", 502, error=str(e))
+            return
+        if len(creates) == 1:
+            i, _ = creates[0]
+            results[i] = _item(i, "create", 400, error=str(e))
+            return
+        mid = len(creates) // 2
+        await _batch_create(sb, creates[:mid], results)
+        await _batch_create(sb, creates[mid:], results)
+        return
+    rows = res.data or []
+    if len(rows) == len(creates):
+        for (i, _), row in zip(creates, rows):
+            results[i] = _item(i, "create", 201, row["id"], tasks_api_row(row))
+        return
+    # El INSERT sí se escribió pero la representación vino corta: no hay cómo
+    # emparejar filas con ops, y reintentar duplicaría las tareas → 201 sin cuerpo
+    for i, _ in creates:
+        results[i] = _item(i, "create", 201)
+
+
+async def _batch_update(sb, updates, user_id, results):
+    # N patches distintos en un round trip (sql/batch_update_tasks_rpc.sql)
+    by_id = None
+    try:
+        res = await sb.rpc(
+            "batch_update_tasks",
+            {"p_ops": [{"id": task_id, "patch": fields} for _, task_id, fields in updates]},
+        ).execute()
+        by_id = {row["id"]: row for row in res.data or []}
+    except Exception as e:
+        if getattr(e, "code", None) != "PGRST202":
+            # error de la RPC (cast, RLS, timeout...): no se reintenta por otro camino
+            # (podría ya estar aplicada); se reporta en cada item
+            status_code = 400 if getattr(e, "code", None) else 502
+            for i, task_id, _ in updates:
+                results[i] = _item(i, "update", status_code, task_id, error=str(e))
+            return
+
+    failed = {}
+    if by_id is None:
+        # Fallback sin RPC (PGRST202): un UPDATE ... in.(ids) por cada patch idéntico
+        by_id, groups = {}, {}
+        for _, task_id, fields in updates:
+            groups.setdefault(json.dumps(fields, sort_keys=True), []).append(task_id)
+        for key, ids in groups.items():
+            for part in _chunks(ids, BATCH_IN_CHUNK):
+                try:
+                    res = await sb.table("tasks").update(json.loads(key)).in_("id", part).eq("user_id", user_id).execute()
+                    by_id.update({row["id"]: tasks_api_row(row) for row in res.data or []})
+                except Exception as e:
+                    failed.update({task_id: str(e) for task_id in part})
+
+    for i, task_id, _ in updates:
+        if task_id in failed:
+            results[i] = _item(i, "update", 400, task_id, error=failed[task_id])
+        elif task_id in by_id:
+            results[i] = _item(i, "update", 200, task_id, by_id[task_id])
+        else:
+            results[i] = _item(i, "update", 404, task_id, error="Task not found")
+
+
+async def _batch_delete(sb, deletes, user_id, results):
+    deleted, failed = set(), {}
+    ids = [task_id for _, task_id in deletes]
+    for part in _chunks(ids, BATCH_IN_CHUNK):
+        try:
+            res = await sb.table("tasks").delete().in_("id", part).eq("user_id", user_id).execute()
+            deleted.update(row["id"] for row in res.data or [])
+        except Exception as e:
+            failed.update({task_id: str(e) for task_id in part})
+
+    for i, task_id in deletes:
+        if task_id in failed:
+            results[i] = _item(i, "delete", 400, task_id, error=failed[task_id])
+        elif task_id in deleted:
+            results[i] = _item(i, "delete", 204, task_id)
+        else:
+            results[i] = _item(i, "delete", 404, task_id, error="Task not found")
+
+
+@router.post("/tasks:batch", response_model=TaskBatchOut)
+async def batch_tasks(
+    request: Request,
+    payload: TaskBatchIn,
+    current_user: Annotated[UserOut, Depends(get_current_user)],
+):
+    """
+    Operaciones mixtas sobre tasks (máx. 500) con resultado por item.
+    Se ejecutan agrupadas: 1 INSERT para todos los create, 1 RPC para todos
+    los update y DELETE ... in.(ids) por bloques de 100, así que 500 ops cuestan
+    a lo sumo ~7 round trips. Orden de aplicación: create, update, delete.
+    Un item inválido no tumba al resto: su `status`/`error` lo indican.
+    """
+    try:
+        sb = get_async_supabase_for_request(request)
+
+        results: List[Optional[dict]] = [None] * len(payload.ops)
+        creates, updates, deletes = [], [], []
+        seen_ids = set()
+        for i, op in enumerate(payload.ops):
+            try:
+                if op.op == "create":
+                    creates.append((i, _create_row(TaskCreate.model_validate(op.data or {}), current_user.id)))
+                    continue
+                if not op.id:
+                    raise HTTPException(status_code=400, detail="id is required")
+                task_id = str(UUID(op.id))
+                if task_id in seen_ids:
+                    raise HTTPException(status_code=400, detail="Duplicate id in batch")
+                seen_ids.add(task_id)
+                if op.op == "update":
+                    fields = _update_fields(TaskUpdate.model_validate(op.data or {}))
+                    if not fields:
+                        raise HTTPException(status_code=400, detail="No fields to update")
+                    updates.append((i, task_id, fields))
+                else:
+                    deletes.append((i, task_id))
+            except HTTPException as e:
+                results[i] = _item(i, op.op, e.status_code, op.id, error=str(e.detail))
+            except ValueError as e:  # incluye ValidationError de pydantic y UUID inválido
+                results[i] = _item(i, op.op, 422, op.id, error=str(e))
+
+        if creates:
+            await _batch_create(sb, creates, results)
+        if updates:
+            await _batch_update(sb, updates, current_user.id, results)
+        if deletes:
+            await _batch_delete(sb, deletes, current_user.id, results)
+
+        return {"results": results}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"[tasks.batch] {e}")
+
+
+# ===========
+# Export (streaming)
+# ===========
+EXPORT_CHUNK = int(os.getenv("TASKS_EXPORT_CHUNK", "1000"))
+EXPORT_FIRST_CHUNK = 100  # primer bloque chico: primer byte rápido
+EXPORT_COLUMNS = [
+    "id", "title", "description", "tag", "status", "priority", "start_ts", "due_at",
+    "position", "created_at", "updated_at", "completed_at",
+]
+
+
+@router.get("/tasks/export")
+async def export_tasks(
+    request: Request,
+    current_user: Annotated[UserOut, Depends(get_current_user)],
+    format: Literal["ndjson", "csv"] = Query("ndjson", description="ndjson (una task por línea) o csv"),
+):
+    """
+    Historial completo del usuario en streaming. Lee tasks_api por keyset
+    (start_ts, id) en bloques y emite cada bloque en cuanto llega, mientras
+    ya se pide el siguiente: la memoria no depende del tamaño del historial.
+    """
+    sb = get_async_supabase_for_request(request)
+
+    def fetch(after: Optional[dict], size: int):
+        query = (
+            sb.table("tasks_api")
+            .select(",".join(EXPORT_COLUMNS))
+            .eq("user_id", current_user.id)
+            .order("start_ts", desc=False)
+            .order("id", desc=False)
+        )
+        return apply_keyset(query, "start_ts", after).limit(size).execute()
+
+    # El primer bloque se pide antes de responder: si falla, es un 500 normal
+    try:
+        first = (await fetch(None, EXPORT_FIRST_CHUNK)).data or []
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"[tasks.export] {e}")
+
+    async def chunks():
+        chunk, size = first, EXPORT_FIRST_CHUNK
+        pending = None
+        try:
+            while True:
+                if len(chunk) == size:
+                    last = chunk[-1]
+                    size = EXPORT_CHUNK
+                    pending = asyncio.ensure_future(
+                        fetch({"start_ts": last["start_ts"], "id": last["id"]}, size)
+                    )
+                if chunk:
+                    yield chunk
+                if pending is None:
+                    return
+                chunk, pending = (await pending).data or [], None
+        finally:
+            if pending is not None:  # cliente desconectado a media descarga
+                pending.cancel()
+
+    if format == "csv":
+        async def body():
+            buf = io.StringIO()
+            writer = csv.DictWriter(buf, fieldnames=EXPORT_COLUMNS, extrasaction="ignore")
+            writer.writeheader()
+            async for chunk in chunks():
+                writer.writerows(chunk)
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate()
+            if buf.tell():  # historial vacío: solo el header
+                yield buf.getvalue()
+
+        media_type, ext = "text/csv", "csv"
+    else:
+        async def body():
+            async for chunk in chunks():
+                yield "".join(json.dumps(row, separators=(",", ":")) + "\n" for row in chunk)
+
+        media_type, ext = "application/x-ndjson", "ndjson"
+
+    return StreamingResponse(
+        body(),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="tasks.{ext}"'},
+    )
@@ -1,16 +1,16 @@
 import os
-import openai
-import httpx
 from supabase import create_client, Client
 from dotenv import load_dotenv
-from datetime import datetime, timedelta, timezone
+from datetime import datetime, timezone
 from fastapi import HTTPException, Depends
 from fastapi.security import OAuth2PasswordBearer
 
-load_dotenv()
+from app.api.security import login_log, login_rules, login_scorer
+from app.core import geoip, metrics
+from app.core.supabase_client import get_async_service_supabase
+from app.core.ttl_cache import TTLCache
 
-# Inicializar el cliente de OpenAI
-openai.api_key = os.getenv("OPENAI_API_KEY")
+load_dotenv()
 
 # Inicializar el cliente de Supabase usando la clave de rol de servicio
 SUPABASE_URL = os.getenv("SUPABASE_URL")
@@ -29,43 +29,76 @@ supabase_client: Client = create_client(
 # Esto espera el token de acceso en el encabezado de autorización
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
-# Función para obtener la ubicación geográfica de una dirección IP
+# Ubicación geográfica de una dirección IP: base local (app/core/geoip.py), sin red
 async def get_location_from_ip(ip_address: str):
     """
     Obtiene una ubicación de forma genérica para una dirección IP.
     Maneja la dirección de loopback (localhost) de forma explícita.
     """
-    if ip_address == "127.0.0.1" or ip_address == "::1":
-        return "Localhost"
-    
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(f"http://ip-api.com/json/{ip_address}", timeout=5)
-            data = response.json()
-            if data['status'] == 'success':
-                return f"{data['city']}, {data['country']}"
-            else:
-                return "Ubicación desconocida"
-        except (httpx.RequestError, KeyError):
-            return "Ubicación desconocida"
-
-def analyze_login_attempt_with_openai(prompt):
-    try:
-        print("DEBUG AGENT: Llamando a la API de OpenAI con el siguiente prompt:")
-        print(prompt)
-        
-        client = openai.OpenAI()
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=50,
-            temperature=0.1
+    loc = geoip.locate(ip_address)
+    return loc.label if loc else "Ubicación desconocida"
+
+# -------------------------------------------------------------------
+# Análisis de login por etapas
+# -------------------------------------------------------------------
+# 1) login_rules.assess decide en proceso (cooldown, distancia, red y
+#    user-agent nuevos) con el historial reciente, que se cachea por usuario y
+#    se actualiza con cada login; solo un miss lo lee de login_history.
+# 2) Solo los casos DUDOSO van a OpenAI por login_scorer (cache de decisiones,
+#    micro-batching, timeout estricto); si no hay respuesta se aplica
+#    ANOMALY_LLM_FALLBACK (CONTINUAR por defecto, como antes ante errores).
+# 3) El intento se registra en login_history por la cola de login_log, fuera
+#    del camino del login.
+HISTORY_ROWS = 5
+
+_history = TTLCache("login.history_cache", maxsize=10_000, ttl=float(os.getenv("LOGIN_HISTORY_CACHE_SECONDS", "900")))
+_registration = TTLCache("login.registration_cache", maxsize=10_000, ttl=3600)
+
+
+async def _recent_history(sb, user_id: str):
+    rows = _history.get(user_id)
+    if rows is None:
+        res = await (
+            sb.table("login_history").select("*")
+            .eq("user_id", user_id).order("timestamp", desc=True).limit(HISTORY_ROWS)
+            .execute()
         )
-        decision = response.choices[0].message.content.strip().upper()
-        return decision
-    except Exception as e:
-        print(f"DEBUG AGENT: Error al llamar a la API de OpenAI: {e}")
-        return "CONTINUAR"
+        rows = res.data or []
+    return rows
+
+
+async def _registration_location(sb, user_id: str) -> str:
+    location = _registration.get(user_id)
+    if location is None:
+        try:
+            res = await sb.table("profiles").select("registration_location").eq("id", user_id).single().execute()
+            location = (res.data or {}).get("registration_location") or "Ubicación desconocida"
+        except Exception as e:
+            print(f"DEBUG AGENT: Perfil no encontrado ({e}). Asumiendo ubicación desconocida.")
+            location = "Ubicación desconocida"
+        _registration.set(user_id, location)
+    return location
+
+
+def _place(row) -> str:
+    if not row.get("country"):
+        return "Desconocido"
+    return f"{row['city']}, {row['country']}" if row.get("city") else row["country"]
+
+
+def _case(history, registration_location: str, attempt_row, user_agent: str) -> str:
+    """Descripción de un caso para login_scorer (las instrucciones las pone el scorer)."""
+    history_str = "\n".join([
+        f"Hora: {h['timestamp']}, País: {_place(h)}" for h in history
+    ])
+    return (
+        f"Historial de inicio de sesión:\n"
+        f"{history_str}\n"
+        f"Ubicación de registro del usuario: {registration_location}\n"
+        f"Nuevo intento de inicio de sesión: Hora: {attempt_row['timestamp']}, "
+        f"País: {_place(attempt_row)}, User-Agent: {user_agent}"
+    )
+
 
 async def process_registration(supabase_service, email: str, password: str, ip_address: str):
     """
@@ -91,57 +124,40 @@ async def process_registration(supabase_service, email: str, password: str, ip_a
         print(f"DEBUG AGENT: Error al procesar el registro: {e}")
         return None
 
-def process_login_attempt(supabase_service, user_id: str, ip_address: str, user_agent: str):
-    print("DEBUG AGENT: Procesando intento de inicio de sesión...")
-    
-    print("DEBUG AGENT: Buscando historial para el análisis...")
-    response = supabase_service.table("login_history").select("*").eq("user_id", user_id).order("timestamp", desc=True).limit(5).execute()
-    login_history = response.data
-    
-    print("DEBUG AGENT: Registrando intento de inicio de sesión...")
-    supabase_service.table("login_history").insert({
+async def process_login_attempt(user_id: str, ip_address: str, user_agent: str) -> str:
+    """
+    Decide CONTINUAR / RECHAZAR para un login ya autenticado (ver el bloque de arriba).
+    No bloquea el event loop; la única espera posible es el chequeo con OpenAI de los casos dudosos.
+    """
+    sb = get_async_service_supabase()
+    history = await _recent_history(sb, user_id)
+
+    now = datetime.now(timezone.utc)
+    loc = geoip.locate(ip_address)
+    row = {
         "user_id": user_id,
         "ip_address": ip_address,
         "user_agent": user_agent,
-        "timestamp": datetime.now(timezone.utc).isoformat()
-    }).execute()
-    print("DEBUG AGENT: Registro exitoso.")
-    
-    if len(login_history) < 3:
-        print("DEBUG AGENT: Menos de 3 intentos. Retornando 'CONTINUAR' por defecto.")
-        return "CONTINUAR"
-
-    last_login_time_str = login_history[0]['timestamp']
-    last_login_time = datetime.fromisoformat(last_login_time_str)
-    current_time = datetime.now(timezone.utc)
-    cooldown_period = timedelta(minutes=5)
-
-    if (current_time - last_login_time) < cooldown_period:
-        print("DEBUG AGENT: Intento de inicio de sesión muy rápido. Rechazando por cooldown.")
-        return "RECHAZAR"
-
-    try:
-        profile_response = supabase_service.table("profiles").select("registration_location").eq("id", user_id).single().execute()
-        registration_location = profile_response.data["registration_location"]
-    except Exception as e:
-        print(f"DEBUG AGENT: Error al obtener el perfil de usuario: {e}")
-        print("DEBUG AGENT: Perfil no encontrado. Asumiendo ubicación desconocida.")
-        registration_location = "Ubicación desconocida"
-
-    history_str = "\n".join([
-        f"Hora: {h['timestamp']}, País: {h.get('country', 'Desconocido')}" for h in login_history
-    ])
-
-    prompt = (
-        f"Historial de inicio de sesión del usuario {user_id}:\n"
-        f"{history_str}\n\n"
-        f"Ubicación de registro del usuario: {registration_location}\n"
-        f"Nuevo intento de inicio de sesión:\n"
-        f"País: {ip_address}, User-Agent: {user_agent}\n"
-        f"Basándote en el historial, la ubicación de registro y la nueva ubicación, ¿este nuevo intento es anómalo? Un intento anómalo es un inicio de sesión desde una ubicación muy lejana a la de registro o si los intentos son muy rápidos, ocurriendo en un periodo de menos de 5 a 10 minutos después del último. "
-        f"Responde solo con 'RECHAZAR' o 'CONTINUAR'."
-    )
-    
-    decision = analyze_login_attempt_with_openai(prompt)
-    
-    return decision
\ No newline at end of file
+        "timestamp": now.isoformat(),
+        "country": loc.country if loc else None,
+        "city": loc.city if loc else None,
+        "latitude": loc.latitude if loc else None,
+        "longitude": loc.longitude if loc else None,
+    }
+    _history.set(user_id, [row] + history[: HISTORY_ROWS - 1])
+    login_log.buffer().add(row)
+
+    attempt = login_rules.Attempt(ip_address, user_agent, now, row["latitude"], row["longitude"])
+    decision, reason = login_rules.assess(history, attempt)
+    metrics.inc(f"login.anomaly.rules.{decision.lower()}")
+    if decision == login_rules.DUDOSO:
+        key = login_scorer.decision_key(user_id, ip_address, user_agent, history)
+        decision = login_scorer.cached_decision(key)
+        if decision is None:
+            registration_location = await _registration_location(sb, user_id)
+            case = _case(history, registration_location, row, user_agent)
+            decision = await login_scorer.scorer().score(key, case) or login_scorer.LLM_FALLBACK
+        metrics.inc(f"login.anomaly.llm.{decision.lower()}")
+    if decision == login_rules.RECHAZAR:
+        print(f"DEBUG AGENT: Login de {user_id} rechazado ({reason}).")
+    return decision
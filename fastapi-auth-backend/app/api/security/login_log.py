@@ -0,0 +1,96 @@
+# app/api/security/login_log.py
+
+import asyncio
+import os
+from typing import Any, Dict, List, Optional, Set
+
+from postgrest.types import ReturnMethod
+
+from app.core import metrics
+from app.core.supabase_client import get_async_service_supabase
+
+# -------------------------------------------------------------------
+# Escritura de login_history fuera del camino de /auth/login
+# -------------------------------------------------------------------
+# El login encola la fila y sigue; un INSERT por lote (una lista de filas, un
+# round trip) se hace al juntar LOGIN_LOG_FLUSH_ROWS filas o cuando la más
+# vieja cumple LOGIN_LOG_FLUSH_SECONDS. Si el INSERT falla, las filas vuelven
+# a la cola una vez; si falla de nuevo se descartan (login.history.dropped).
+# main.py vacía la cola en el shutdown.
+FLUSH_ROWS = max(1, int(os.getenv("LOGIN_LOG_FLUSH_ROWS", "100")))
+FLUSH_SECONDS = float(os.getenv("LOGIN_LOG_FLUSH_SECONDS", "1.0"))
+
+
+class LoginLogBuffer:
+    """Cola de filas de login_history del event loop actual. `add` no bloquea."""
+
+    def __init__(self, max_rows: int = FLUSH_ROWS, max_delay: float = FLUSH_SECONDS):
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self._rows: List[Dict[str, Any]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._writes: Set[asyncio.Task] = set()
+
+    def add(self, row: Dict[str, Any], retry: bool = True) -> None:
+        self._rows.append({**row, "_retry": retry})
+        if len(self._rows) >= self.max_rows:
+            self._spawn_flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_delay, self._spawn_flush)
+
+    def _spawn_flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._rows:
+            return
+        rows, self._rows = self._rows, []
+        task = asyncio.create_task(self._write(rows))
+        self._writes.add(task)
+        task.add_done_callback(self._writes.discard)
+
+    async def _write(self, rows: List[Dict[str, Any]]) -> None:
+        payload = [{k: v for k, v in r.items() if k != "_retry"} for r in rows]
+        try:
+            await (
+                get_async_service_supabase()
+                .table("login_history")
+                .insert(payload, returning=ReturnMethod.minimal)
+                .execute()
+            )
+        except Exception as e:
+            print(f"[login_log] insert of {len(rows)} rows failed: {e}")
+            retry = [p for p, r in zip(payload, rows) if r["_retry"]]
+            metrics.inc("login.history.dropped", len(rows) - len(retry))
+            for p in retry:
+                self.add(p, retry=False)
+            return
+        metrics.inc("login.history.flushes")
+        metrics.inc("login.history.rows", len(rows))
+
+    async def flush(self) -> None:
+        # Un INSERT fallido devuelve sus filas a la cola (con timer): se sigue hasta
+        # que no quede nada ni en la cola ni en vuelo. Termina porque el reintento
+        # es uno solo (retry=False), después se descartan.
+        while self._rows or self._writes:
+            self._spawn_flush()
+            if self._writes:
+                await asyncio.gather(*self._writes, return_exceptions=True)
+
+
+_buffers: Dict[int, LoginLogBuffer] = {}
+
+
+def buffer() -> LoginLogBuffer:
+    """La cola del event loop en curso (una por loop: los timers y tasks son del loop)."""
+    loop = asyncio.get_running_loop()
+    buf = _buffers.get(id(loop))
+    if buf is None:
+        buf = _buffers[id(loop)] = LoginLogBuffer()
+    return buf
+
+
+async def aflush() -> None:
+    buf = _buffers.get(id(asyncio.get_running_loop()))
+    if buf is not None:
+        await buf.flush()
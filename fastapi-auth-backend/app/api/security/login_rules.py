@@ -0,0 +1,99 @@
+# app/api/security/login_rules.py
+
+import functools
+import ipaddress
+import math
+import os
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Mapping, Optional, Sequence, Tuple
+
+# -------------------------------------------------------------------
+# Etapa rápida del análisis de login (en proceso, sin I/O)
+# -------------------------------------------------------------------
+# Decide con el historial reciente del usuario (filas de login_history, la más
+# nueva primero) y devuelve (decisión, motivo):
+#   - CONTINUAR : historial corto, o red / dispositivo / zona ya conocidos
+#   - RECHAZAR  : intento dentro del cooldown desde el anterior
+#   - DUDOSO    : solo estos pasan al chequeo con OpenAI (anomaly_agent)
+#
+# "Red conocida" = misma /24 (IPv4) o /48 (IPv6) que algún login previo. Si el
+# intento y el historial traen coordenadas (latitude/longitude), se usa la
+# distancia: más de LOGIN_FAR_KM del login previo más cercano es DUDOSO.
+CONTINUAR = "CONTINUAR"
+RECHAZAR = "RECHAZAR"
+DUDOSO = "DUDOSO"
+
+MIN_HISTORY = 3
+COOLDOWN = timedelta(minutes=float(os.getenv("LOGIN_COOLDOWN_MINUTES", "5")))
+FAR_KM = float(os.getenv("LOGIN_FAR_KM", "500"))
+
+
+@dataclass(frozen=True)
+class Attempt:
+    ip_address: str
+    user_agent: str
+    ts: datetime
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+
+
+@functools.lru_cache(maxsize=8192)
+def network(ip: Optional[str]) -> str:
+    """Prefijo de red de la IP (/24 o /48); la IP tal cual si no se puede parsear."""
+    try:
+        addr = ipaddress.ip_address(ip or "")
+    except ValueError:
+        return ip or ""
+    prefix = 24 if addr.version == 4 else 48
+    return str(ipaddress.ip_network(f"{addr}/{prefix}", strict=False))
+
+
+def distance_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Distancia haversine en km."""
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 12742.0 * math.asin(math.sqrt(a))
+
+
+def _parse_ts(value: Any) -> Optional[datetime]:
+    try:
+        ts = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except (TypeError, ValueError):
+        return None
+    return ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+
+
+def _nearest_km(history: Sequence[Mapping[str, Any]], attempt: Attempt) -> Optional[float]:
+    if attempt.latitude is None or attempt.longitude is None:
+        return None
+    dists = [
+        distance_km(attempt.latitude, attempt.longitude, h["latitude"], h["longitude"])
+        for h in history
+        if h.get("latitude") is not None and h.get("longitude") is not None
+    ]
+    return min(dists) if dists else None
+
+
+def assess(history: Sequence[Mapping[str, Any]], attempt: Attempt) -> Tuple[str, str]:
+    """Decisión de la etapa rápida para `attempt` dado el historial previo (sin incluirlo)."""
+    if len(history) < MIN_HISTORY:
+        return CONTINUAR, "historial corto"
+
+    last = _parse_ts(history[0].get("timestamp"))
+    if last is not None and attempt.ts - last < COOLDOWN:
+        return RECHAZAR, "cooldown"
+
+    km = _nearest_km(history, attempt)
+    if km is not None and km > FAR_KM:
+        return DUDOSO, f"a {km:.0f} km del login previo más cercano"
+
+    known_agent = any(h.get("user_agent") == attempt.user_agent for h in history)
+    net = network(attempt.ip_address)
+    known_place = (km is not None) or any(network(h.get("ip_address")) == net for h in history)
+    if known_place:
+        return CONTINUAR, "zona conocida" if known_agent else "user-agent nuevo desde zona conocida"
+    if known_agent:
+        return DUDOSO, "red nueva"
+    return DUDOSO, "red y user-agent nuevos"
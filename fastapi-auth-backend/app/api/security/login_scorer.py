@@ -0,0 +1,188 @@
+# app/api/security/login_scorer.py
+
+import asyncio
+import json
+import os
+import re
+from typing import Any, Dict, Hashable, List, Mapping, Optional, Sequence, Set, Tuple
+
+from app.api.security import login_rules
+from app.core import metrics
+from app.core.openai_client import get_async_openai
+from app.core.ttl_cache import TTLCache
+
+# -------------------------------------------------------------------
+# Chequeo con OpenAI de los logins DUDOSO (etapa 2 de anomaly_agent)
+# -------------------------------------------------------------------
+# Cache de decisiones: la misma combinación (usuario, red /24|/48, familia de
+# user-agent, huella del historial) no se vuelve a preguntar durante
+# ANOMALY_DECISION_TTL_SECONDS. La huella usa redes / familias / países del
+# historial y no los timestamps, así un login repetido cae en la misma key.
+# Solo se cachean respuestas del modelo, nunca el fallback.
+#
+# Micro-batching: los casos que llegan dentro de ANOMALY_BATCH_WINDOW_MS (hasta
+# ANOMALY_BATCH_MAX) van en UNA request con los casos numerados y respuesta
+# JSON {"1": "RECHAZAR", ...}. Casos con la misma key en vuelo comparten la
+# respuesta. Cada login espera como mucho ANOMALY_LLM_TIMEOUT_SECONDS desde
+# que entra; si vence, falla o falta su número, se aplica ANOMALY_LLM_FALLBACK.
+#
+# Métricas: login.anomaly.decision_cache.{hit,miss} + gauge ...hit_rate,
+# login.anomaly.llm.{requests,cases,prompt_tokens,completion_tokens,timeouts,errors}.
+LLM_MODEL = os.getenv("ANOMALY_LLM_MODEL", "gpt-4o-mini")
+LLM_TIMEOUT = float(os.getenv("ANOMALY_LLM_TIMEOUT_SECONDS", "2.0"))
+LLM_FALLBACK = os.getenv("ANOMALY_LLM_FALLBACK", login_rules.CONTINUAR).upper()
+BATCH_WINDOW = float(os.getenv("ANOMALY_BATCH_WINDOW_MS", "25")) / 1000
+BATCH_MAX = max(1, int(os.getenv("ANOMALY_BATCH_MAX", "16")))
+
+_CACHE_NAME = "login.anomaly.decision_cache"
+_decisions = TTLCache(_CACHE_NAME, maxsize=20_000, ttl=float(os.getenv("ANOMALY_DECISION_TTL_SECONDS", "600")))
+
+_INSTRUCTIONS = (
+    "Eres un detector de inicios de sesión anómalos. Un intento anómalo es un inicio de sesión "
+    "desde una ubicación muy lejana a la de registro o a las de su historial, o si los intentos son "
+    "muy rápidos, ocurriendo en un periodo de menos de 5 a 10 minutos después del último. "
+    "Para cada caso numerado responde 'RECHAZAR' o 'CONTINUAR'. Responde solo con un objeto JSON "
+    'con todos los casos, p.ej. {"1": "CONTINUAR", "2": "RECHAZAR"}.'
+)
+
+_UA_BROWSERS = (
+    ("edge", re.compile(r"Edg(e|A|iOS)?/")),
+    ("opera", re.compile(r"OPR/|Opera")),
+    ("firefox", re.compile(r"Firefox/|FxiOS/")),
+    ("chrome", re.compile(r"Chrome/|CriOS/")),
+    ("safari", re.compile(r"Safari/")),
+)
+_UA_SYSTEMS = (
+    ("android", re.compile(r"Android")),
+    ("ios", re.compile(r"iPhone|iPad|iPod")),
+    ("windows", re.compile(r"Windows")),
+    ("mac", re.compile(r"Macintosh|Mac OS X")),
+    ("linux", re.compile(r"Linux|X11")),
+)
+
+
+def ua_family(user_agent: Optional[str]) -> str:
+    """'navegador/sistema' (p.ej. chrome/windows); sin versiones, para que una actualización no cambie la key."""
+    ua = user_agent or ""
+    browser = next((name for name, rx in _UA_BROWSERS if rx.search(ua)), None)
+    system = next((name for name, rx in _UA_SYSTEMS if rx.search(ua)), "other")
+    if browser is None:
+        browser = ua.split("/", 1)[0].strip().lower()[:32] or "unknown"  # curl, python-requests, apps
+    return f"{browser}/{system}"
+
+
+def decision_key(user_id: str, ip_address: str, user_agent: str, history: Sequence[Mapping[str, Any]]) -> Hashable:
+    fingerprint = tuple(sorted({
+        (login_rules.network(h.get("ip_address")), ua_family(h.get("user_agent")), h.get("country") or "")
+        for h in history
+    }))
+    return user_id, login_rules.network(ip_address), ua_family(user_agent), fingerprint
+
+
+def cached_decision(key: Hashable) -> Optional[str]:
+    decision = _decisions.get(key)
+    hits, misses = metrics.get(f"{_CACHE_NAME}.hit"), metrics.get(f"{_CACHE_NAME}.miss")
+    metrics.set_gauge(f"{_CACHE_NAME}.hit_rate", hits / (hits + misses))
+    return decision
+
+
+def _parse(content: str, n: int) -> Dict[int, str]:
+    try:
+        raw = json.loads(content)
+    except (TypeError, ValueError):
+        # una sola palabra (respuesta "a la antigua") vale para un caso único
+        text = (content or "").upper()
+        if n == 1 and (login_rules.RECHAZAR in text or login_rules.CONTINUAR in text):
+            return {1: login_rules.RECHAZAR if login_rules.RECHAZAR in text else login_rules.CONTINUAR}
+        return {}
+    out = {}
+    for k, v in (raw.items() if isinstance(raw, dict) else []):
+        if str(k).isdigit() and isinstance(v, str):
+            out[int(k)] = login_rules.RECHAZAR if login_rules.RECHAZAR in v.upper() else login_rules.CONTINUAR
+    return out
+
+
+class BatchScorer:
+    """Junta los casos del event loop actual en requests a OpenAI (ver arriba)."""
+
+    def __init__(self, window: float = BATCH_WINDOW, max_cases: int = BATCH_MAX):
+        self.window = window
+        self.max_cases = max_cases
+        self._pending: List[Tuple[Hashable, str, asyncio.Future]] = []
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._runs: Set[asyncio.Task] = set()
+
+    async def score(self, key: Hashable, case: str) -> Optional[str]:
+        """Decisión del modelo para `case`, o None si no respondió a tiempo."""
+        fut = self._inflight.get(key)
+        if fut is None:
+            fut = self._inflight[key] = asyncio.get_running_loop().create_future()
+            self._pending.append((key, case, fut))
+            if len(self._pending) >= self.max_cases:
+                self._spawn()
+            elif self._timer is None:
+                self._timer = asyncio.get_running_loop().call_later(self.window, self._spawn)
+        try:
+            return await asyncio.wait_for(asyncio.shield(fut), LLM_TIMEOUT)
+        except asyncio.TimeoutError:
+            metrics.inc("login.anomaly.llm.timeouts")
+            return None
+
+    def _spawn(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        task = asyncio.create_task(self._run(batch))
+        self._runs.add(task)
+        task.add_done_callback(self._runs.discard)
+
+    async def _run(self, batch: List[Tuple[Hashable, str, asyncio.Future]]) -> None:
+        decisions: Dict[int, str] = {}
+        try:
+            decisions = await asyncio.wait_for(self._ask([case for _, case, _ in batch]), LLM_TIMEOUT)
+        except asyncio.TimeoutError:
+            pass  # cada login ya contó su timeout
+        except Exception as e:
+            print(f"DEBUG AGENT: Error al llamar a la API de OpenAI: {e}")
+            metrics.inc("login.anomaly.llm.errors")
+        finally:
+            for i, (key, _, fut) in enumerate(batch, 1):
+                self._inflight.pop(key, None)
+                decision = decisions.get(i)
+                if decision is not None:
+                    _decisions.set(key, decision)
+                if not fut.done():
+                    fut.set_result(decision)
+
+    async def _ask(self, cases: List[str]) -> Dict[int, str]:
+        prompt = "\n\n".join(f"Caso {i}:\n{case}" for i, case in enumerate(cases, 1))
+        response = await get_async_openai().chat.completions.create(
+            model=LLM_MODEL,
+            messages=[{"role": "system", "content": _INSTRUCTIONS}, {"role": "user", "content": prompt}],
+            response_format={"type": "json_object"},
+            max_tokens=16 + 12 * len(cases),
+            temperature=0.1,
+        )
+        metrics.inc("login.anomaly.llm.requests")
+        metrics.inc("login.anomaly.llm.cases", len(cases))
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            metrics.inc("login.anomaly.llm.prompt_tokens", usage.prompt_tokens or 0)
+            metrics.inc("login.anomaly.llm.completion_tokens", usage.completion_tokens or 0)
+        return _parse(response.choices[0].message.content, len(cases))
+
+
+_scorers: Dict[int, BatchScorer] = {}
+
+
+def scorer() -> BatchScorer:
+    """El scorer del event loop en curso (los futures y timers son del loop)."""
+    loop = asyncio.get_running_loop()
+    s = _scorers.get(id(loop))
+    if s is None:
+        s = _scorers[id(loop)] = BatchScorer()
+    return s
@@ -1,15 +1,21 @@
 # app/core/auth.py
 
 import os
-from datetime import datetime
+import time
+import hashlib
+import threading
+from collections import OrderedDict
 from typing import Optional, Dict, Any, Annotated
 
 from fastapi import Header, HTTPException, Security, status, Depends
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 import jwt
 
 from app.api.models.user import UserOut
-from app.core.supabase_client import get_supabase
+from app.core import metrics
+from app.core.supabase_client import get_service_supabase
+from app.core.ttl_cache import TTLCache
 
 # -------------------------
 # Entorno
@@ -18,6 +24,8 @@ SUPABASE_URL = os.getenv("SUPABASE_URL", "").rstrip("/")
 SUPABASE_AUD = os.getenv("SUPABASE_AUD", "authenticated")
 SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET", "")  # Legacy JWT secret (HMAC)
 ALLOW_DEV_HEADER = os.getenv("ALLOW_DEV_HEADER", "0") == "1"
+JWT_CACHE_SIZE = int(os.getenv("JWT_CACHE_SIZE", "4096"))  # 0 desactiva el cache
+EMAIL_CACHE_TTL = float(os.getenv("AUTH_EMAIL_CACHE_TTL", "600"))  # segundos
 
 if not SUPABASE_URL:
     raise RuntimeError("SUPABASE_URL faltante en .env")
@@ -29,59 +37,103 @@ if not SUPABASE_JWT_SECRET:
 # Bearer para integrarse con Swagger Authorize
 _bearer = HTTPBearer(auto_error=False)
 
+# -------------------------
+# Cache de claims verificados
+# -------------------------
+class _ClaimsCache:
+    """
+    LRU acotado: sha256(token) -> claims ya verificados.
+    Cada entrada vive hasta su 'exp'; las vencidas se descartan al leerlas.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[bytes, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: bytes) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            claims = self._data.get(key)
+            if claims is None:
+                self.misses += 1
+                return None
+            if claims["exp"] <= time.time():
+                del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return claims
+
+    def put(self, key: bytes, claims: Dict[str, Any]) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = claims
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+_claims_cache = _ClaimsCache(JWT_CACHE_SIZE)
+
+# Email por user_id para tokens sin claim 'email' (fallback raro)
+_email_cache = TTLCache("auth.email_cache", maxsize=JWT_CACHE_SIZE, ttl=EMAIL_CACHE_TTL)
+
 # -------------------------
 # Helpers
 # -------------------------
+def _unauthorized(detail: str) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail=detail,
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
 def _decode_jwt_hs256(token: str) -> Dict[str, Any]:
-    # 1) Verifica header
+    """
+    MODO HS256-ONLY:
+    - Valida SIEMPRE con SUPABASE_JWT_SECRET (Legacy JWT secret).
+    - Rechaza tokens con alg != HS256.
+    - Valida 'aud', y requiere 'exp', 'sub' e 'iss'.
+    Los claims verificados se cachean (LRU) hasta su 'exp'.
+    """
+    key = hashlib.sha256(token.encode()).digest()
+    cached = _claims_cache.get(key)
+    if cached is not None:
+        return cached
+
+    # 1) Verifica header (solo decodifica el segmento del header)
     try:
-        header = jwt.get_unverified_header(token)
-        alg = header.get("alg")
+        alg = jwt.get_unverified_header(token).get("alg")
     except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail=f"[JWT] Invalid header: {e}",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+        raise _unauthorized(f"[JWT] Invalid header: {e}")
 
     if alg != "HS256":
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail=f"[HS256-mode] Token alg={alg}. Obtén un token HS256 con /auth/login de este proyecto.",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-
-    # 2) Lee payload sin firma para extraer iss si existe
-    try:
-        unverified = jwt.decode(
-            token,
-            options={"verify_signature": False, "verify_aud": False, "verify_iss": False}
-        )
-        token_iss = unverified.get("iss")
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail=f"[JWT] Cannot read unverified payload: {e}",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+        raise _unauthorized(f"[HS256-mode] Token alg={alg}. Obtén un token HS256 con /auth/login de este proyecto.")
 
-    # 3) Valida firma/claims con HS256
+    # 2) Valida firma/claims en una sola pasada.
+    #    Antes se leía 'iss' sin verificar para pasarlo como issuer esperado;
+    #    eso equivale a exigir que 'iss' exista, que es lo que hacemos aquí.
     try:
         payload = jwt.decode(
             token,
             SUPABASE_JWT_SECRET,
             algorithms=["HS256"],
             audience=SUPABASE_AUD,
-            issuer=token_iss or f"{SUPABASE_URL}/auth/v1",
-            options={"require": ["exp", "sub"]},
+            options={"require": ["exp", "sub", "iss"]},
         )
-        return payload
     except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail=f"[HS256] Invalid token: {e}",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+        raise _unauthorized(f"[HS256] Invalid token: {e}")
+
+    _claims_cache.put(key, payload)
+    return payload
 
 def _get_token_from_bearer(credentials: Optional[HTTPAuthorizationCredentials]) -> str:
     if not credentials or credentials.scheme.lower() != "bearer":
@@ -95,52 +147,65 @@ def _get_token_from_bearer(credentials: Optional[HTTPAuthorizationCredentials])
 # -------------------------
 # Dependencias públicas (para routers)
 # -------------------------
-async def get_user_id(
+async def get_token_claims(
     credentials: Annotated[Optional[HTTPAuthorizationCredentials], Security(_bearer)],
     x_user_id: Optional[str] = Header(default=None, alias="X-User-Id"),
-) -> str:
+) -> Dict[str, Any]:
     """
-    Devuelve el 'sub' del JWT (user_id).
+    Claims verificados del request.
+    FastAPI cachea esta dependencia por request, así que get_user_id /
+    get_current_user (montados en el router y en el endpoint) verifican una sola vez.
     - En DEV, permite X-User-Id cuando ALLOW_DEV_HEADER=1.
     - En PROD, valida Bearer HS256 con SUPABASE_JWT_SECRET.
     """
     if ALLOW_DEV_HEADER and x_user_id:
-        return x_user_id
+        return {"sub": x_user_id, "email": "dev@example.com"}
 
     token = _get_token_from_bearer(credentials)
     payload = _decode_jwt_hs256(token)
-    user_id = payload.get("sub")
-    if not user_id:
+    if not payload.get("sub"):
         raise HTTPException(status_code=401, detail="Token payload missing 'sub'")
-    return user_id
+    return payload
 
-async def get_current_user(
-    credentials: Annotated[Optional[HTTPAuthorizationCredentials], Security(_bearer)],
-    x_user_id: Optional[str] = Header(default=None, alias="X-User-Id"),
-) -> UserOut:
+async def get_user_id(claims: Annotated[Dict[str, Any], Depends(get_token_claims)]) -> str:
     """
-    Devuelve un UserOut con email real desde Supabase.
-    - En DEV, permite X-User-Id cuando ALLOW_DEV_HEADER=1 (email dummy válido).
-    - En PROD, valida Bearer HS256 con SUPABASE_JWT_SECRET y consulta Supabase.
+    Devuelve el 'sub' del JWT (user_id).
     """
-    if ALLOW_DEV_HEADER and x_user_id:
-        return UserOut(id=x_user_id, email="dev@example.com", created_at=datetime.utcnow())
+    return claims["sub"]
 
-    token = _get_token_from_bearer(credentials)
-    payload = _decode_jwt_hs256(token)
-    user_id = payload.get("sub")
-    if not user_id:
-        raise HTTPException(status_code=401, detail="Token payload missing 'sub'")
+def _email_from_claims(claims: Dict[str, Any]) -> Optional[str]:
+    return claims.get("email") or (claims.get("user_metadata") or {}).get("email")
 
-    # Obtener email real de Supabase con el token del usuario
+def _lookup_email(user_id: str) -> str:
+    """
+    Fallback: consulta el usuario en GoTrue (admin API, service role).
+    Cuenta cada llamada en 'auth_server.calls' para vigilar el hot path.
+    """
+    metrics.inc("auth_server.calls")
     try:
-        sb = get_supabase()
-        res = sb.auth.get_user(token)
+        res = get_service_supabase().auth.admin.get_user_by_id(user_id)
         user = res.user
         email = getattr(user, "email", None) or (getattr(user, "user_metadata", {}) or {}).get("email")
-        if not email:
-            email = "unknown@example.com"
     except Exception:
-        email = "unknown@example.com"
+        email = None
+    # Cacheamos también el "unknown" para no martillar GoTrue con el mismo usuario
+    return email or "unknown@example.com"
 
-    return UserOut(id=user_id, email=email, created_at=datetime.utcnow())
+async def get_current_user(claims: Annotated[Dict[str, Any], Depends(get_token_claims)]) -> UserOut:
+    """
+    Devuelve un UserOut con el email del usuario.
+    - En DEV, permite X-User-Id cuando ALLOW_DEV_HEADER=1 (email dummy válido).
+    - En PROD, toma el email de los claims verificados (Supabase lo incluye en el JWT);
+      solo si falta, lo busca en GoTrue con cache TTL por usuario.
+    """
+    user_id = claims["sub"]
+    email = _email_from_claims(claims)
+    if email:
+        metrics.inc("auth.email_from_claims")
+    else:
+        email = _email_cache.get(user_id)
+        if email is None:
+            email = await run_in_threadpool(_lookup_email, user_id)
+            _email_cache.set(user_id, email)
+
+    return UserOut(id=user_id, email=email)
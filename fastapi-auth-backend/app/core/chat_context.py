@@ -0,0 +1,250 @@
+# app/core/chat_context.py
+
+import asyncio
+import os
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Set
+
+from postgrest.types import ReturnMethod
+
+from app.core import metrics, tokens
+from app.core.openai_client import get_async_openai
+from app.core.ttl_cache import TTLCache
+
+# -------------------------------------------------------------------
+# Contexto de conversación del chat (ventana + resumen incremental)
+# -------------------------------------------------------------------
+# Por usuario: los últimos turnos (ventana acotada por CHAT_CONTEXT_WINDOW_TOKENS
+# y CHAT_CONTEXT_MAX_TURNS) más un resumen de todo lo anterior (como mucho
+# CHAT_CONTEXT_SUMMARY_TOKENS). Cuando la ventana se pasa de alguno de los dos
+# topes se sacan los turnos más viejos hasta quedar a la mitad; esos turnos
+# quedan "pendientes" y se pliegan al resumen con UNA llamada a OpenAI fuera
+# del camino de la respuesta (si falla, resumen extractivo). La mitad de margen
+# hace que el resumen se actualice cada varios turnos y no en cada mensaje.
+#
+# Memoria: TTLCache "chat.context" por user_id. Persistencia: fila de
+# public.chat_context (sql/chat_context.sql) que se reescribe en background
+# después de cada turno; sin fila, se arranca con los últimos mensajes de
+# chat_messages.
+#
+# Métricas: chat.context.{requests,prompt_tokens} + gauge last_prompt_tokens
+# (conteo local del prompt sin tools), chat.context.{summaries,summary_errors},
+# chat.context.summary.{prompt_tokens,completion_tokens} (usage de OpenAI).
+WINDOW_TOKENS = int(os.getenv("CHAT_CONTEXT_WINDOW_TOKENS", "1200"))
+MAX_TURNS = int(os.getenv("CHAT_CONTEXT_MAX_TURNS", "12"))
+SUMMARY_TOKENS = int(os.getenv("CHAT_CONTEXT_SUMMARY_TOKENS", "250"))
+SUMMARY_MODEL = os.getenv("CHAT_CONTEXT_SUMMARY_MODEL", "gpt-4o-mini")
+SUMMARY_TIMEOUT = float(os.getenv("CHAT_CONTEXT_SUMMARY_TIMEOUT_SECONDS", "10"))
+BOOTSTRAP_MESSAGES = 2 * MAX_TURNS
+
+_cache = TTLCache("chat.context", maxsize=10_000, ttl=float(os.getenv("CHAT_CONTEXT_TTL_SECONDS", "1800")))
+_flushes: Set[asyncio.Task] = set()
+
+_SUMMARY_INSTRUCTIONS = (
+    "Mantienes el resumen de una conversación entre un usuario y el asistente de su Routine Manager. "
+    "Actualiza el resumen con los turnos nuevos: conserva datos útiles para seguir la conversación "
+    "(tareas creadas o modificadas con su id, fechas, preferencias, preguntas pendientes) y descarta "
+    f"saludos y repeticiones. Responde solo con el resumen, en español, en menos de {SUMMARY_TOKENS} tokens."
+)
+
+
+def _turn(role: str, content: str) -> Dict[str, str]:
+    return {"role": role, "content": content}
+
+
+def _tokens(turns: List[Dict[str, str]]) -> int:
+    return sum(tokens.MESSAGE_OVERHEAD + tokens.count(t["content"]) for t in turns)
+
+
+@dataclass
+class Conversation:
+    user_id: str
+    summary: str = ""
+    turns: List[Dict[str, str]] = field(default_factory=list)  # ventana, {"role", "content"}
+    pending: List[Dict[str, str]] = field(default_factory=list)  # fuera de la ventana, sin resumir
+    dirty: bool = False
+    flushing: bool = False
+
+    def messages(self, system: str, user_text: str) -> List[Dict[str, str]]:
+        """Prompt del turno: system, resumen, ventana y el mensaje nuevo (y cuenta sus tokens)."""
+        out = [_turn("system", system)]
+        if self.summary:
+            out.append(_turn("system", f"Resumen de la conversación hasta ahora:\n{self.summary}"))
+        if self.pending:
+            # todavía no entraron al resumen: van tal cual para no perder el hilo
+            out.extend(self.pending)
+        out.extend(self.turns)
+        out.append(_turn("user", user_text))
+        n = tokens.count_messages(out)
+        metrics.inc("chat.context.requests")
+        metrics.inc("chat.context.prompt_tokens", n)
+        metrics.set_gauge("chat.context.last_prompt_tokens", n)
+        return out
+
+    def record(self, user_text: str, reply: str, tool: Optional[str] = None,
+               result: Optional[Dict[str, Any]] = None) -> None:
+        """Agrega el turno a la ventana; si se pasa de los topes, los más viejos quedan pendientes."""
+        if tool:
+            reply = f"[{tool}: {_tool_note(result or {})}] {reply}"
+        self.turns.append(_turn("user", user_text))
+        self.turns.append(_turn("assistant", reply))
+        if _tokens(self.turns) <= WINDOW_TOKENS and len(self.turns) <= 2 * MAX_TURNS:
+            return
+        # de a pares user/assistant hasta la mitad de ambos topes
+        while len(self.turns) > 2 and (
+            _tokens(self.turns) > WINDOW_TOKENS // 2 or len(self.turns) > MAX_TURNS
+        ):
+            self.pending.extend(self.turns[:2])
+            del self.turns[:2]
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "user_id": self.user_id,
+            "summary": self.summary,
+            "turns": self.turns,
+            "pending": self.pending,
+            "updated_at": datetime.now(timezone.utc).isoformat(),
+        }
+
+
+def _tool_note(result: Dict[str, Any]) -> str:
+    """Lo mínimo del resultado de un tool para poder referirse a él después (ids)."""
+    if not result.get("ok"):
+        return "sin ejecutar" if result.get("ask") else "error"
+    task = result.get("task") or {}
+    if task.get("id"):
+        return f"ok id={task['id']} \"{task.get('title') or ''}\" {task.get('start_ts') or ''}".rstrip()
+    if result.get("deleted_id"):
+        return f"ok id={result['deleted_id']}"
+    if "created" in result:
+        return f"ok {result['created']} copias"
+    return "ok"
+
+
+def _message_text(row: Dict[str, Any]) -> Optional[str]:
+    content = row.get("content")
+    if isinstance(content, dict):
+        return content.get("message")
+    return content if isinstance(content, str) else None
+
+
+async def load(sb, user_id: str) -> Conversation:
+    """Contexto del usuario: cache del proceso, si no la fila de chat_context, si no chat_messages."""
+    conv = _cache.get(user_id)
+    if conv is not None:
+        return conv
+    conv = Conversation(user_id)
+    try:
+        rows = (
+            await sb.table("chat_context")
+            .select("summary, turns, pending")
+            .eq("user_id", user_id)
+            .limit(1)
+            .execute()
+        ).data or []
+        if rows:
+            conv.summary = rows[0].get("summary") or ""
+            conv.turns = list(rows[0].get("turns") or [])
+            conv.pending = list(rows[0].get("pending") or [])
+        else:
+            recent = (
+                await sb.table("chat_messages")
+                .select("role, content")
+                .eq("user_id", user_id)
+                .in_("role", ["user", "assistant"])
+                .order("created_at", desc=True)
+                .limit(BOOTSTRAP_MESSAGES)
+                .execute()
+            ).data or []
+            for row in reversed(recent):
+                text = _message_text(row)
+                if text:
+                    conv.turns.append(_turn(row["role"], text))
+            while _tokens(conv.turns) > WINDOW_TOKENS and len(conv.turns) > 1:
+                del conv.turns[0]
+    except Exception as e:
+        # sin contexto se responde igual que antes (solo el mensaje nuevo)
+        print(f"[chat_context] load failed for {user_id}: {e}")
+    # otro request del mismo usuario pudo cargarlo mientras tanto
+    existing = _cache.get(user_id)
+    if existing is not None:
+        return existing
+    _cache.set(user_id, conv)
+    return conv
+
+
+def commit(sb, conv: Conversation) -> None:
+    """Persiste el turno (y pliega los pendientes al resumen) en background."""
+    _cache.set(conv.user_id, conv)
+    conv.dirty = True
+    if conv.flushing:
+        return  # el flush en curso vuelve a pasar
+    conv.flushing = True
+    task = asyncio.create_task(_flush(sb, conv))
+    _flushes.add(task)
+    task.add_done_callback(_flushes.discard)
+
+
+async def _flush(sb, conv: Conversation) -> None:
+    try:
+        while conv.dirty:
+            conv.dirty = False
+            if conv.pending:
+                await _fold(conv)
+            try:
+                await (
+                    sb.table("chat_context")
+                    .upsert(conv.snapshot(), on_conflict="user_id", returning=ReturnMethod.minimal)
+                    .execute()
+                )
+            except Exception as e:
+                print(f"[chat_context] snapshot write failed for {conv.user_id}: {e}")
+    finally:
+        conv.flushing = False
+
+
+async def _fold(conv: Conversation) -> None:
+    batch = list(conv.pending)
+    try:
+        summary = await asyncio.wait_for(_summarize(conv.summary, batch), SUMMARY_TIMEOUT)
+        metrics.inc("chat.context.summaries")
+    except Exception as e:
+        print(f"[chat_context] summary failed for {conv.user_id}: {e}")
+        metrics.inc("chat.context.summary_errors")
+        summary = _extractive(conv.summary, batch)
+    conv.summary = tokens.tail(summary, SUMMARY_TOKENS)
+    del conv.pending[:len(batch)]  # lo que llegó durante el resumen queda para el próximo
+
+
+async def _summarize(summary: str, turns: List[Dict[str, str]]) -> str:
+    lines = "\n".join(f"{'Usuario' if t['role'] == 'user' else 'Asistente'}: {t['content']}" for t in turns)
+    response = await get_async_openai().chat.completions.create(
+        model=SUMMARY_MODEL,
+        messages=[
+            {"role": "system", "content": _SUMMARY_INSTRUCTIONS},
+            {"role": "user", "content": f"Resumen actual:\n{summary or '(vacío)'}\n\nTurnos nuevos:\n{lines}"},
+        ],
+        max_tokens=SUMMARY_TOKENS,
+        temperature=0.2,
+    )
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        metrics.inc("chat.context.summary.prompt_tokens", usage.prompt_tokens or 0)
+        metrics.inc("chat.context.summary.completion_tokens", usage.completion_tokens or 0)
+    text = (response.choices[0].message.content or "").strip()
+    if not text:
+        raise ValueError("empty summary")
+    return text
+
+
+def _extractive(summary: str, turns: List[Dict[str, str]]) -> str:
+    """Sin modelo: el resumen anterior más los mensajes del usuario (se recorta por el final)."""
+    said = " ".join(t["content"].strip() for t in turns if t["role"] == "user")
+    return f"{summary} Usuario pidió: {said}".strip() if said else summary
+
+
+async def aflush() -> None:
+    """Espera los snapshots en vuelo (shutdown)."""
+    if _flushes:
+        await asyncio.gather(*list(_flushes), return_exceptions=True)
@@ -1,17 +1,17 @@
 # app/core/db.py
-import os
 from fastapi import HTTPException, status, Security
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from supabase import create_client, Client
+from postgrest import AsyncPostgrestClient
 
-SUPABASE_URL = os.getenv("SUPABASE_URL", "").rstrip("/")
-SUPABASE_ANON_KEY = os.getenv("SUPABASE_KEY", "")  # anon/public key
+from app.core.supabase_client import get_async_supabase_for_token
 
 _bearer = HTTPBearer(auto_error=False)
 
-def get_supabase(credentials: HTTPAuthorizationCredentials = Security(_bearer)) -> Client:
+def get_supabase(credentials: HTTPAuthorizationCredentials = Security(_bearer)) -> AsyncPostgrestClient:
     """
-    Crea un cliente Supabase y aplica el Bearer del usuario a PostgREST para que RLS funcione.
+    Devuelve una vista PostgREST async con el Bearer del usuario para que RLS funcione
+    (`await supa.table(...)...execute()`). Usa el pool HTTP compartido
+    (ver app/core/supabase_client.py).
     No revalida el JWT (tu main.py ya lo hace). Solo lo reutiliza para RLS.
     """
     if not credentials or credentials.scheme.lower() != "bearer":
@@ -19,7 +19,4 @@ def get_supabase(credentials: HTTPAuthorizationCredentials = Security(_bearer))
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Missing Authorization: Bearer <token>",
         )
-    token = credentials.credentials
-    client: Client = create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
-    client.postgrest.auth(token)  # ← clave: autenticar PostgREST con el JWT del usuario
-    return client
+    return get_async_supabase_for_token(credentials.credentials)
@@ -0,0 +1,242 @@
+# app/core/geoip.py
+
+import csv
+import functools
+import ipaddress
+import math
+import mmap
+import os
+import struct
+import sys
+import threading
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from app.core import metrics
+
+# -------------------------------------------------------------------
+# Geolocalización de IPs local (sin red)
+# -------------------------------------------------------------------
+# GEOIP_DB_PATH apunta a un archivo binario de rangos de IP que se abre con
+# mmap (solo se leen las páginas que toca la búsqueda) y se consulta con
+# búsqueda binaria. Los resultados de IPs frecuentes quedan en un LRU en
+# proceso (GEOIP_CACHE_SIZE). Sin archivo, geolocator() no ubica nada y el
+# resto de la app sigue con "Ubicación desconocida".
+#
+# El archivo se genera desde un CSV de rangos, p.ej. el "IP to City Lite" de
+# DB-IP (ip_start,ip_end,continent,country,stateprov,city,latitude,longitude):
+#     python -m app.core.geoip build dbip-city-lite.csv geoip.bin
+# También acepta CSVs de 6 columnas: ip_start,ip_end,country,city,latitude,longitude.
+#
+# Formato (little endian):
+#   header   : b"RMGEO1" + <III> (rangos, ubicaciones, bytes de strings)
+#   rangos   : <16s16sI> inicio, fin (IPv6; las IPv4 como ::ffff:a.b.c.d), ubicación
+#              ordenados por inicio y sin solaparse
+#   ubicación: <ffII> latitud, longitud (NaN = sin coordenadas), offset del país, offset de la ciudad
+#   strings  : <H> largo + utf-8
+DB_PATH = os.getenv("GEOIP_DB_PATH", "")
+CACHE_SIZE = int(os.getenv("GEOIP_CACHE_SIZE", "4096"))
+
+_MAGIC = b"RMGEO1"
+_HEADER = struct.Struct("<III")
+_RANGE = struct.Struct("<16s16sI")
+_LOC = struct.Struct("<ffII")
+_STR_LEN = struct.Struct("<H")
+
+
+@dataclass(frozen=True)
+class Location:
+    country: str
+    city: str = ""
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+
+    @property
+    def label(self) -> str:
+        return f"{self.city}, {self.country}" if self.city else self.country
+
+
+LOCALHOST = Location("Localhost")
+
+
+def _key(ip: str) -> Optional[bytes]:
+    """IP como 16 bytes big endian (IPv4 mapeada a IPv6); compara igual que el número."""
+    try:
+        addr = ipaddress.ip_address(ip)
+    except ValueError:
+        return None
+    if addr.version == 4:
+        return b"\x00" * 10 + b"\xff\xff" + addr.packed
+    return addr.packed
+
+
+class Geolocator:
+    """Interfaz: `lookup(ip)` devuelve la Location o None. Ver set_geolocator() para cambiarla."""
+
+    def lookup(self, ip: str) -> Optional[Location]:
+        return None
+
+    def close(self) -> None:
+        pass
+
+
+class RangeDB(Geolocator):
+    """Base de rangos en disco (ver formato arriba), mmap + búsqueda binaria + LRU."""
+
+    def __init__(self, path: str, cache_size: int = CACHE_SIZE):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        mm = self._mm
+        if mm[: len(_MAGIC)] != _MAGIC:
+            raise ValueError(f"{path}: no es una base RMGEO1")
+        self._n, n_locs, _ = _HEADER.unpack_from(mm, len(_MAGIC))
+        self._ranges = len(_MAGIC) + _HEADER.size
+        self._locs = self._ranges + self._n * _RANGE.size
+        self._strings = self._locs + n_locs * _LOC.size
+        self._location = functools.lru_cache(maxsize=None)(self._location_at)
+        self.lookup = functools.lru_cache(maxsize=cache_size)(self._lookup_ip)
+
+    def _string(self, off: int) -> str:
+        pos = self._strings + off
+        (n,) = _STR_LEN.unpack_from(self._mm, pos)
+        return self._mm[pos + _STR_LEN.size: pos + _STR_LEN.size + n].decode("utf-8")
+
+    def _location_at(self, idx: int) -> Location:
+        lat, lon, country, city = _LOC.unpack_from(self._mm, self._locs + idx * _LOC.size)
+        if math.isnan(lat) or math.isnan(lon):
+            return Location(self._string(country), self._string(city))
+        return Location(self._string(country), self._string(city), round(lat, 4), round(lon, 4))
+
+    def _lookup(self, key: bytes) -> Optional[Location]:
+        mm, base, size = self._mm, self._ranges, _RANGE.size
+        lo, hi = 0, self._n
+        while lo < hi:  # último rango con inicio <= key
+            mid = (lo + hi) // 2
+            off = base + mid * size
+            if mm[off: off + 16] <= key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == 0:
+            return None
+        _, end, idx = _RANGE.unpack_from(mm, base + (lo - 1) * size)
+        return self._location(idx) if key <= end else None
+
+    def _lookup_ip(self, ip: str) -> Optional[Location]:
+        key = _key(ip)
+        return self._lookup(key) if key is not None else None
+
+    def lookup(self, ip: str) -> Optional[Location]:  # reemplazado por el LRU en __init__
+        return self._lookup_ip(ip)
+
+    def close(self) -> None:
+        self._mm.close()
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def _kind(ip: str) -> str:
+    try:
+        addr = ipaddress.ip_address(ip)
+    except ValueError:
+        return "invalid"
+    if addr.is_loopback:
+        return "loopback"
+    return "public" if addr.is_global else "invalid"  # privadas / reservadas: sin ubicación
+
+
+def locate(ip: Optional[str]) -> Optional[Location]:
+    """Ubicación de `ip` con el geolocator activo (LOCALHOST para loopback, None si no se conoce)."""
+    kind = _kind(ip) if ip else "invalid"
+    if kind != "public":
+        return LOCALHOST if kind == "loopback" else None
+    loc = geolocator().lookup(ip)
+    metrics.inc("geoip.found" if loc else "geoip.unknown")
+    return loc
+
+
+# -------------------------------------------------------------------
+# Geolocator del proceso
+# -------------------------------------------------------------------
+_geolocator: Optional[Geolocator] = None
+_lock = threading.Lock()
+
+
+def geolocator() -> Geolocator:
+    global _geolocator
+    if _geolocator is None:
+        with _lock:
+            if _geolocator is None:
+                _geolocator = RangeDB(DB_PATH) if DB_PATH else Geolocator()
+    return _geolocator
+
+
+def set_geolocator(g: Geolocator) -> None:
+    """Reemplaza el geolocator del proceso (otra base, otro proveedor)."""
+    global _geolocator
+    with _lock:
+        old, _geolocator = _geolocator, g
+    if old is not None and old is not g:
+        old.close()
+
+
+# -------------------------------------------------------------------
+# Construcción del archivo
+# -------------------------------------------------------------------
+def _csv_rows(path: str) -> Iterable[Tuple[str, str, str, str, str, str]]:
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.reader(f):
+            if not row or row[0].startswith("#") or row[0] == "ip_start":
+                continue
+            if len(row) >= 8:  # DB-IP city lite
+                yield row[0], row[1], row[3], row[5], row[6], row[7]
+            elif len(row) == 6:
+                yield tuple(row)
+
+
+def build(rows: Iterable[Sequence[str]], out_path: str) -> int:
+    """Escribe la base desde filas (ip_start, ip_end, country, city, lat, lon); devuelve cuántos rangos."""
+    strings: Dict[str, int] = {}
+    blob = bytearray()
+    locs: Dict[Tuple[str, str, str, str], int] = {}
+    loc_records: List[bytes] = []
+    ranges: List[Tuple[bytes, bytes, int]] = []
+
+    def _str(s: str) -> int:
+        if s not in strings:
+            raw = s.encode("utf-8")[:65535]
+            strings[s] = len(blob)
+            blob.extend(_STR_LEN.pack(len(raw)) + raw)
+        return strings[s]
+
+    for start, end, country, city, lat, lon in rows:
+        ks, ke = _key(start), _key(end)
+        if ks is None or ke is None or ke < ks:
+            continue
+        loc = (country, city, lat, lon)
+        if loc not in locs:
+            locs[loc] = len(loc_records)
+            loc_records.append(_LOC.pack(float(lat or "nan"), float(lon or "nan"), _str(country), _str(city)))
+        ranges.append((ks, ke, locs[loc]))
+
+    ranges.sort()
+    for (_, prev_end, _), (start, _, _) in zip(ranges, ranges[1:]):
+        if start <= prev_end:
+            raise ValueError("rangos solapados en el CSV")
+
+    tmp = f"{out_path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(_MAGIC + _HEADER.pack(len(ranges), len(loc_records), len(blob)))
+        for r in ranges:
+            f.write(_RANGE.pack(*r))
+        f.writelines(loc_records)
+        f.write(blob)
+    os.replace(tmp, out_path)
+    return len(ranges)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4 or sys.argv[1] != "build":
+        sys.exit("uso: python -m app.core.geoip build <rangos.csv> <salida.bin>")
+    n = build(_csv_rows(sys.argv[2]), sys.argv[3])
+    print(f"{n} rangos -> {sys.argv[3]}")
@@ -0,0 +1,38 @@
+# app/core/metrics.py
+
+import threading
+from typing import Dict
+
+# -------------------------------------------------------------------
+# Contadores/gauges en memoria del proceso (sin dependencias externas).
+# Se exponen en GET /health/metrics (X-Admin-Token).
+# -------------------------------------------------------------------
+_lock = threading.Lock()
+_counters: Dict[str, float] = {}
+_gauges: Dict[str, float] = {}
+
+
+def inc(name: str, value: float = 1) -> None:
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def set_gauge(name: str, value: float) -> None:
+    with _lock:
+        _gauges[name] = value
+
+
+def get(name: str) -> float:
+    with _lock:
+        return _counters.get(name, _gauges.get(name, 0))
+
+
+def snapshot() -> Dict[str, Dict[str, float]]:
+    with _lock:
+        return {"counters": dict(_counters), "gauges": dict(_gauges)}
+
+
+def reset() -> None:
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
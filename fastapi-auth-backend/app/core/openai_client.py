@@ -1,8 +1,23 @@
 import os
-from openai import OpenAI
+from typing import Optional
+from openai import OpenAI, AsyncOpenAI
+
+_async_client: Optional[AsyncOpenAI] = None
 
 def get_openai() -> OpenAI:
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key:
         raise RuntimeError("OPENAI_API_KEY is required")
     return OpenAI(api_key=api_key)
+
+def get_async_openai() -> AsyncOpenAI:
+    """
+    Cliente async compartido por el proceso (reutiliza su pool HTTP entre requests).
+    """
+    global _async_client
+    if _async_client is None:
+        api_key = os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            raise RuntimeError("OPENAI_API_KEY is required")
+        _async_client = AsyncOpenAI(api_key=api_key)
+    return _async_client
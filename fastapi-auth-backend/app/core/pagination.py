@@ -0,0 +1,88 @@
+# app/core/pagination.py
+
+import base64
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+
+from fastapi import HTTPException, Response
+
+# -------------------------------------------------------------------
+# Cursores opacos para paginación por keyset
+# -------------------------------------------------------------------
+# El cursor es base64url(JSON) con el tipo de listado ("k") y los valores
+# de la última fila devuelta. El cliente no debe interpretarlo: solo
+# reenviarlo en `?cursor=` para pedir la página siguiente.
+# Los listados mantienen el body (lista) y mandan el cursor en un header.
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(kind: str, **values: Any) -> str:
+    raw = json.dumps({"k": kind, **values}, separators=(",", ":"), default=str)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _load(cursor: str) -> Dict[str, Any]:
+    padded = cursor + "=" * (-len(cursor) % 4)
+    data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    if not isinstance(data, dict):
+        raise ValueError("cursor is not an object")
+    return data
+
+
+def decode_cursor(cursor: Optional[str], kind: str, *fields: str) -> Optional[Dict[str, Any]]:
+    """
+    Devuelve los valores del cursor (sin "k") o None si no vino cursor.
+    Un cursor corrupto, de otro listado o sin `fields` es un 400, no un 500.
+    """
+    if not cursor:
+        return None
+    try:
+        data = _load(cursor)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if data.pop("k", None) != kind or any(f not in data for f in fields):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return data
+
+
+def cursor_kind(cursor: Optional[str]) -> Optional[str]:
+    """Tipo de listado de un cursor (o None si no hay cursor / es inválido)."""
+    try:
+        return _load(cursor).get("k") if cursor else None
+    except Exception:
+        return None
+
+
+def set_next_cursor(response: Response, cursor: Optional[str]) -> None:
+    """Publica el cursor de la página siguiente (si hay) en el header."""
+    if cursor:
+        response.headers[NEXT_CURSOR_HEADER] = cursor
+
+
+def apply_keyset(query, column: str, after: Optional[Dict[str, Any]]):
+    """
+    Filtra `(column, id) > (after[column], after["id"])` en un builder PostgREST
+    ordenado por (column, id) ASC. Se expresa como
+        column >= v AND (column > v OR id > last_id)
+    para que el `>=` siga usando el índice (user_id, column, id) como rango.
+    Los valores vienen del cliente: se validan (timestamp + uuid) antes de
+    interpolarlos en el filtro `or=`.
+    """
+    if not after:
+        return query
+    try:
+        value = datetime.fromisoformat(str(after[column]).replace("Z", "+00:00")).isoformat()
+        last_id = str(UUID(str(after["id"])))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return query.gte(column, value).or_(f'{column}.gt."{value}",id.gt.{last_id}')
+
+
+def keyset_cursor(kind: str, rows: List[Dict[str, Any]], limit: int, column: str) -> Optional[str]:
+    """Cursor de la página siguiente; None si esta página vino incompleta (fin)."""
+    if len(rows) < limit:
+        return None
+    last = rows[-1]
+    return encode_cursor(kind, **{column: last[column]}, id=last["id"])
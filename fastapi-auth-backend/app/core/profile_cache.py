@@ -0,0 +1,77 @@
+# app/core/profile_cache.py
+
+import os
+from typing import Any, Dict, Iterable, List, Optional
+
+from app.core import metrics
+from app.core.ttl_cache import TTLCache
+
+# -------------------------------------------------------------------
+# Contacto de WhatsApp por usuario (profiles.phone / notify_enabled)
+# -------------------------------------------------------------------
+# Los workers resuelven los contactos de TODO el lote con un solo
+# `id=in.(...)` (solo los que no están en cache) en vez de un SELECT por
+# notificación. PUT /api/settings/notifications invalida la entrada en su
+# proceso; un worker en otro proceso ve el cambio a más tardar en
+# PROFILE_CACHE_TTL segundos.
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", "10000"))
+PROFILE_CACHE_TTL = float(os.getenv("PROFILE_CACHE_TTL", "60"))
+_IN_CHUNK = 200  # ids por query (URL acotada)
+
+_contacts = TTLCache("profiles.contact", maxsize=PROFILE_CACHE_SIZE, ttl=PROFILE_CACHE_TTL)
+
+
+def invalidate(user_id: str) -> None:
+    """Llamar cuando cambian phone/notify_enabled del usuario."""
+    _contacts.invalidate(str(user_id))
+
+
+def phone(contact: Optional[Dict[str, Any]]) -> Optional[str]:
+    """Teléfono al que se puede enviar, o None (sin perfil, sin teléfono o notificaciones apagadas)."""
+    if not contact or not contact.get("notify_enabled"):
+        return None
+    return contact.get("phone")
+
+
+def _split(user_ids: Iterable[str]):
+    found: Dict[str, Dict[str, Any]] = {}
+    missing: List[str] = []
+    for uid in dict.fromkeys(str(u) for u in user_ids):
+        contact = _contacts.get(uid)
+        if contact is None:
+            missing.append(uid)
+        else:
+            found[uid] = contact
+    return found, missing
+
+
+def _query(sb, ids: List[str]):
+    return sb.table("profiles").select("id, phone, notify_enabled").in_("id", ids)
+
+
+def _store(found: Dict[str, Dict[str, Any]], ids: List[str], rows: List[Dict[str, Any]]) -> None:
+    metrics.inc("profiles.prefetch.queries")
+    metrics.inc("profiles.prefetch.rows", len(rows))
+    by_id = {str(r["id"]): {"phone": r.get("phone"), "notify_enabled": r.get("notify_enabled")} for r in rows}
+    for uid in ids:
+        contact = by_id.get(uid, {})  # {} = sin perfil (también se cachea)
+        _contacts.set(uid, contact)
+        found[uid] = contact
+
+
+def prefetch(sb, user_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+    """user_id -> {"phone", "notify_enabled"} para el lote (cliente PostgREST síncrono)."""
+    found, missing = _split(user_ids)
+    for i in range(0, len(missing), _IN_CHUNK):
+        ids = missing[i:i + _IN_CHUNK]
+        _store(found, ids, _query(sb, ids).execute().data or [])
+    return found
+
+
+async def aprefetch(sb, user_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+    """Igual que prefetch() con el cliente PostgREST async."""
+    found, missing = _split(user_ids)
+    for i in range(0, len(missing), _IN_CHUNK):
+        ids = missing[i:i + _IN_CHUNK]
+        _store(found, ids, (await _query(sb, ids).execute()).data or [])
+    return found
@@ -0,0 +1,186 @@
+# app/core/rate_limit.py
+
+import asyncio
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Optional
+
+from app.core import metrics
+
+# -------------------------------------------------------------------
+# Rate limiting hacia Graph API (por phone_number_id del remitente)
+# -------------------------------------------------------------------
+# Lo usa GraphClient (app/core/whatsapp.py), por donde pasa TODO envío de
+# WhatsApp: routers, integrations y workers. Vive en el event loop del cliente,
+# así que las primitivas son asyncio y no necesitan locks de hilos.
+#
+#   - TokenBucket: `rate` mensajes/s con ráfagas de hasta `burst`
+#   - AdaptiveThrottle: bucket + límite de envíos en vuelo, ambos AIMD: ante un
+#     throttle de Meta se parten a la mitad y el bucket se pausa (Retry-After o
+#     backoff por código); con envíos OK suben de a poco hasta el máximo.
+#
+# Códigos de Meta que son rate limit (no errores del mensaje):
+#   130429 throughput del número, 131056 par remitente/destinatario,
+#   80007 límite de la WABA, 4 / 613 límite de llamadas de la app.
+THROTTLE_CODES = {130429, 80007, 4, 613}
+PAIR_CODE = 131056
+PAIR_WAIT = 6.0  # Meta: ~1 mensaje cada 6 s al mismo destinatario
+MAX_BACKOFF = 60.0
+
+
+def retry_after(headers: Any) -> Optional[float]:
+    """Retry-After en segundos (acepta segundos o fecha HTTP); None si no viene o no parsea."""
+    value = headers.get("retry-after") if headers is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def classify(status: int, data: Any) -> Optional[str]:
+    """'throttle' (límite del remitente), 'pair' (límite por destinatario) o None si no es rate limit."""
+    code = None
+    if isinstance(data, dict) and isinstance(data.get("error"), dict):
+        code = data["error"].get("code")
+    if code == PAIR_CODE:
+        return "pair"
+    if status == 429 or code in THROTTLE_CODES:
+        return "throttle"
+    return None
+
+
+class TokenBucket:
+    """`rate` tokens/s, capacidad `burst`. acquire() espera lo justo (FIFO); pause() congela el bucket."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self._t = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self._t) * self.rate)
+        self._t = now
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float) -> None:
+        now = time.monotonic()
+        self._refill(now)
+        self._paused_until = max(self._paused_until, now + seconds)
+        self.tokens = 0.0  # al reanudar, arrancar sin ráfaga
+
+    def paused_for(self) -> float:
+        return max(0.0, self._paused_until - time.monotonic())
+
+
+class AdaptiveThrottle:
+    """
+    Límite por remitente: `async with throttle:` espera turno (en vuelo < limit)
+    y token. Después del envío: on_success() / on_throttle(kind, retry_after).
+    `rate <= 0` desactiva el bucket (solo cuenta en vuelo / gauges).
+    """
+
+    def __init__(self, key: str, rate: float, burst: float, max_in_flight: int, min_rate: Optional[float] = None):
+        self.key = key
+        self.max_rate = rate
+        self.min_rate = min_rate if min_rate is not None else max(1.0, rate / 16)
+        self.bucket = TokenBucket(rate, burst) if rate > 0 else None
+        self.max_limit = max(1, max_in_flight)
+        self.limit = float(self.max_limit)
+        self.in_flight = 0
+        self.strikes = 0
+        self._cut_until = 0.0
+        self._cond = asyncio.Condition()
+        self._publish()
+
+    @property
+    def rate(self) -> float:
+        return self.bucket.rate if self.bucket is not None else 0.0
+
+    async def __aenter__(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+        if self.bucket is not None:
+            await self.bucket.acquire()
+        return self
+
+    async def __aexit__(self, *exc):
+        async with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def on_success(self) -> None:
+        self.strikes = 0
+        # incremento aditivo: +1 en vuelo por "ventana" completa y +5% del máximo
+        # por segundo de envíos OK (de la mitad al tope en ~10 s)
+        self.limit = min(float(self.max_limit), self.limit + 1.0 / self.limit)
+        if self.bucket is not None and self.bucket.rate < self.max_rate:
+            step = self.max_rate / 20
+            self.bucket.rate = min(self.max_rate, self.bucket.rate + step / self.bucket.rate)
+        self._publish()
+
+    def on_throttle(self, kind: str, after: Optional[float]) -> float:
+        """Registra un throttle de Meta; devuelve cuántos segundos esperar antes de reintentar."""
+        metrics.inc("whatsapp.rate_limit.throttled")
+        metrics.inc(f"whatsapp.rate_limit.throttled.{kind}")
+        if kind == "pair":
+            # límite del destinatario, no del remitente: no frenar a los demás
+            return after if after is not None else PAIR_WAIT
+        now = time.monotonic()
+        if now >= self._cut_until:
+            # una sola bajada por evento: los 429 de los envíos que ya iban en
+            # vuelo llegan juntos y no deben partir el ritmo varias veces
+            self.strikes += 1
+            self.limit = max(1.0, self.limit / 2)
+            if self.bucket is not None:
+                self.bucket.rate = max(self.min_rate, self.bucket.rate / 2)
+        wait = after if after is not None else min(MAX_BACKOFF, 2.0 ** (self.strikes - 1))
+        self._cut_until = max(self._cut_until, now + max(wait, 1.0))
+        if self.bucket is not None:
+            self.bucket.pause(wait)
+        self._publish()
+        return wait
+
+    def paused_for(self) -> float:
+        return self.bucket.paused_for() if self.bucket is not None else 0.0
+
+    def _publish(self) -> None:
+        metrics.set_gauge(f"whatsapp.rate_limit.{self.key}.concurrency", self.limit)
+        metrics.set_gauge(f"whatsapp.rate_limit.{self.key}.rate", self.rate)
+
+
+class ThrottleRegistry:
+    """Un AdaptiveThrottle por remitente (phone_number_id), creado al primer uso."""
+
+    def __init__(self, rate: float, burst: float, max_in_flight: int):
+        self.rate = rate
+        self.burst = burst
+        self.max_in_flight = max_in_flight
+        self._by_key: Dict[str, AdaptiveThrottle] = {}
+
+    def get(self, key: str) -> AdaptiveThrottle:
+        t = self._by_key.get(key)
+        if t is None:
+            t = self._by_key[key] = AdaptiveThrottle(key, self.rate, self.burst, self.max_in_flight)
+        return t
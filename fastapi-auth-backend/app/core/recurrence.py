@@ -0,0 +1,163 @@
+# app/core/recurrence.py
+
+import calendar
+import os
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone, tzinfo
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from app.core.ttl_cache import TTLCache
+
+# -------------------------------------------------------------------
+# Expansión de reglas de task_recurrence (DAILY / WEEKLY / MONTHLY)
+# -------------------------------------------------------------------
+# La task "semilla" es la ocurrencia 0; cada regla genera las siguientes a la
+# misma hora de pared que la semilla (en `tz`, UTC por defecto, así un
+# "todos los lunes 7:00" no se corre con el cambio de horario).
+# La expansión es perezosa y salta directo a la ventana pedida: pedir
+# 2031 de una regla diaria de 2024 no recorre los 7 años intermedios.
+MAX_OCCURRENCES = int(os.getenv("RECURRENCE_MAX_OCCURRENCES", "5000"))  # por regla y ventana
+RECURRENCE_CACHE_SIZE = int(os.getenv("RECURRENCE_CACHE_SIZE", "2048"))  # tasks con expansión en cache
+RECURRENCE_CACHE_TTL = float(os.getenv("RECURRENCE_CACHE_TTL", "3600"))
+_WINDOWS_PER_RULE = 16  # ventanas distintas cacheadas por task (vistas mes/semana/año)
+
+UTC = timezone.utc
+
+
+@dataclass(frozen=True)
+class Rule:
+    freq: str                          # DAILY | WEEKLY | MONTHLY
+    interval: int = 1
+    byweekday: Tuple[int, ...] = ()    # 0=Mon..6=Sun (solo WEEKLY)
+    until: Optional[date] = None       # inclusive, en la fecha local de `tz`
+
+    @classmethod
+    def from_row(cls, row: Dict[str, Any]) -> "Rule":
+        until = row.get("until")
+        if isinstance(until, str):
+            until = date.fromisoformat(until[:10])
+        return cls(
+            freq=(row.get("freq") or "DAILY").upper(),
+            interval=max(1, int(row.get("interval") or 1)),
+            byweekday=tuple(sorted(set(row.get("byweekday") or ()))),
+            until=until,
+        )
+
+
+def _dates(seed: date, rule: Rule, first: date, last: date) -> Iterator[date]:
+    """
+    Fechas de ocurrencia en [max(seed, first), last] (más alguna previa a
+    `first` del mismo periodo), sin recorrer desde la semilla.
+    """
+    first = max(first, seed)
+    if rule.until:
+        last = min(last, rule.until)
+    step = rule.interval
+
+    if rule.freq == "DAILY":
+        n = (first - seed).days // step
+        d = seed + timedelta(days=n * step)
+        while d <= last:
+            yield d
+            d += timedelta(days=step)
+
+    elif rule.freq == "WEEKLY":
+        days = rule.byweekday or (seed.weekday(),)
+        week0 = seed - timedelta(days=seed.weekday())  # lunes de la semana semilla
+        week = week0 + timedelta(weeks=(first - week0).days // 7 // step * step)
+        while week <= last:
+            for wd in days:
+                d = week + timedelta(days=wd)
+                if d > last:
+                    return
+                if d >= seed:
+                    yield d
+            week += timedelta(weeks=step)
+
+    elif rule.freq == "MONTHLY":
+        # Mismo día del mes que la semilla; los meses sin ese día (p.ej. 31) se saltan
+        base = seed.year * 12 + seed.month - 1
+        k = ((first.year * 12 + first.month - 1) - base) // step
+        while True:
+            y, m = divmod(base + k * step, 12)
+            if date(y, m + 1, 1) > last:
+                return
+            if seed.day <= calendar.monthrange(y, m + 1)[1]:
+                yield date(y, m + 1, seed.day)
+            k += 1
+
+    else:
+        raise ValueError(f"Unsupported freq: {rule.freq!r}")
+
+
+def occurrences(
+    seed_start: datetime,
+    rule: Rule,
+    start: datetime,
+    end: datetime,
+    tz: tzinfo = UTC,
+    limit: int = MAX_OCCURRENCES,
+) -> Iterator[datetime]:
+    """
+    Inicios (UTC, aware) de las ocurrencias dentro de [start, end], en orden.
+    Incluye la semilla si cae en la ventana. Perezoso: se puede cortar en
+    cualquier momento sin haber generado el resto.
+    """
+    local_seed = seed_start.astimezone(tz)
+    seed_day, wall = local_seed.date(), local_seed.time()
+    # un día de margen a cada lado: la fecha local de start/end depende del offset de tz
+    first = start.astimezone(tz).date() - timedelta(days=1)
+    last = end.astimezone(tz).date() + timedelta(days=1)
+    emitted = 0
+    for d in _dates(seed_day, rule, first, last):
+        occ = datetime.combine(d, wall, tzinfo=tz).astimezone(UTC)
+        if occ > end:
+            return
+        if occ < start:
+            continue
+        yield occ
+        emitted += 1
+        if emitted >= limit:
+            return
+
+
+# -------------------------------------------------------------------
+# Cache por regla (task_id) con invalidación explícita
+# -------------------------------------------------------------------
+# Valor: {(seed, rule, start, end, tz): tuple(ocurrencias)}. La regla y la
+# semilla van en la clave, así que una regla editada en otro proceso nunca
+# devuelve datos viejos; invalidate() libera la entrada al editar/borrar.
+_expansions = TTLCache("recurrence.expansions", maxsize=RECURRENCE_CACHE_SIZE, ttl=RECURRENCE_CACHE_TTL)
+
+
+def expand(
+    task_id: str,
+    seed_start: datetime,
+    rule: Rule,
+    start: datetime,
+    end: datetime,
+    tz: tzinfo = UTC,
+) -> Tuple[datetime, ...]:
+    """Como occurrences(), pero memoriza el resultado por (task_id, ventana)."""
+    key = (seed_start, rule, start, end, str(tz))
+    per_rule = _expansions.get(task_id) or {}
+    hit = per_rule.get(key)
+    if hit is not None:
+        return hit
+    occ = tuple(occurrences(seed_start, rule, start, end, tz))
+    per_rule = {**per_rule, key: occ}
+    if len(per_rule) > _WINDOWS_PER_RULE:
+        per_rule.pop(next(iter(per_rule)))
+    _expansions.set(task_id, per_rule)
+    return occ
+
+
+def invalidate(task_id: str) -> None:
+    """Llamar al crear/editar/borrar la regla de `task_id`."""
+    _expansions.invalidate(task_id)
+
+
+def parse_ts(value: str) -> datetime:
+    """ISO8601 → datetime aware (naive = UTC). ValueError si no parsea."""
+    dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return dt if dt.tzinfo else dt.replace(tzinfo=UTC)
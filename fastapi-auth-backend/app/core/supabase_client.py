@@ -1,15 +1,27 @@
 # app/core/supabase_client.py
 
 import os
-from typing import Optional
+import itertools
+import importlib.util
+from contextvars import ContextVar
+from typing import List, Optional
 
+import httpx
 from fastapi import Request
+from postgrest import AsyncPostgrestClient, SyncPostgrestClient
+from postgrest.constants import DEFAULT_POSTGREST_CLIENT_HEADERS
 from supabase import create_client, Client
 
 SUPABASE_URL = os.getenv("SUPABASE_URL", "").rstrip("/")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY", "")
 SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY", "")  # opcional (privilegiado)
 
+# Pool HTTP compartido hacia PostgREST (tunables por entorno)
+POOL_MAX_CONNECTIONS = int(os.getenv("SUPABASE_POOL_MAX_CONNECTIONS", "100"))
+POOL_MAX_KEEPALIVE = int(os.getenv("SUPABASE_POOL_MAX_KEEPALIVE", "20"))
+POOL_KEEPALIVE_EXPIRY = float(os.getenv("SUPABASE_POOL_KEEPALIVE_EXPIRY", "30"))
+HTTP_TIMEOUT = float(os.getenv("SUPABASE_HTTP_TIMEOUT", "30"))
+
 if not SUPABASE_URL or not SUPABASE_KEY:
     raise RuntimeError("Faltan SUPABASE_URL/SUPABASE_KEY en .env")
 
@@ -23,6 +35,136 @@ if SUPABASE_SERVICE_ROLE_KEY and SUPABASE_SERVICE_ROLE_KEY != SUPABASE_KEY:
 else:
     _service_client = _base_client
 
+# -------------------------------------------------------------------
+# Transporte PostgREST compartido por todo el proceso
+# -------------------------------------------------------------------
+# Un solo pool de conexiones (keep-alive + HTTP/2 si 'h2' está instalado).
+# Las vistas por request solo cambian headers; el TLS se negocia una vez por conexión.
+_REST_URL = f"{SUPABASE_URL}/rest/v1"
+_HTTP2 = importlib.util.find_spec("h2") is not None
+
+_rest_transport = httpx.HTTPTransport(
+    http2=_HTTP2,
+    limits=httpx.Limits(
+        max_connections=POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=POOL_MAX_KEEPALIVE,
+        keepalive_expiry=POOL_KEEPALIVE_EXPIRY,
+    ),
+    retries=1,  # reintenta solo fallos de conexión (p.ej. keep-alive cerrado por el server)
+)
+
+
+# -------------------------------------------------------------------
+# Conteo de round trips a PostgREST por request
+# -------------------------------------------------------------------
+# El middleware de main.py abre una "caja" por request (track_round_trips) y
+# los event hooks de httpx la incrementan en cada request HTTP a PostgREST.
+# Fuera de un request HTTP (workers, scripts) no se cuenta nada.
+_round_trips: ContextVar[Optional[List[int]]] = ContextVar("postgrest_round_trips", default=None)
+
+
+def track_round_trips() -> List[int]:
+    """Empieza a contar round trips en el contexto actual; devuelve [n]."""
+    box = [0]
+    _round_trips.set(box)
+    return box
+
+
+def _count_round_trip(_request: httpx.Request) -> None:
+    box = _round_trips.get()
+    if box is not None:
+        box[0] += 1
+
+
+async def _acount_round_trip(request: httpx.Request) -> None:
+    _count_round_trip(request)
+
+
+def _rest_headers(token: Optional[str]) -> dict:
+    return {
+        **DEFAULT_POSTGREST_CLIENT_HEADERS,
+        "apikey": SUPABASE_KEY,
+        "Authorization": f"Bearer {token or SUPABASE_KEY}",
+    }
+
+
+def _rest_view(token: Optional[str]) -> SyncPostgrestClient:
+    """
+    Vista PostgREST ligera con los headers de un token, montada sobre el pool compartido.
+    Crearla no abre sockets ni construye auth/storage/realtime; no la cierres
+    (cerrarla cerraría el transporte compartido) y no llames .auth() sobre ella.
+    """
+    headers = _rest_headers(token)
+    http = httpx.Client(
+        base_url=_REST_URL,
+        headers=headers,
+        transport=_rest_transport,
+        timeout=HTTP_TIMEOUT,
+        follow_redirects=True,
+        trust_env=False,  # evita crear transportes de proxy por request
+        event_hooks={"request": [_count_round_trip]},
+    )
+    return SyncPostgrestClient(_REST_URL, headers=headers, http_client=http)
+
+
+# Variante async: mismo esquema (un pool por proceso, vistas baratas por token).
+# El pool se reparte en shards: httpcore recorre conexiones x requests en cola en
+# cada evento, lo que con cientos de requests concurrentes en UN pool se vuelve
+# O(n^2) en CPU. Varios pools pequeños (round-robin) mantienen ese costo acotado.
+# Se crean perezosamente dentro del event loop que los usa (uvicorn).
+ASYNC_POOL_SHARDS = max(1, int(os.getenv("SUPABASE_ASYNC_POOL_SHARDS", "8")))
+
+_async_rest_transports: List[httpx.AsyncHTTPTransport] = []
+_async_shard = itertools.count()
+
+
+def _get_async_transport() -> httpx.AsyncHTTPTransport:
+    if not _async_rest_transports:
+        per_shard = max(1, -(-POOL_MAX_CONNECTIONS // ASYNC_POOL_SHARDS))
+        keepalive = max(1, -(-POOL_MAX_KEEPALIVE // ASYNC_POOL_SHARDS))
+        _async_rest_transports.extend(
+            httpx.AsyncHTTPTransport(
+                http2=_HTTP2,
+                limits=httpx.Limits(
+                    max_connections=per_shard,
+                    max_keepalive_connections=keepalive,
+                    keepalive_expiry=POOL_KEEPALIVE_EXPIRY,
+                ),
+                retries=1,
+            )
+            for _ in range(ASYNC_POOL_SHARDS)
+        )
+    return _async_rest_transports[next(_async_shard) % len(_async_rest_transports)]
+
+
+def _async_rest_view(token: Optional[str], apikey: str = SUPABASE_KEY) -> AsyncPostgrestClient:
+    """
+    Igual que _rest_view pero no bloqueante: `await sb.table(...)...execute()`.
+    """
+    headers = {**_rest_headers(token), "apikey": apikey}
+    http = httpx.AsyncClient(
+        base_url=_REST_URL,
+        headers=headers,
+        transport=_get_async_transport(),
+        timeout=HTTP_TIMEOUT,
+        follow_redirects=True,
+        trust_env=False,
+        event_hooks={"request": [_acount_round_trip]},
+    )
+    return AsyncPostgrestClient(_REST_URL, headers=headers, http_client=http)
+
+
+def close_pools() -> None:
+    """Cierra el pool PostgREST compartido (llamar en el shutdown de la app)."""
+    _rest_transport.close()
+
+
+async def aclose_pools() -> None:
+    """Cierra ambos pools (sync y async) desde el event loop."""
+    close_pools()
+    while _async_rest_transports:
+        await _async_rest_transports.pop().aclose()
+
 
 def _extract_bearer_token(request: Request) -> Optional[str]:
     """
@@ -63,25 +205,45 @@ def get_request_token(request: Request) -> Optional[str]:
     return _extract_bearer_token(request)
 
 
-def get_supabase_for_request(request: Request) -> Client:
+def get_supabase_for_token(token: Optional[str]) -> SyncPostgrestClient:
+    """
+    Vista PostgREST autorizada con `token` (RLS) sobre el pool compartido.
+    Sin token usa la anon key.
     """
-    Devuelve un CLIENTE de Supabase clonado y autorizado con el token del request
-    para que respete RLS. **Devuelve SOLO el cliente** (no una tupla),
-    manteniendo compatibilidad con tus routers (sb.table(...)).
+    return _rest_view(token)
 
-    En supabase-py v2 se autoriza PostgREST así:
-        sb.postgrest.auth(token)
+
+def get_supabase_for_request(request: Request) -> SyncPostgrestClient:
+    """
+    Devuelve una vista PostgREST autorizada con el token del request
+    para que respete RLS. Expone la misma API que usan los routers
+    (sb.table(...), sb.rpc(...)), pero reutiliza el pool HTTP del proceso
+    en lugar de crear un cliente Supabase completo por request.
     """
-    token = _extract_bearer_token(request)
+    return _rest_view(_extract_bearer_token(request))
 
-    # Clonar un cliente por request evita compartir estado de auth entre peticiones
-    sb = create_client(SUPABASE_URL, SUPABASE_KEY)
 
-    if token:
-        # Autorizar PostgREST (RLS) con el token del usuario
-        sb.postgrest.auth(token)
+# -------------------------------------------------------------------
+# Acceso async (routers `async def`)
+# -------------------------------------------------------------------
+def get_async_supabase_for_token(token: Optional[str]) -> AsyncPostgrestClient:
+    """
+    Vista PostgREST async autorizada con `token` (RLS) sobre el pool compartido.
+    """
+    return _async_rest_view(token)
+
+
+def get_async_supabase_for_request(request: Request) -> AsyncPostgrestClient:
+    """
+    Versión async de get_supabase_for_request: no ocupa un hilo del threadpool
+    mientras espera a PostgREST.
+    """
+    return _async_rest_view(_extract_bearer_token(request))
 
-        # Si usas Storage con permisos por usuario:
-        # sb.storage.auth(token)
 
-    return sb
+def get_async_service_supabase() -> AsyncPostgrestClient:
+    """
+    Vista PostgREST async con Service Role (o la anon key si no está configurada).
+    """
+    key = SUPABASE_SERVICE_ROLE_KEY or SUPABASE_KEY
+    return _async_rest_view(key, apikey=key)
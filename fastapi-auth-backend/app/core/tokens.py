@@ -0,0 +1,66 @@
+# app/core/tokens.py
+
+import functools
+import importlib.util
+import math
+import os
+import re
+from typing import Dict, List, Sequence
+
+# -------------------------------------------------------------------
+# Conteo local de tokens (presupuestos de contexto del chat)
+# -------------------------------------------------------------------
+# Con `tiktoken` instalado se usa el encoding de gpt-4o / gpt-4o-mini
+# (CHAT_TOKENIZER, o200k_base por defecto); sin él, una estimación por regex
+# (palabras de hasta ~6 letras = 1 token, números de 3 dígitos, 1 por signo) que
+# en español queda dentro de ~10-15% del valor real. Los conteos se cachean
+# por texto: el resumen y los turnos de la ventana se repiten en cada request.
+ENCODING = os.getenv("CHAT_TOKENIZER", "o200k_base")
+MESSAGE_OVERHEAD = 3  # tokens por mensaje (rol + separadores) en el formato de chat
+REPLY_PRIMING = 3
+
+_HAS_TIKTOKEN = importlib.util.find_spec("tiktoken") is not None
+_WORD = re.compile(r"[^\W\d_]+|\d{1,3}|[^\w\s]|_", re.UNICODE)
+
+
+@functools.lru_cache(maxsize=1)
+def _encoding():
+    import tiktoken
+
+    return tiktoken.get_encoding(ENCODING)
+
+
+def _estimate(text: str) -> int:
+    n = 0
+    for m in _WORD.finditer(text):
+        n += math.ceil(len(m.group()) / 6) if m.group()[0].isalpha() else 1
+    return n
+
+
+@functools.lru_cache(maxsize=8192)
+def count(text: str) -> int:
+    if not text:
+        return 0
+    if _HAS_TIKTOKEN:
+        return len(_encoding().encode(text, disallowed_special=()))
+    return _estimate(text)
+
+
+def count_messages(messages: Sequence[Dict[str, str]]) -> int:
+    """Tokens de prompt de una lista de mensajes {"role", "content"} (sin tools)."""
+    return REPLY_PRIMING + sum(MESSAGE_OVERHEAD + count(m.get("content") or "") for m in messages)
+
+
+def tail(text: str, max_tokens: int) -> str:
+    """Lo último de `text` que entra en `max_tokens` (cortando por palabras)."""
+    if count(text) <= max_tokens:
+        return text
+    words: List[str] = text.split(" ")
+    lo, hi = 0, len(words)  # menor inicio cuyo sufijo entra
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if count(" ".join(words[mid:])) <= max_tokens:
+            hi = mid
+        else:
+            lo = mid + 1
+    return " ".join(words[lo:])
@@ -0,0 +1,256 @@
+# app/core/wa_templates.py
+
+import json
+import os
+import re
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+
+from app.core import metrics
+
+# -------------------------------------------------------------------
+# Templates de WhatsApp: esquema por template + renderers compilados
+# -------------------------------------------------------------------
+# Cada template aprobado en Meta tiene un esquema fijo: cuántos parámetros
+# lleva el header, el body y cada botón URL. El registro los carga UNA vez
+# (los de abajo + WA_TEMPLATES_FILE, el JSON que devuelve
+# GET /{waba_id}/message_templates) y compila un Renderer por (template, idioma):
+# el esqueleto del payload, `language` y los componentes sin parámetros se
+# arman al compilar y se comparten; render() solo llena los textos.
+#
+# Validación al renderizar:
+#   - cantidad exacta de parámetros por componente (si no, TemplateError)
+#   - ningún parámetro vacío: Meta rechaza vacíos, saltos de línea, tabs y
+#     más de 4 espacios seguidos; un texto así se colapsa (los textos ya
+#     válidos pasan tal cual) y un vacío pasa a EMPTY_PARAM
+#
+# Los parámetros se nombran por campo (title, start, ... ver task_fields) para
+# que routers y workers armen el payload desde la tarea con la misma función.
+TEMPLATES_FILE = os.getenv("WA_TEMPLATES_FILE", "")  # opcional: export de message_templates
+DIGEST_TEMPLATE = os.getenv("WA_DIGEST_TEMPLATE", "rm_task_digest")  # ver app/worker/channels.py
+EMPTY_PARAM = "-"
+
+# Campos por posición ({{1}}, {{2}}, ...) de los templates que usa la app
+_BUILTIN: Dict[str, Dict[str, Tuple[str, ...]]] = {
+    "rm_task_summary": {
+        "header": ("header",),
+        "body": ("title", "start", "end", "tz", "tag", "status", "description"),
+    },
+    DIGEST_TEMPLATE: {
+        "header": ("header",),
+        "body": ("count", "list", "tz"),
+    },
+    "hello_world": {},
+}
+# Templates sin esquema conocido: body compacto de 4 parámetros
+_FALLBACK_BODY = ("title", "when", "tag_status", "description")
+# Para templates del archivo sin "fields": body en este orden
+_GENERIC_BODY = _FALLBACK_BODY + ("start", "end", "tz", "tag", "status")
+
+_PLACEHOLDER = re.compile(r"\{\{\s*(\d+)\s*\}\}")
+
+
+class TemplateError(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class TemplateSchema:
+    name: str
+    header: Tuple[str, ...] = ()
+    body: Tuple[str, ...] = ()
+    buttons: Tuple[Tuple[int, Tuple[str, ...]], ...] = ()  # (index, campos) de botones URL con parámetro
+
+
+def fmt_ts(ts: Any, fmt: str = "%Y-%m-%d %H:%M") -> str:
+    if not ts:
+        return ""
+    try:
+        return datetime.fromisoformat(str(ts).replace("Z", "+00:00")).strftime(fmt)
+    except Exception:
+        return str(ts)
+
+
+def task_fields(
+    task: Mapping[str, Any],
+    header_hint: Optional[str] = None,
+    tz_hint: Optional[str] = None,
+    button_text: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Campos de template a partir de una tarea (o task_snapshot); los vacíos los resuelve el renderer."""
+    start = fmt_ts(task.get("start_ts"))
+    end = fmt_ts(task.get("end_ts")) or start
+    tag = task.get("tag") or "Other"
+    status = task.get("status") or "pending"
+    return {
+        "header": header_hint,
+        "title": task.get("title") or "(no title)",
+        "start": start,
+        "end": end,
+        "tz": tz_hint,
+        "tag": tag,
+        "status": status,
+        "description": task.get("description"),
+        "when": f"{start} — {end}" if start else "",
+        "tag_status": f"{tag} / {status}",
+        "button": button_text or task.get("id"),
+    }
+
+
+def _clean(value: Any) -> str:
+    if value.__class__ is str and value and value.isprintable() and "    " not in value and value.strip() == value:
+        return value  # caso común: ya es un texto válido
+    if value is None:
+        return EMPTY_PARAM
+    text = " ".join(str(value).split())  # sin \n / \t / rachas de espacios
+    return text or EMPTY_PARAM
+
+
+class Renderer:
+    """Payload de /messages para un template e idioma; se crea con registry().renderer()."""
+
+    def __init__(self, schema: TemplateSchema, lang_code: str):
+        self.schema = schema
+        self.lang_code = lang_code
+        # estático, compartido entre payloads (no mutar lo que devuelve render)
+        self._template_head = {"name": schema.name, "language": {"code": lang_code}}
+        # (parte, cabecera del componente, campos) en el orden en que van al payload
+        plan = []
+        if schema.header:
+            plan.append(("header", {"type": "header"}, schema.header))
+        if schema.body:
+            plan.append(("body", {"type": "body"}, schema.body))
+        for idx, fields in schema.buttons:
+            plan.append((f"button {idx}", {"type": "button", "sub_type": "url", "index": str(idx)}, fields))
+        self._plan = tuple(plan)
+        self._message_head = {"messaging_product": "whatsapp", "type": "template"}
+
+    def _check(self, part: str, got: Sequence[Any], want: int) -> None:
+        if len(got) != want:
+            raise TemplateError(f"{self.schema.name}: {part} espera {want} parámetros, llegaron {len(got)}")
+
+    def _message(self, to: str, components: List[Dict[str, Any]]) -> Dict[str, Any]:
+        metrics.inc("whatsapp.templates.rendered")
+        template = {**self._template_head, "components": components} if components else self._template_head
+        return {**self._message_head, "to": to, "template": template}
+
+    def render(
+        self,
+        to: str,
+        header: Sequence[Any] = (),
+        body: Sequence[Any] = (),
+        buttons: Sequence[Sequence[Any]] = (),
+    ) -> Dict[str, Any]:
+        """Parámetros posicionales (textos) por componente; `buttons`: uno por botón URL del esquema, en orden."""
+        schema = self.schema
+        self._check("header", header, len(schema.header))
+        self._check("body", body, len(schema.body))
+        self._check("buttons", buttons, len(schema.buttons))
+        given = ([header] if schema.header else []) + ([body] if schema.body else []) + list(buttons)
+        components = []
+        for (part, head, fields), texts in zip(self._plan, given):
+            self._check(part, texts, len(fields))
+            components.append({**head, "parameters": [{"type": "text", "text": _clean(t)} for t in texts]})
+        return self._message(to, components)
+
+    def render_fields(self, to: str, values: Mapping[str, Any]) -> Dict[str, Any]:
+        """Igual que render pero por nombre de campo (ver task_fields); la cantidad la da el esquema."""
+        get = values.get
+        return self._message(to, [
+            {**head, "parameters": [{"type": "text", "text": _clean(get(f))} for f in fields]}
+            for _, head, fields in self._plan
+        ])
+
+
+# -------------------------------------------------------------------
+# Registro (singleton por proceso)
+# -------------------------------------------------------------------
+def _count(text: Optional[str]) -> int:
+    return max((int(m) for m in _PLACEHOLDER.findall(text or "")), default=0)
+
+
+def _names(given: Sequence[str], default: Sequence[str], n: int) -> Tuple[str, ...]:
+    """n nombres de campo: los de `fields`, luego los default, luego p<posición>."""
+    return tuple(
+        given[i] if i < len(given) else default[i] if i < len(default) else f"p{i + 1}" for i in range(n)
+    )
+
+
+def _from_meta(t: Dict[str, Any]) -> TemplateSchema:
+    """Esquema desde el formato de Graph (components con {{n}}); `fields` opcional nombra las posiciones."""
+    fields = t.get("fields") or {}
+    header = body = 0
+    buttons: List[Tuple[int, int]] = []
+    for c in t.get("components") or []:
+        kind = (c.get("type") or "").upper()
+        if kind == "HEADER" and (c.get("format") or "TEXT").upper() == "TEXT":
+            header = _count(c.get("text"))
+        elif kind == "BODY":
+            body = _count(c.get("text"))
+        elif kind == "BUTTONS":
+            for i, b in enumerate(c.get("buttons") or []):
+                if (b.get("type") or "").upper() == "URL" and _count(b.get("url")):
+                    buttons.append((i, _count(b.get("url"))))
+    named_buttons = fields.get("buttons") or []
+    return TemplateSchema(
+        name=t["name"],
+        header=_names(fields.get("header") or (), ("header",), header),
+        body=_names(fields.get("body") or (), _GENERIC_BODY, body),
+        buttons=tuple(
+            (idx, _names(named_buttons[k] if k < len(named_buttons) else (), ("button",), n))
+            for k, (idx, n) in enumerate(buttons)
+        ),
+    )
+
+
+class TemplateRegistry:
+    def __init__(self, path: str = TEMPLATES_FILE):
+        self.path = path
+        self._schemas: Optional[Dict[Tuple[str, str], TemplateSchema]] = None
+        self._renderers: Dict[Tuple[str, str], Renderer] = {}
+        self._lock = threading.Lock()
+
+    def _load(self) -> Dict[Tuple[str, str], TemplateSchema]:
+        schemas = {
+            (name, ""): TemplateSchema(name, spec.get("header", ()), spec.get("body", ()))
+            for name, spec in _BUILTIN.items()
+        }
+        if self.path:
+            with open(self.path, encoding="utf-8") as f:
+                raw = json.load(f)
+            for t in raw.get("data", []) if isinstance(raw, dict) else raw:
+                if (t.get("status") or "APPROVED").upper() != "APPROVED":
+                    continue
+                schemas[(t["name"], t.get("language") or "")] = _from_meta(t)
+        return schemas
+
+    def schema(self, name: str, lang_code: str = "") -> Optional[TemplateSchema]:
+        if self._schemas is None:
+            with self._lock:
+                if self._schemas is None:
+                    self._schemas = self._load()
+        return self._schemas.get((name, lang_code)) or self._schemas.get((name, ""))
+
+    def renderer(self, name: str, lang_code: str) -> Renderer:
+        key = (name, lang_code)
+        r = self._renderers.get(key)
+        if r is None:
+            schema = self.schema(name, lang_code) or TemplateSchema(name, body=_FALLBACK_BODY)
+            r = self._renderers[key] = Renderer(schema, lang_code)
+        return r
+
+
+_registry: Optional[TemplateRegistry] = None
+
+
+def registry() -> TemplateRegistry:
+    global _registry
+    if _registry is None:
+        _registry = TemplateRegistry()
+    return _registry
+
+
+def renderer(name: str, lang_code: str) -> Renderer:
+    return registry().renderer(name, lang_code)
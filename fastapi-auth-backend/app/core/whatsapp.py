@@ -1,18 +1,208 @@
 # app/core/whatsapp.py
 
 import os
+import ssl
+import asyncio
+import itertools
+import threading
+import importlib.util
 import httpx
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple
+
+from app.core import metrics, rate_limit
 
 META_WA_TOKEN = os.getenv("META_WA_TOKEN", "")
 META_WA_PHONE_ID = os.getenv("META_WA_PHONE_ID", "")
+# v19.0 estable; cambia si tu app usa otra versión (o apunta a un mock local)
+META_WA_GRAPH_URL = os.getenv("META_WA_GRAPH_URL", "https://graph.facebook.com/v19.0").rstrip("/")
+
+# Pool HTTP compartido hacia Graph API (tunables por entorno)
+GRAPH_MAX_CONNECTIONS = int(os.getenv("META_WA_POOL_MAX_CONNECTIONS", "100"))
+GRAPH_MAX_KEEPALIVE = int(os.getenv("META_WA_POOL_MAX_KEEPALIVE", "64"))  # >= envíos simultáneos, o se abren y cierran conexiones
+GRAPH_KEEPALIVE_EXPIRY = float(os.getenv("META_WA_POOL_KEEPALIVE_EXPIRY", "60"))
+GRAPH_TIMEOUT = float(os.getenv("META_WA_HTTP_TIMEOUT", "30"))
+GRAPH_CA_BUNDLE = os.getenv("META_WA_CA_BUNDLE", "")  # opcional: CA propia (proxy corporativo, mock TLS local)
+GRAPH_POOL_SHARDS = max(1, int(os.getenv("META_WA_POOL_SHARDS", "8")))
+
+# Rate limit por phone_number_id (ver app/core/rate_limit.py). Meta da 80 msg/s
+# por número por defecto; súbelo si tu número tiene un tier mayor. 0 = sin bucket.
+RATE_PER_SECOND = float(os.getenv("META_WA_RATE_PER_SECOND", "80"))
+RATE_BURST = float(os.getenv("META_WA_RATE_BURST", "0") or 0) or max(1.0, RATE_PER_SECOND)
+MAX_IN_FLIGHT = int(os.getenv("META_WA_MAX_IN_FLIGHT", "64"))  # techo del límite adaptativo de envíos en vuelo
+THROTTLE_RETRIES = int(os.getenv("META_WA_THROTTLE_RETRIES", "2"))  # reintentos internos ante un throttle
+THROTTLE_MAX_WAIT = float(os.getenv("META_WA_THROTTLE_MAX_WAIT", "30"))  # más que esto: se devuelve al caller
+
+_HTTP2 = importlib.util.find_spec("h2") is not None
 
 class WhatsAppError(Exception):
     pass
 
-def _graph_url(path: str) -> str:
-    # v19.0 estable; cambia si tu app usa otra versión
-    return f"https://graph.facebook.com/v19.0/{path.lstrip('/')}"
+class WhatsAppThrottled(WhatsAppError):
+    """Meta limitó el envío (429 / código de rate limit); reintentar después de `retry_after` s."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+# -------------------------------------------------------------------
+# Cliente Graph compartido por todo el proceso
+# -------------------------------------------------------------------
+# Un solo httpx.AsyncClient (keep-alive + HTTP/2 si 'h2' está instalado) que
+# vive en un event loop propio, en un hilo daemon. Así lo comparten el código
+# async (cualquier loop: uvicorn, worker) y el síncrono (routers `def`, hilos
+# del worker): DNS + TCP + TLS se pagan una vez por conexión, no por mensaje.
+# Igual que el pool async de supabase_client, se reparte en shards round-robin
+# (un solo pool de httpcore se degrada con decenas de requests en vuelo).
+# Cada envío pasa por el throttle de su remitente (token bucket + límite
+# adaptativo); un throttle de Meta se reintenta aquí mismo (THROTTLE_RETRIES)
+# si la espera es corta, sin que el caller lo vea como error.
+# El loop se crea perezosamente y se rehace si el proceso hizo fork.
+class GraphClient:
+    def __init__(
+        self,
+        base_url: str = META_WA_GRAPH_URL,
+        max_connections: int = GRAPH_MAX_CONNECTIONS,
+        max_keepalive: int = GRAPH_MAX_KEEPALIVE,
+        keepalive_expiry: float = GRAPH_KEEPALIVE_EXPIRY,
+        timeout: float = GRAPH_TIMEOUT,
+        http2: bool = _HTTP2,
+        ca_bundle: str = GRAPH_CA_BUNDLE,
+        shards: int = GRAPH_POOL_SHARDS,
+        rate: float = RATE_PER_SECOND,
+        burst: float = RATE_BURST,
+        max_in_flight: int = MAX_IN_FLIGHT,
+        throttle_retries: int = THROTTLE_RETRIES,
+        throttle_max_wait: float = THROTTLE_MAX_WAIT,
+    ):
+        self.base_url = base_url.rstrip("/") + "/"
+        self.shards = max(1, shards)
+        self.limits = httpx.Limits(
+            max_connections=max(1, -(-max_connections // self.shards)),
+            max_keepalive_connections=max(1, -(-max_keepalive // self.shards)),
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.timeout = timeout
+        self.http2 = http2
+        self.verify = ssl.create_default_context(cafile=ca_bundle) if ca_bundle else True
+        self.throttles = rate_limit.ThrottleRegistry(rate, burst, max_in_flight)
+        self.throttle_retries = throttle_retries
+        self.throttle_max_wait = throttle_max_wait
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._clients: List[httpx.AsyncClient] = []
+        self._next = itertools.count()
+        self._pid: Optional[int] = None
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        if self._loop is not None and self._pid == os.getpid():
+            return self._loop
+        with self._lock:
+            if self._loop is None or self._pid != os.getpid():
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="graph-client", daemon=True).start()
+                self._loop, self._clients, self._pid = loop, [], os.getpid()
+                # las primitivas asyncio del throttle quedan ligadas al loop: rehacerlas
+                old = self.throttles
+                self.throttles = rate_limit.ThrottleRegistry(old.rate, old.burst, old.max_in_flight)
+        return self._loop
+
+    def _http(self) -> httpx.AsyncClient:
+        # solo se llama dentro del loop propio: las conexiones quedan ligadas a él
+        if not self._clients:
+            self._clients = [
+                httpx.AsyncClient(
+                    base_url=self.base_url,
+                    http2=self.http2,
+                    limits=self.limits,
+                    timeout=self.timeout,
+                    verify=self.verify,
+                    trust_env=False,
+                )
+                for _ in range(self.shards)
+            ]
+        return self._clients[next(self._next) % self.shards]
+
+    async def _send(self, path: str, payload: Dict[str, Any]) -> Tuple[int, Any, httpx.Headers]:
+        metrics.inc("graph.requests")
+        try:
+            r = await self._http().post(
+                path.lstrip("/"), json=payload, headers={"Authorization": f"Bearer {META_WA_TOKEN}"}
+            )
+        except httpx.HTTPError:
+            metrics.inc("graph.errors")
+            raise
+        try:
+            data = r.json()
+        except ValueError:
+            data = {"error": "Invalid JSON response", "status_code": r.status_code, "text": r.text}
+        if r.status_code >= 300:
+            metrics.inc("graph.errors")
+        return r.status_code, data, r.headers
+
+    async def _post(self, path: str, payload: Dict[str, Any]) -> Tuple[int, Any]:
+        throttle = self.throttles.get(path.lstrip("/").split("/", 1)[0])  # phone_number_id
+        for attempt in range(self.throttle_retries + 1):
+            async with throttle:
+                status, data, headers = await self._send(path, payload)
+            kind = rate_limit.classify(status, data)
+            if kind is None:
+                if status < 300:
+                    throttle.on_success()
+                return status, data
+            wait = throttle.on_throttle(kind, rate_limit.retry_after(headers))
+            if attempt == self.throttle_retries or wait > self.throttle_max_wait:
+                break
+            metrics.inc("whatsapp.rate_limit.retries")
+            if kind == "pair":
+                await asyncio.sleep(wait)  # el bucket del remitente no se pausó
+        return status, data
+
+    def paused_for(self, phone_id: str) -> float:
+        """Segundos que le quedan de pausa al remitente (0 si no está limitado)."""
+        return self.throttles.get(phone_id).paused_for()
+
+    def post(self, path: str, payload: Dict[str, Any]) -> Tuple[int, Any]:
+        """POST bloqueante (routers `def`, hilos). No lo llames desde un event loop: usa apost."""
+        return asyncio.run_coroutine_threadsafe(self._post(path, payload), self._ensure_loop()).result()
+
+    async def apost(self, path: str, payload: Dict[str, Any]) -> Tuple[int, Any]:
+        """POST desde cualquier event loop; la conexión la maneja el loop del cliente."""
+        fut = asyncio.run_coroutine_threadsafe(self._post(path, payload), self._ensure_loop())
+        return await asyncio.wrap_future(fut)
+
+    def close(self) -> None:
+        loop, clients = self._loop, self._clients
+        if loop is None or self._pid != os.getpid():
+            return
+        for client in clients:
+            asyncio.run_coroutine_threadsafe(client.aclose(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        self._loop, self._clients = None, []
+
+
+_graph: Optional[GraphClient] = None
+_graph_lock = threading.Lock()
+
+def graph() -> GraphClient:
+    global _graph
+    if _graph is None:
+        with _graph_lock:
+            if _graph is None:
+                _graph = GraphClient()
+    return _graph
+
+def _messages_path() -> str:
+    return f"{META_WA_PHONE_ID}/messages"
+
+def _check(status: int, data: Any) -> Dict[str, Any]:
+    if status >= 300:
+        kind = rate_limit.classify(status, data)
+        if kind == "pair":
+            raise WhatsAppThrottled(f"WA pair rate limit {status}: {data}", rate_limit.PAIR_WAIT)
+        if kind == "throttle":
+            raise WhatsAppThrottled(f"WA throttled {status}: {data}", max(1.0, graph().paused_for(META_WA_PHONE_ID)))
+        raise WhatsAppError(f"WA error {status}: {data}")
+    return data
 
 def send_text(to_e164: str, body_text: str) -> Dict[str, Any]:
     if not META_WA_TOKEN or not META_WA_PHONE_ID:
@@ -24,14 +214,7 @@ def send_text(to_e164: str, body_text: str) -> Dict[str, Any]:
         "type": "text",
         "text": {"body": body_text},
     }
-    headers = {"Authorization": f"Bearer {META_WA_TOKEN}"}
-
-    with httpx.Client(timeout=30) as client:
-        r = client.post(_graph_url(f"{META_WA_PHONE_ID}/messages"), json=payload, headers=headers)
-        data = r.json()
-        if r.status_code >= 300:
-            raise WhatsAppError(f"WA error {r.status_code}: {data}")
-        return data
+    return _check(*graph().post(_messages_path(), payload))
 
 def send_template_positional(
     to_e164: str,
@@ -45,6 +228,41 @@ def send_template_positional(
     Envia un template en modo POSITIONAL (como 'rm_task_summary').
     header_params/body_params/button_params son listas de objetos {"type":"text","text":"..."} en orden.
     """
+    payload = _template_payload(to_e164, template_name, lang_code, header_params, body_params, button_params)
+    return _check(*graph().post(_messages_path(), payload))
+
+async def asend_template_positional(
+    to_e164: str,
+    template_name: str,
+    lang_code: str,
+    header_params: Optional[List[Dict[str, str]]] = None,
+    body_params: Optional[List[Dict[str, str]]] = None,
+    button_params: Optional[List[Dict[str, str]]] = None,
+) -> Dict[str, Any]:
+    """Igual que send_template_positional pero no bloqueante (mismo pool compartido)."""
+    payload = _template_payload(to_e164, template_name, lang_code, header_params, body_params, button_params)
+    return _check(*await graph().apost(_messages_path(), payload))
+
+def send_payload(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Envía un payload de /messages ya armado (p.ej. app.core.wa_templates.Renderer.render)."""
+    if not META_WA_TOKEN or not META_WA_PHONE_ID:
+        raise WhatsAppError("Faltan META_WA_TOKEN/META_WA_PHONE_ID en .env")
+    return _check(*graph().post(_messages_path(), payload))
+
+async def asend_payload(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Igual que send_payload pero no bloqueante."""
+    if not META_WA_TOKEN or not META_WA_PHONE_ID:
+        raise WhatsAppError("Faltan META_WA_TOKEN/META_WA_PHONE_ID en .env")
+    return _check(*await graph().apost(_messages_path(), payload))
+
+def _template_payload(
+    to_e164: str,
+    template_name: str,
+    lang_code: str,
+    header_params: Optional[List[Dict[str, str]]],
+    body_params: Optional[List[Dict[str, str]]],
+    button_params: Optional[List[Dict[str, str]]],
+) -> Dict[str, Any]:
     if not META_WA_TOKEN or not META_WA_PHONE_ID:
         raise WhatsAppError("Faltan META_WA_TOKEN/META_WA_PHONE_ID en .env")
 
@@ -57,7 +275,7 @@ def send_template_positional(
         # Para QUICK_REPLY no se pasan parámetros; para URL parametrizable sí.
         components.append({"type": "button", "sub_type": "url", "index": "0", "parameters": button_params})
 
-    payload = {
+    return {
         "messaging_product": "whatsapp",
         "to": to_e164,
         "type": "template",
@@ -67,11 +285,3 @@ def send_template_positional(
             "components": components,
         },
     }
-    headers = {"Authorization": f"Bearer {META_WA_TOKEN}"}
-
-    with httpx.Client(timeout=30) as client:
-        r = client.post(_graph_url(f"{META_WA_PHONE_ID}/messages"), json=payload, headers=headers)
-        data = r.json()
-        if r.status_code >= 300:
-            raise WhatsAppError(f"WA error {r.status_code}: {data}")
-        return data
@@ -0,0 +1,37 @@
+# app/core/writes.py
+
+from typing import Any, Dict, Optional
+
+# -------------------------------------------------------------------
+# Escrituras PostgREST en UN round trip
+# -------------------------------------------------------------------
+# insert()/update()/upsert() de postgrest-py ya mandan
+# `Prefer: return=representation`, así que la respuesta trae las filas
+# escritas. No hace falta (ni se puede en v2) encadenar .select(), y
+# tampoco releer con un SELECT aparte: basta con tomar `res.data`.
+
+
+def first_row(res) -> Optional[Dict[str, Any]]:
+    """Primera fila de una respuesta PostgREST (o None si vino vacía)."""
+    data = getattr(res, "data", None)
+    if isinstance(data, list):
+        return data[0] if data else None
+    return data or None
+
+
+async def write_returning(builder) -> Optional[Dict[str, Any]]:
+    """
+    Ejecuta un insert/update/upsert y devuelve la fila escrita tal cual
+    la devolvió PostgREST. None = 0 filas (no existe o RLS no la deja ver).
+    """
+    return first_row(await builder.execute())
+
+
+def tasks_api_row(row: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    Proyecta una fila de `tasks` a la forma de la vista `tasks_api`
+    (end_ts AS due_at). Conserva end_ts por compat con TaskOut.
+    """
+    if row is None:
+        return None
+    return {**row, "due_at": row.get("end_ts")}
@@ -0,0 +1,26 @@
+# app/worker/__main__.py
+"""
+Worker de notificaciones (ver app/worker/engine.py):
+
+    python -m app.worker [--mode asyncio|threads|processes] [--concurrency 16] [--processes N] [--once]
+
+Sin flags toma WORKER_MODE / DISPATCHER_CONCURRENCY / WORKER_PROCESSES del entorno.
+"""
+
+import argparse
+
+from app.worker import engine
+
+
+def main():
+    ap = argparse.ArgumentParser(prog="python -m app.worker")
+    ap.add_argument("--mode", choices=engine.MODES, default=engine.MODE)
+    ap.add_argument("--concurrency", type=int, default=engine.CONCURRENCY, help="envíos simultáneos por proceso")
+    ap.add_argument("--processes", type=int, default=engine.PROCESSES, help="solo con --mode processes")
+    ap.add_argument("--once", action="store_true", help="salir cuando la cola quede vacía")
+    args = ap.parse_args()
+    engine.run(mode=args.mode, concurrency=max(1, args.concurrency), processes=max(1, args.processes), once=args.once)
+
+
+if __name__ == "__main__":
+    main()
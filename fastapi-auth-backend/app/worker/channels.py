@@ -0,0 +1,198 @@
+# app/worker/channels.py
+import asyncio
+import httpx
+from typing import Any, Dict, List, Optional
+
+from app.core import profile_cache, wa_templates
+from app.core.whatsapp import asend_payload, send_payload, WhatsAppError, WhatsAppThrottled
+
+# -------------------------------------------------------------------
+# Canales de envío del worker (app/worker/engine.py)
+# -------------------------------------------------------------------
+# Un canal sabe entregar UNA notificación ya reclamada a un destinatario.
+# El engine elige el canal por `notifications.channel` y decide cómo se
+# ejecuta (asyncio -> asend, threads -> send en un pool). Para agregar uno:
+# subclase de Channel con `name`, `send` y/o `asend`, y register().
+#
+# Digests: si el canal devuelve una `digest_key` (no None), el engine junta las
+# notificaciones de un mismo usuario con la misma key dentro de
+# DISPATCHER_DIGEST_WINDOW_SECONDS y llama `send_digest` / `asend_digest` UNA
+# vez con todas. WhatsApp usa el template WA_DIGEST_TEMPLATE (aprobarlo en
+# Meta antes de activar la ventana):
+#   header {{1}} = header_hint, body {{1}} = cuántas, {{2}} = "09:00 Título · ...",
+#   {{3}} = tz_hint
+#
+# Errores:
+#   - ChannelError  : falla del proveedor (también red / timeouts de httpx y el
+#                     prefetch de perfiles caído); consume un intento y se
+#                     reintenta con backoff
+#   - ThrottledError: el proveedor pidió bajar el ritmo; se reprograma a `retry_after`
+#                     sin consumir intento
+#   - PermanentError: no tiene arreglo (modo no soportado, ...); failed directo
+#   - cualquier otra: inesperada (bug); también consume intento y espera el backoff,
+#                     para que una falla persistente no se reclame en bucle
+
+
+class ChannelError(Exception):
+    pass
+
+
+class PermanentError(ChannelError):
+    pass
+
+
+class ThrottledError(ChannelError):
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+DIGEST_TEMPLATE = wa_templates.DIGEST_TEMPLATE
+DIGEST_LIST_CHARS = 700  # el body de un template no pasa de 1024 caracteres en total
+
+
+def task_template_fields(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Campos de template (ver wa_templates.task_fields) a partir del payload (task_snapshot)."""
+    return wa_templates.task_fields(
+        payload.get("task_snapshot") or {},
+        header_hint=payload.get("header_hint") or "15 min",
+        tz_hint=payload.get("tz_hint"),
+    )
+
+
+def digest_template_fields(payloads: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Campos de WA_DIGEST_TEMPLATE para varias tareas (en orden); la lista se corta con "+N más"."""
+    lines = []
+    for p in payloads:
+        snap = p.get("task_snapshot") or {}
+        lines.append(f"{wa_templates.fmt_ts(snap.get('start_ts'), '%H:%M')} {snap.get('title') or '(no title)'}".strip())
+    # Meta no acepta saltos de línea en parámetros: todo en una línea
+    text, shown = "", 0
+    for line in lines:
+        candidate = f"{text} · {line}" if text else line
+        if len(candidate) > DIGEST_LIST_CHARS:
+            break
+        text, shown = candidate, shown + 1
+    if shown < len(lines):
+        text = f"{text} · +{len(lines) - shown} más" if text else f"+{len(lines)} más"
+    first = payloads[0] if payloads else {}
+    return {
+        "header": first.get("header_hint") or "15 min",
+        "count": len(payloads),
+        "list": text,
+        "tz": first.get("tz_hint"),
+    }
+
+
+class Channel:
+    """Interfaz de un canal. Basta con implementar `send`; `asend` lo corre en un hilo por defecto."""
+
+    name = ""
+
+    def send(self, n: Dict[str, Any], contact: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    async def asend(self, n: Dict[str, Any], contact: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        return await asyncio.to_thread(self.send, n, contact)
+
+    def digest_key(self, n: Dict[str, Any]) -> Optional[str]:
+        """Notificaciones con la misma key se pueden mandar juntas; None = siempre sola."""
+        return None
+
+    def send_digest(self, ns: List[Dict[str, Any]], contact: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    async def asend_digest(self, ns: List[Dict[str, Any]], contact: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        return await asyncio.to_thread(self.send_digest, ns, contact)
+
+
+class WhatsAppChannel(Channel):
+    """Template posicional por Graph API (rm_task_summary por defecto), armado con app.core.wa_templates
+    y enviado sobre el pool compartido de app.core.whatsapp."""
+
+    name = "whatsapp"
+
+    def _phone(self, contact: Optional[Dict[str, Any]]) -> str:
+        if contact is None:
+            # el prefetch de perfiles falló (PostgREST caído): reintento con backoff
+            raise ChannelError("profile lookup failed")
+        phone = profile_cache.phone(contact)
+        if not phone:
+            raise ChannelError("No phone or notifications disabled for user.")
+        return phone
+
+    def _render(self, name: str, lang_code: str, phone: str, fields: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            return wa_templates.renderer(name, lang_code).render_fields(phone, fields)
+        except wa_templates.TemplateError as e:
+            # el esquema no cambia entre reintentos
+            raise PermanentError(str(e)) from e
+
+    def _request(self, n: Dict[str, Any], contact: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        phone = self._phone(contact)
+        p = n.get("payload") or {}
+        mode = p.get("mode") or "template_by_task"
+        if mode != "template_by_task":
+            raise PermanentError(f"Unsupported mode: {mode}")
+        name = p.get("template_name") or "rm_task_summary"
+        return self._render(name, p.get("lang_code") or "en", phone, task_template_fields(p))
+
+    def digest_key(self, n):
+        # solo los recordatorios estándar de tarea; un template_name propio va solo
+        p = n.get("payload") or {}
+        if (p.get("mode") or "template_by_task") != "template_by_task":
+            return None
+        if (p.get("template_name") or "rm_task_summary") != "rm_task_summary":
+            return None
+        return p.get("lang_code") or "en"
+
+    def _digest_request(self, ns: List[Dict[str, Any]], contact: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        phone = self._phone(contact)
+        payloads = [n.get("payload") or {} for n in ns]
+        lang_code = payloads[0].get("lang_code") or "en"
+        return self._render(DIGEST_TEMPLATE, lang_code, phone, digest_template_fields(payloads))
+
+    def _call(self, req: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            return send_payload(req)
+        except WhatsAppThrottled as e:
+            raise ThrottledError(str(e), e.retry_after) from e
+        except (WhatsAppError, httpx.HTTPError) as e:
+            raise ChannelError(str(e)) from e
+
+    async def _acall(self, req: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            return await asend_payload(req)
+        except WhatsAppThrottled as e:
+            raise ThrottledError(str(e), e.retry_after) from e
+        except (WhatsAppError, httpx.HTTPError) as e:
+            raise ChannelError(str(e)) from e
+
+    def send(self, n, contact):
+        return self._call(self._request(n, contact))
+
+    async def asend(self, n, contact):
+        return await self._acall(self._request(n, contact))
+
+    def send_digest(self, ns, contact):
+        return self._call(self._digest_request(ns, contact))
+
+    async def asend_digest(self, ns, contact):
+        return await self._acall(self._digest_request(ns, contact))
+
+
+_CHANNELS: Dict[str, Channel] = {}
+
+
+def register(channel: Channel) -> None:
+    _CHANNELS[channel.name] = channel
+
+
+def get(name: Optional[str]) -> Channel:
+    channel = _CHANNELS.get(name or "whatsapp")
+    if channel is None:
+        raise PermanentError(f"Unsupported channel: {name}")
+    return channel
+
+
+register(WhatsAppChannel())
@@ -0,0 +1,630 @@
+# app/worker/engine.py
+import asyncio
+import multiprocessing as mp
+import os
+import socket
+import time
+import uuid
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timezone, timedelta
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+# 1) Cargar .env si existe (útil en VSCode / procesos que no heredan entorno)
+try:
+    from dotenv import load_dotenv  # type: ignore
+    load_dotenv()
+except Exception:
+    pass
+
+from postgrest import AsyncPostgrestClient
+from postgrest.constants import DEFAULT_POSTGREST_CLIENT_HEADERS
+from app.core import metrics, profile_cache
+from app.worker import channels
+from app.worker.outcomes import OutcomeBuffer
+from app.worker.scheduler import Scheduler, due_of
+
+# -------------------------------------------------------------------
+# Worker de notificaciones (único): python -m app.worker
+# -------------------------------------------------------------------
+# claim con lease -> prefetch de contactos -> envío por canal (app/worker/channels.py)
+# -> RetryPolicy -> OutcomeBuffer. Modelos de concurrencia (WORKER_MODE):
+#   - asyncio  : envíos como corutinas (Channel.asend), CONCURRENCY a la vez
+#   - threads  : Channel.send en un pool de CONCURRENCY hilos (SDKs bloqueantes)
+#   - processes: WORKER_PROCESSES procesos, cada uno un worker asyncio con su
+#                propio worker_id; el lease reparte las filas entre ellos
+# Con DISPATCHER_DIGEST_WINDOW_SECONDS > 0 las notificaciones de un mismo
+# usuario que vencen dentro de esa ventana salen en UN solo mensaje (digest) y
+# sus estados se escriben juntos (ver SendPipeline).
+POLL = float(os.getenv("DISPATCHER_POLL_SECONDS", "30"))
+BATCH_SIZE = int(os.getenv("DISPATCHER_BATCH_SIZE", "20"))
+MAX_ATTEMPTS = int(os.getenv("DISPATCHER_MAX_ATTEMPTS", "5"))
+# Envíos simultáneos (los de un mismo usuario siempre van en orden)
+CONCURRENCY = max(1, int(os.getenv("DISPATCHER_CONCURRENCY", "16")))
+# Un claim es del worker hasta lease_until; si se cae, otro lo reclama al vencer
+LEASE_SECONDS = int(os.getenv("DISPATCHER_LEASE_SECONDS", "300"))
+LEASE_MARGIN = min(5.0, LEASE_SECONDS / 10)  # no enviar si al lease le queda menos que esto
+MODE = os.getenv("WORKER_MODE", "asyncio")
+PROCESSES = int(os.getenv("WORKER_PROCESSES") or 0) or (os.cpu_count() or 1)  # vacío = un proceso por CPU
+STATS_SECONDS = float(os.getenv("WORKER_STATS_SECONDS", "60"))  # 0 = sin reporte periódico
+# Digest por usuario: 0 = apagado (requiere el template WA_DIGEST_TEMPLATE aprobado en Meta)
+DIGEST_WINDOW = float(os.getenv("DISPATCHER_DIGEST_WINDOW_SECONDS", "0"))
+DIGEST_MAX = max(1, int(os.getenv("DISPATCHER_DIGEST_MAX", "10")))  # notificaciones por digest
+DIGEST_EARLY_SLACK = 1.0  # s; tolerancia al reloj de la DB antes de liberar una hermana por temprana
+
+MODES = ("asyncio", "threads", "processes")
+
+
+def _sb() -> AsyncPostgrestClient:
+    """
+    Lee SUPABASE_URL y SUPABASE_SERVICE_ROLE_KEY SIEMPRE del entorno
+    cuando se crea el cliente, para evitar problemas de 'cacheo' en import.
+    """
+    url = (os.getenv("SUPABASE_URL") or "").rstrip("/")
+    key = os.getenv("SUPABASE_SERVICE_ROLE_KEY") or ""
+
+    if not url or not key:
+        # Mensaje de diagnóstico amable
+        msg = [
+            "Faltan SUPABASE_URL o SUPABASE_SERVICE_ROLE_KEY en el entorno",
+            f"SUPABASE_URL: {'<vacío>' if not url else url}",
+            f"SUPABASE_SERVICE_ROLE_KEY: {'<vacío>' if not key else '<presente>'}",
+            "Sugerencias:",
+            "- Si estás en PowerShell, exporta antes de ejecutar: ",
+            "    $env:SUPABASE_URL = 'https://<TU-PROYECTO>.supabase.co'",
+            "    $env:SUPABASE_SERVICE_ROLE_KEY = '<service-role>'",
+            "    python -m app.worker",
+            "- O crea un .env en la raíz con esas claves y deja este archivo cargarlo automáticamente.",
+        ]
+        raise RuntimeError("\n".join(msg))
+
+    # Cliente PostgREST async con service role (el worker no pasa por RLS)
+    return AsyncPostgrestClient(
+        f"{url}/rest/v1",
+        headers={**DEFAULT_POSTGREST_CLIENT_HEADERS, "apikey": key, "Authorization": f"Bearer {key}"},
+        timeout=30,
+    )
+
+
+def worker_id() -> str:
+    """Identidad del proceso para claimed_by (se calcula por proceso, también tras fork)."""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+# -------------------------------------------------------------------
+# Claim con lease (sql/notifications_lease.sql, sql/notifications_digest.sql)
+# -------------------------------------------------------------------
+_digest_rpc = True  # se apaga si el claim_notifications desplegado no acepta p_digest_window_seconds
+
+
+async def _fallback_due(
+    sb, horizon: Optional[datetime] = None, user_ids: Optional[List[str]] = None, limit: int = BATCH_SIZE,
+    columns: str = "id",
+):
+    """
+    Modo sin RPC: vencidas libres (no en procesamiento, o con lease vencido o NULL:
+    los claims del dispatcher viejo no tienen lease).
+    Con `horizon` / `user_ids`: las de esos usuarios que vencen antes de horizon (hermanas del digest).
+    """
+    now_iso = datetime.now(timezone.utc).isoformat()
+    until = (horizon or datetime.now(timezone.utc)).isoformat()
+    q = (
+        sb.table("notifications")
+          .select(columns)
+          .eq("channel", "whatsapp")
+          .eq("status", "scheduled")
+          .or_(f"and(next_retry_at.is.null,scheduled_for.lte.{until}),and(next_retry_at.lte.{until})")
+          .or_(f"processing.not.is.true,lease_until.is.null,lease_until.lt.{now_iso}")
+    )
+    if user_ids:
+        q = q.in_("user_id", user_ids)
+    return (await q.order("scheduled_for", desc=False).order("user_id").limit(limit).execute()).data or []
+
+
+async def _claim_ids(sb, worker: str, ids: List[Any]) -> List[dict]:
+    """UPDATE condicional (compare-and-set sobre processing / lease_until): devuelve solo las filas que ganamos."""
+    if not ids:
+        return []
+    now = datetime.now(timezone.utc)
+    res = await (
+        sb.table("notifications").update({
+            "processing": True,
+            "claimed_by": worker,
+            "lease_until": (now + timedelta(seconds=LEASE_SECONDS)).isoformat(),
+            "updated_at": now.isoformat()
+        })
+        .in_("id", ids)
+        .or_(f"processing.not.is.true,lease_until.is.null,lease_until.lt.{now.isoformat()}")
+        .execute()
+    )
+    return res.data or []
+
+
+def _digest_key(n: dict) -> Optional[str]:
+    try:
+        return channels.get(n.get("channel")).digest_key(n)
+    except channels.ChannelError:
+        return None
+
+
+async def _claim_siblings(sb, worker: str, batch: List[dict], window: float) -> List[dict]:
+    """
+    Sin soporte en el RPC: reclama aparte las hermanas de digest de los usuarios del lote,
+    con el mismo criterio que sql/notifications_digest.sql: misma digest_key que una
+    vencida del usuario, dentro de la ventana desde ella y hasta DIGEST_MAX - 1 por usuario.
+    """
+    firsts: Dict[Tuple[str, str], float] = {}  # (user_id, key) -> primer vencimiento del lote
+    for n in batch:
+        key = _digest_key(n)
+        if key is not None:
+            uid = str(n["user_id"])
+            due = due_of(n) or time.time()
+            firsts[(uid, key)] = min(due, firsts.get((uid, key), due))
+    if not firsts or DIGEST_MAX <= 1:
+        return []
+    horizon = datetime.now(timezone.utc) + timedelta(seconds=window)
+    rows = await _fallback_due(
+        sb, horizon, sorted({uid for uid, _ in firsts}), limit=BATCH_SIZE * DIGEST_MAX,
+        columns="id, user_id, channel, scheduled_for, next_retry_at, payload",
+    )
+    ids, per_user = [], Counter()
+    for r in rows:
+        uid = str(r["user_id"])
+        key = _digest_key(r)
+        first = firsts.get((uid, key)) if key is not None else None
+        if first is None or (due_of(r) or 0) > first + window or per_user[uid] >= DIGEST_MAX - 1:
+            continue
+        per_user[uid] += 1
+        ids.append(r["id"])
+    return await _claim_ids(sb, worker, ids)
+
+
+async def _claim_batch(sb, worker: str, digest_window: float = 0):
+    """
+    Claim con lease via RPC claim_notifications (sql/notifications_lease.sql).
+    Sin RPC: SELECT de candidatas + UPDATE condicional (compare-and-set sobre
+    processing / lease_until); solo son nuestras las filas que devuelve el UPDATE,
+    así dos workers nunca se quedan con la misma.
+
+    Con `digest_window` > 0 también se reclaman las notificaciones de los mismos
+    usuarios que vencen dentro de la ventana (sql/notifications_digest.sql).
+    """
+    global _digest_rpc
+    params = {"p_limit": BATCH_SIZE, "p_worker": worker, "p_lease_seconds": LEASE_SECONDS}
+    via_rpc = True
+    try:
+        if digest_window > 0 and _digest_rpc:
+            try:
+                res = await sb.rpc("claim_notifications", {
+                    **params, "p_digest_window_seconds": int(digest_window), "p_digest_max": DIGEST_MAX,
+                }).execute()
+                return res.data or [], True
+            except Exception as e:
+                if getattr(e, "code", None) != "PGRST202":
+                    raise
+                _digest_rpc = False
+                print("[worker] claim_notifications sin p_digest_window_seconds; aplica sql/notifications_digest.sql")
+        res = await sb.rpc("claim_notifications", params).execute()
+        batch = res.data or []
+    except Exception:
+        via_rpc = False
+        batch = await _claim_ids(sb, worker, [r["id"] for r in await _fallback_due(sb)])
+    if digest_window > 0 and batch:
+        try:
+            batch += await _claim_siblings(sb, worker, batch, digest_window)
+        except Exception as e:
+            # el lote ya es nuestro: seguir sin hermanas (salen solas o en el próximo claim)
+            print(f"[worker] digest siblings claim error: {e}")
+    return batch, via_rpc
+
+
+def _lease_expired(n: dict) -> bool:
+    until = n.get("lease_until")
+    if not until:
+        return False
+    until = datetime.fromisoformat(str(until).replace("Z", "+00:00"))
+    return datetime.now(timezone.utc) >= until - timedelta(seconds=LEASE_MARGIN)
+
+
+# -------------------------------------------------------------------
+# Política de reintentos (la misma para todos los canales)
+# -------------------------------------------------------------------
+@dataclass(frozen=True)
+class RetryPolicy:
+    max_attempts: int = MAX_ATTEMPTS
+    backoff_minutes: Tuple[int, ...] = (1, 5, 15, 60, 120, 240)
+
+    def delay(self, attempts: int) -> timedelta:
+        """Exponential backoff simple por tabla."""
+        idx = min(max(attempts, 0), len(self.backoff_minutes) - 1)
+        return timedelta(minutes=self.backoff_minutes[idx])
+
+    def outcome(self, n: dict, delivery: Optional[dict] = None, error: Optional[Exception] = None) -> Dict[str, Any]:
+        """Cambios a aplicar en notifications según el resultado del envío (ver OutcomeBuffer)."""
+        attempts = int(n.get("attempts") or 0)
+        now = datetime.now(timezone.utc)
+        payload = n.get("payload") or {}
+        if error is None:
+            return {
+                "status": "sent",
+                "processing": False,
+                "attempts": attempts + 1,
+                "payload": {**payload, "last_delivery": delivery},
+                "updated_at": now.isoformat()
+            }
+        if isinstance(error, channels.ThrottledError):
+            # Rate limit del proveedor: no es culpa del mensaje, no gasta intento
+            return {
+                "status": "scheduled",
+                "processing": False,
+                "next_retry_at": (now + timedelta(seconds=error.retry_after)).isoformat(),
+                "payload": {**payload, "last_error": str(error)},
+                "updated_at": now.isoformat()
+            }
+        # ChannelError o falla inesperada: consume intento y espera el backoff
+        # (sin next_retry_at la fila vuelve a vencer ya y se reclama en bucle)
+        attempts += 1
+        last_error = str(error) if isinstance(error, channels.ChannelError) else f"unexpected: {error}"
+        if attempts >= self.max_attempts or isinstance(error, channels.PermanentError):
+            return {
+                "status": "failed",
+                "processing": False,
+                "attempts": attempts,
+                "payload": {**payload, "last_error": last_error},
+                "updated_at": now.isoformat()
+            }
+        return {
+            "status": "scheduled",
+            "processing": False,
+            "attempts": attempts,
+            "next_retry_at": (now + self.delay(attempts)).isoformat(),
+            "payload": {**payload, "last_error": last_error},
+            "updated_at": now.isoformat()
+        }
+
+
+# -------------------------------------------------------------------
+# Métricas: throughput, latencia del envío y retraso vs scheduled_for
+# -------------------------------------------------------------------
+def _pct(values, p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+class Stats:
+    """Ventana de las últimas `window` entregas; report() publica gauges y resetea el throughput."""
+
+    def __init__(self, window: int = 2048):
+        self.send_ms: deque = deque(maxlen=window)
+        self.lag_ms: deque = deque(maxlen=window)
+        self.counts: Counter = Counter()
+        self._since = time.monotonic()
+
+    def record(self, status: str, send_ms: float, lag_ms: Optional[float]) -> None:
+        self.counts[status] += 1
+        metrics.inc(f"worker.{status}")
+        self.send_ms.append(send_ms)
+        if lag_ms is not None:
+            self.lag_ms.append(lag_ms)
+
+    def report(self) -> str:
+        now = time.monotonic()
+        done = sum(self.counts.values())
+        rate = done / max(now - self._since, 1e-9)
+        gauges = {
+            "worker.throughput_per_s": rate,
+            "worker.send_ms.p50": _pct(self.send_ms, 50),
+            "worker.send_ms.p99": _pct(self.send_ms, 99),
+            "worker.lag_ms.p50": _pct(self.lag_ms, 50),
+            "worker.lag_ms.p99": _pct(self.lag_ms, 99),
+        }
+        for name, value in gauges.items():
+            metrics.set_gauge(name, value)
+        counts = " ".join(f"{k}={v}" for k, v in sorted(self.counts.items())) or "idle"
+        self.counts.clear()
+        self._since = now
+        return (
+            f"{counts} {rate:.1f}/s send p50={gauges['worker.send_ms.p50']:.0f}ms "
+            f"p99={gauges['worker.send_ms.p99']:.0f}ms lag p50={gauges['worker.lag_ms.p50']:.0f}ms "
+            f"p99={gauges['worker.lag_ms.p99']:.0f}ms"
+        )
+
+
+# -------------------------------------------------------------------
+# Pipeline de envío
+# -------------------------------------------------------------------
+# Cada envío es una tarea: entrega por su canal (el contacto ya viene del
+# prefetch) bajo un semáforo de CONCURRENCY; el estado resultante va al
+# OutcomeBuffer, que lo escribe en lote (un round trip por flush) sin frenar
+# los siguientes envíos. Los envíos de un mismo user_id se encadenan (cada uno
+# espera a que el anterior termine), también entre lotes: el destinatario los
+# recibe en el orden en que se reclamaron. Con `pool` el envío corre en ese
+# ThreadPoolExecutor (Channel.send) en vez de en el event loop.
+#
+# Digest: mientras el envío de un usuario no arranca (espera turno o al
+# anterior), las notificaciones nuevas de ese usuario con la misma digest_key
+# del canal y vencimiento dentro de `digest_window` se suman a él, hasta
+# `digest_max`. Al arrancar sale UN mensaje con todas y sus estados van al
+# OutcomeBuffer juntos (add_many: mismo write). Una hermana que aún no vence y
+# no entra en ningún digest se libera (processing=false, sin lease) y sale sola
+# a su hora.
+class _Send:
+    __slots__ = ("items", "contact", "key", "first_due", "started")
+
+    def __init__(self, n: dict, contact: Optional[dict], key: Optional[str]):
+        self.items = [n]
+        self.contact = contact
+        self.key = key
+        self.first_due = due_of(n) or time.time()
+        self.started = False
+
+
+class SendPipeline:
+    def __init__(
+        self,
+        sb,
+        concurrency: int = CONCURRENCY,
+        policy: Optional[RetryPolicy] = None,
+        stats: Optional[Stats] = None,
+        pool: Optional[ThreadPoolExecutor] = None,
+        digest_window: float = DIGEST_WINDOW,
+        digest_max: int = DIGEST_MAX,
+    ):
+        self.sb = sb
+        self.policy = policy or RetryPolicy()
+        self.stats = stats or Stats()
+        self.pool = pool
+        self.digest_window = digest_window
+        self.digest_max = digest_max
+        self.outcomes = OutcomeBuffer(sb)
+        self._sem = asyncio.Semaphore(concurrency)
+        self._tails: Dict[str, asyncio.Task] = {}  # user_id -> último envío encadenado
+        self._open: Dict[str, _Send] = {}          # user_id -> envío que todavía acepta más notificaciones
+        self._sends: Set[asyncio.Task] = set()
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._sends)
+
+    def _key(self, n: dict) -> Optional[str]:
+        if self.digest_window <= 0 or self.digest_max <= 1:
+            return None
+        return _digest_key(n)
+
+    def submit(self, n: dict, contact: Optional[dict]) -> None:
+        """Encola un envío. Enviar en orden de vencimiento: las vencidas abren los digests."""
+        uid = str(n["user_id"])
+        key = self._key(n)
+        send = self._open.get(uid)
+        due = due_of(n) or time.time()
+        if (
+            key is not None and send is not None and not send.started and send.key == key
+            and len(send.items) < self.digest_max
+            and abs(due - send.first_due) <= self.digest_window
+        ):
+            send.items.append(n)
+            return
+        if self.digest_window > 0 and due > time.time() + DIGEST_EARLY_SLACK:
+            # hermana reclamada que no entró en ningún digest: todavía no vence, se
+            # devuelve a la cola en vez de mandarla antes de su scheduled_for
+            self._release(n)
+            return
+        send = _Send(n, contact, key)
+        task = asyncio.create_task(self._process(send, self._tails.get(uid)))
+        self._tails[uid] = task
+        if key is not None:
+            self._open[uid] = send
+        self._sends.add(task)
+        task.add_done_callback(lambda t, uid=uid, send=send: self._done(uid, t, send))
+
+    def _release(self, n: dict) -> None:
+        update: Dict[str, Any] = {"processing": False, "updated_at": datetime.now(timezone.utc).isoformat()}
+        if n.get("claimed_by"):
+            update["lease_owner"] = n["claimed_by"]  # limpia claimed_by / lease_until
+        metrics.inc("worker.digest.released")
+        self.outcomes.add_many({n["id"]: update})
+
+    def _done(self, uid: str, task: asyncio.Task, send: _Send) -> None:
+        self._sends.discard(task)
+        if self._tails.get(uid) is task:
+            del self._tails[uid]
+        if self._open.get(uid) is send:
+            del self._open[uid]
+
+    async def _deliver(self, items: List[dict], contact: Optional[dict]) -> dict:
+        channel = channels.get(items[0].get("channel"))
+        if len(items) == 1:
+            fn, afn, args = channel.send, channel.asend, (items[0], contact)
+        else:
+            fn, afn, args = channel.send_digest, channel.asend_digest, (items, contact)
+        if self.pool is None:
+            return await afn(*args)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.pool, fn, *args)
+
+    async def _process(self, send: _Send, prev: Optional[asyncio.Task]) -> None:
+        if prev is not None:
+            await asyncio.wait([prev])  # solo orden; el error del anterior no nos afecta
+        async with self._sem:
+            send.started = True  # desde aquí no se suman más
+            items = []
+            for n in send.items:
+                if _lease_expired(n):
+                    # esperó demasiado en cola: otro worker ya puede tenerla; no enviar
+                    metrics.inc("worker.lease.expired_skips")
+                else:
+                    items.append(n)
+            if not items:
+                return
+            items.sort(key=lambda n: due_of(n) or 0)
+            if len(items) > 1:
+                metrics.inc("worker.digest.sent")
+                metrics.inc("worker.digest.notifications", len(items))
+            t0 = time.perf_counter()
+            error = None
+            delivery = None
+            try:
+                delivery = await self._deliver(items, send.contact)
+                if len(items) > 1:
+                    delivery = {**delivery, "digest_size": len(items)}
+            except Exception as e:
+                error = e
+            send_ms = (time.perf_counter() - t0) * 1000
+        updates = {}
+        for n in items:
+            update = self.policy.outcome(n, delivery=delivery) if error is None else self.policy.outcome(n, error=error)
+            due = due_of(n)
+            if isinstance(error, channels.ThrottledError):
+                status = "throttled"
+            else:
+                status = update["status"] if update["status"] != "scheduled" else "retried"
+            self.stats.record(status, send_ms, (time.time() - due) * 1000 if due is not None else None)
+            if n.get("claimed_by"):
+                # fencing: solo se aplica si el claim sigue siendo nuestro (y libera el lease)
+                update["lease_owner"] = n["claimed_by"]
+            updates[n["id"]] = update
+        self.outcomes.add_many(updates)
+
+    async def wait_any(self, timeout: Optional[float] = None) -> None:
+        """Espera a que termine al menos un envío (o `timeout`)."""
+        if self._sends:
+            await asyncio.wait(set(self._sends), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+    async def drain(self) -> None:
+        """Espera envíos pendientes y escribe todos los estados acumulados."""
+        while self._sends:
+            await asyncio.gather(*self._sends, return_exceptions=True)
+        await self.outcomes.flush()
+
+
+async def _report(worker: str, stats: Stats, every: float) -> None:
+    while True:
+        await asyncio.sleep(every)
+        print(f"[worker] {worker} {stats.report()}")
+
+
+async def arun(
+    once: bool = False,
+    concurrency: int = CONCURRENCY,
+    scheduler: Optional[Scheduler] = None,
+    mode: str = "asyncio",
+    policy: Optional[RetryPolicy] = None,
+    digest_window: float = DIGEST_WINDOW,
+):
+    """
+    Bucle principal de un proceso (mode asyncio o threads). Reclama un lote
+    nuevo en cuanto hay hueco en el pipeline (no espera a que el lote anterior
+    termine); con la cola vacía duerme hasta el próximo vencimiento conocido o
+    un NOTIFY (ver app/worker/scheduler.py). `once=True` sale cuando la cola
+    queda vacía y no hay nada en vuelo (scripts / benchmarks).
+    """
+    if mode not in ("asyncio", "threads"):
+        raise ValueError(f"arun mode must be asyncio or threads, got {mode!r}")
+    sb = _sb()
+    worker = worker_id()
+    sched = scheduler or Scheduler(sb)
+    stats = Stats()
+    print(f"[worker] {worker} running; mode={mode} poll={POLL}s batch={BATCH_SIZE} lease={LEASE_SECONDS}s concurrency={concurrency} digest={digest_window:g}s")
+    # Graph usa el pool compartido de app.core.whatsapp (keep-alive / HTTP/2)
+    pool = ThreadPoolExecutor(concurrency, thread_name_prefix="worker-send") if mode == "threads" else None
+    pipe = SendPipeline(sb, concurrency, policy, stats, pool=pool, digest_window=digest_window)
+    reporter = asyncio.create_task(_report(worker, stats, STATS_SECONDS)) if STATS_SECONDS > 0 else None
+    await sched.start()
+    try:
+        while True:
+            if pipe.in_flight >= concurrency:
+                await pipe.wait_any()
+                continue
+            try:
+                batch, _via_rpc = await _claim_batch(sb, worker, digest_window)
+            except Exception as e:
+                print(f"[worker] claim error: {e}")
+                batch = []
+            # Contactos de todo el lote: un `in_` para los user_id que no están en cache
+            try:
+                contacts = await profile_cache.aprefetch(sb, (n["user_id"] for n in batch))
+            except Exception as e:
+                print(f"[worker] profile prefetch error: {e}")
+                contacts = {}
+            for n in sorted(batch, key=lambda n: due_of(n) or 0):
+                pipe.submit(n, contacts.get(str(n["user_id"])))
+            if len(batch) >= BATCH_SIZE:
+                continue  # lote lleno: puede haber más vencidas
+            if once:
+                if not batch and not pipe.in_flight:
+                    break
+                await pipe.wait_any()
+                continue
+            # cola vacía: los envíos en vuelo siguen solos; dormir hasta que algo venza
+            await sched.wait()
+    finally:
+        if reporter is not None:
+            reporter.cancel()
+        await sched.stop()
+        await pipe.drain()
+        if pool is not None:
+            pool.shutdown(wait=False)
+        await sb.aclose()
+        print(f"[worker] {worker} stopped; {stats.report()}")
+
+
+# -------------------------------------------------------------------
+# Modo processes: supervisor que mantiene N procesos worker vivos
+# -------------------------------------------------------------------
+def _child(once: bool, concurrency: int) -> None:
+    try:
+        asyncio.run(arun(once=once, concurrency=concurrency))
+    except KeyboardInterrupt:
+        pass
+
+
+def _supervise(processes: int, once: bool, concurrency: int) -> None:
+    ctx = mp.get_context("spawn")  # sin fork: cada hijo arma sus propios clientes / event loop
+    procs: Dict[int, Any] = {}
+    started: Dict[int, float] = {}
+    backoff: Dict[int, float] = {}
+    print(f"[worker] supervisor: {processes} processes x concurrency={concurrency}")
+    try:
+        while True:
+            for slot in range(processes):
+                p = procs.get(slot)
+                if p is not None and p.is_alive():
+                    continue
+                if p is not None:
+                    if p.exitcode == 0 and once:
+                        continue
+                    # se cayó: reiniciar con backoff (no hacer crash-loop si falta config)
+                    delay = backoff.get(slot, 0.5) * 2 if time.monotonic() - started[slot] < 10 else 1.0
+                    backoff[slot] = min(delay, 60.0)
+                    print(f"[worker] process {p.name} exited with {p.exitcode}; restart in {backoff[slot]:.0f}s")
+                    time.sleep(backoff[slot])
+                p = ctx.Process(target=_child, args=(once, concurrency), name=f"worker-{slot}")
+                p.start()
+                started[slot] = time.monotonic()
+                procs[slot] = p
+            if once and all(not p.is_alive() and p.exitcode == 0 for p in procs.values()):
+                return
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for p in procs.values():
+            if p.is_alive():
+                p.terminate()
+        for p in procs.values():
+            p.join()
+
+
+def run(mode: str = MODE, concurrency: int = CONCURRENCY, processes: int = PROCESSES, once: bool = False) -> None:
+    if mode not in MODES:
+        raise ValueError(f"WORKER_MODE must be one of {', '.join(MODES)}, got {mode!r}")
+    if mode == "processes":
+        _supervise(processes, once, concurrency)
+        return
+    try:
+        asyncio.run(arun(once=once, concurrency=concurrency, mode=mode))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,146 @@
+# app/worker/outcomes.py
+import asyncio
+import os
+import time
+from typing import Any, Dict, List, Optional, Set
+
+from app.core import metrics
+
+# -------------------------------------------------------------------
+# Write-back de estados de notifications en lote
+# -------------------------------------------------------------------
+# Los workers ya no hacen un UPDATE por notificación: acumulan el resultado
+# (sent / failed / scheduled + next_retry_at) y lo escriben de golpe con el RPC
+# apply_notification_outcomes (sql/notifications_outcomes_rpc.sql), un round
+# trip por flush. Se vacía al llegar a OUTCOME_FLUSH_ROWS filas o cuando la más
+# vieja cumple OUTCOME_FLUSH_SECONDS, así el estado nunca tarda más que eso.
+# Sin el RPC se cae a un UPDATE por fila (lo de antes). Las filas con
+# `lease_owner` solo se escriben si el claim sigue siendo de ese worker.
+FLUSH_ROWS = max(1, int(os.getenv("OUTCOME_FLUSH_ROWS", "50")))
+FLUSH_SECONDS = float(os.getenv("OUTCOME_FLUSH_SECONDS", "0.5"))
+
+_RPC = "apply_notification_outcomes"
+_use_rpc = True  # se apaga si PostgREST dice que la función no existe
+
+
+def _rpc_missing(e: Exception) -> bool:
+    return getattr(e, "code", None) == "PGRST202"
+
+
+def _count(rows: int, round_trips: int) -> None:
+    metrics.inc("worker.outcomes.flushes")
+    metrics.inc("worker.outcomes.rows", rows)
+    metrics.inc("worker.outcomes.round_trips", round_trips)
+
+
+class OutcomeBuffer:
+    """Versión asyncio (worker). `add` no bloquea; `flush` espera a que todo esté escrito."""
+
+    def __init__(self, sb, max_rows: int = FLUSH_ROWS, max_delay: float = FLUSH_SECONDS):
+        self.sb = sb
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self._rows: Dict[str, Dict[str, Any]] = {}  # id -> cambios (el último gana)
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._writes: Set[asyncio.Task] = set()
+
+    def add(self, nid, update: Dict[str, Any]) -> None:
+        self.add_many({nid: update})
+
+    def add_many(self, updates: Dict[Any, Dict[str, Any]]) -> None:
+        """Varias filas que deben ir en el MISMO write (p.ej. los miembros de un digest)."""
+        for nid, update in updates.items():
+            self._rows[str(nid)] = {**update, "id": nid}
+        if len(self._rows) >= self.max_rows:
+            self._spawn_flush()
+        elif self._rows and self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_delay, self._spawn_flush)
+
+    def _spawn_flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._rows:
+            return
+        rows, self._rows = list(self._rows.values()), {}
+        task = asyncio.create_task(self._write(rows))
+        self._writes.add(task)
+        task.add_done_callback(self._writes.discard)
+
+    async def _write(self, rows: List[Dict[str, Any]]) -> None:
+        global _use_rpc
+        if _use_rpc:
+            try:
+                await self.sb.rpc(_RPC, {"p_rows": rows}).execute()
+                _count(len(rows), 1)
+                return
+            except Exception as e:
+                if _rpc_missing(e):
+                    _use_rpc = False
+                else:
+                    print(f"[outcomes] {_RPC} failed, per-row fallback: {e}")
+        results = await asyncio.gather(
+            *(_row_update(self.sb, r).execute() for r in rows),
+            return_exceptions=True,
+        )
+        for r, res in zip(rows, results):
+            if isinstance(res, Exception):
+                # processing queda en True; el claim la recuperará según su política
+                print(f"[outcomes] status write failed for {r['id']}: {res}")
+        _count(len(rows), len(rows))
+
+    async def flush(self) -> None:
+        self._spawn_flush()
+        while self._writes:
+            await asyncio.gather(*self._writes, return_exceptions=True)
+
+
+class SyncOutcomeBuffer:
+    """Versión síncrona (scripts / código bloqueante). El plazo se revisa en cada add(); llama a flush() al cerrar el lote."""
+
+    def __init__(self, sb, max_rows: int = FLUSH_ROWS, max_delay: float = FLUSH_SECONDS):
+        self.sb = sb
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self._rows: Dict[str, Dict[str, Any]] = {}
+        self._oldest: Optional[float] = None
+
+    def add(self, nid, update: Dict[str, Any]) -> None:
+        self._rows[str(nid)] = {**update, "id": nid}
+        if self._oldest is None:
+            self._oldest = time.monotonic()
+        if len(self._rows) >= self.max_rows or time.monotonic() - self._oldest >= self.max_delay:
+            self.flush()
+
+    def flush(self) -> None:
+        global _use_rpc
+        if not self._rows:
+            return
+        rows, self._rows, self._oldest = list(self._rows.values()), {}, None
+        if _use_rpc:
+            try:
+                self.sb.rpc(_RPC, {"p_rows": rows}).execute()
+                _count(len(rows), 1)
+                return
+            except Exception as e:
+                if _rpc_missing(e):
+                    _use_rpc = False
+                else:
+                    print(f"[outcomes] {_RPC} failed, per-row fallback: {e}")
+        for r in rows:
+            try:
+                _row_update(self.sb, r).execute()
+            except Exception as e:
+                print(f"[outcomes] status write failed for {r['id']}: {e}")
+        _count(len(rows), len(rows))
+
+
+def _row_update(sb, row: Dict[str, Any]):
+    """UPDATE de una fila (fallback sin RPC), con el mismo fencing por lease_owner que el RPC."""
+    fields = {k: v for k, v in row.items() if k not in ("id", "lease_owner")}
+    q = sb.table("notifications")
+    owner = row.get("lease_owner")
+    if not owner:
+        return q.update(fields).eq("id", row["id"])
+    fields.update(claimed_by=None, lease_until=None)
+    return q.update(fields).eq("id", row["id"]).eq("claimed_by", owner)
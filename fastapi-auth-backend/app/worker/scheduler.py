@@ -0,0 +1,200 @@
+# app/worker/scheduler.py
+import asyncio
+import heapq
+import importlib.util
+import json
+import os
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+# -------------------------------------------------------------------
+# Despertar del worker por tiempo de vencimiento, no por intervalo fijo
+# -------------------------------------------------------------------
+# Un heap en memoria guarda el próximo `scheduled_for` (o next_retry_at) de las
+# notificaciones pendientes; el worker duerme exactamente hasta el primero.
+# Las nuevas llegan por LISTEN/NOTIFY (trigger de sql/notifications_notify.sql)
+# si hay DATABASE_URL y psycopg instalado; el polling queda como red de
+# seguridad: cada DISPATCHER_SAFETY_POLL_SECONDS con el listener conectado,
+# cada DISPATCHER_POLL_SECONDS sin él.
+DATABASE_URL = os.getenv("DATABASE_URL", "")  # conexión directa a Postgres (no PostgREST)
+NOTIFY_CHANNEL = os.getenv("DISPATCHER_NOTIFY_CHANNEL", "notifications_due")
+POLL = float(os.getenv("DISPATCHER_POLL_SECONDS", "30"))
+SAFETY_POLL = float(os.getenv("DISPATCHER_SAFETY_POLL_SECONDS", "300"))
+HORIZON_ROWS = int(os.getenv("DISPATCHER_HORIZON_ROWS", "500"))  # pendientes cargadas al heap por refresh
+
+_PSYCOPG = importlib.util.find_spec("psycopg") is not None
+
+
+def _epoch(value: Any) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
+
+
+def due_of(row: Dict[str, Any]) -> Optional[float]:
+    """Momento (epoch) en que la fila pasa a ser reclamable: max(scheduled_for, next_retry_at)."""
+    times = [t for t in (_epoch(row.get("scheduled_for")), _epoch(row.get("next_retry_at"))) if t is not None]
+    return max(times) if times else None
+
+
+class DueHeap:
+    """Min-heap de vencimientos; un id solo cuenta con su último `due` (las entradas viejas se descartan al salir)."""
+
+    def __init__(self):
+        self._heap: List[Tuple[float, str]] = []
+        self._due: Dict[str, float] = {}
+
+    def push(self, due: float, nid: Optional[str] = None) -> None:
+        key = str(nid) if nid is not None else f"@{due}"
+        if self._due.get(key) == due:
+            return
+        self._due[key] = due
+        heapq.heappush(self._heap, (due, key))
+
+    def _clean(self) -> None:
+        while self._heap and self._due.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+
+    def next_due(self) -> Optional[float]:
+        self._clean()
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: float) -> int:
+        """Saca todo lo vencido a `now`; devuelve cuántas entradas vencieron."""
+        n = 0
+        self._clean()
+        while self._heap and self._heap[0][0] <= now:
+            _, key = heapq.heappop(self._heap)
+            self._due.pop(key, None)
+            n += 1
+            self._clean()
+        return n
+
+    def __len__(self) -> int:
+        return len(self._due)
+
+
+def _upcoming(sb):
+    return (
+        sb.table("notifications")
+          .select("id, scheduled_for, next_retry_at")
+          .eq("channel", "whatsapp")
+          .eq("status", "scheduled")
+          .eq("processing", False)
+          .order("scheduled_for", desc=False)
+          .limit(HORIZON_ROWS)
+    )
+
+
+class _Base:
+    def __init__(self, sb, poll: float = POLL, safety_poll: float = SAFETY_POLL):
+        self.sb = sb
+        self.poll = poll
+        self.safety_poll = safety_poll
+        self.heap = DueHeap()
+        self.listening = False
+        self._last_refresh = float("-inf")
+
+    def _load(self, rows: List[Dict[str, Any]]) -> None:
+        for r in rows:
+            due = due_of(r)
+            if due is not None:
+                self.heap.push(due, r["id"])
+        self._last_refresh = time.monotonic()
+
+    def _on_payload(self, payload: str) -> None:
+        # payload del trigger: {"id": "...", "due": "<timestamptz>"}; si no parsea, despertar ya
+        try:
+            data = json.loads(payload)
+            due = _epoch(data.get("due")) or time.time()
+            self.heap.push(due, data.get("id"))
+        except (ValueError, AttributeError):
+            self.heap.push(time.time())
+
+    def _timeout(self) -> Tuple[bool, float]:
+        """(hay algo vencido, segundos hasta el próximo evento: vencimiento o refresh)."""
+        now = time.time()
+        if self.heap.pop_due(now):
+            return True, 0.0
+        interval = self.safety_poll if self.listening else self.poll
+        timeout = interval - (time.monotonic() - self._last_refresh)
+        nxt = self.heap.next_due()
+        if nxt is not None:
+            timeout = min(timeout, nxt - now)
+        return False, timeout
+
+
+class Scheduler(_Base):
+    """Scheduler del worker (app/worker/engine.py)."""
+
+    def __init__(self, sb, poll: float = POLL, safety_poll: float = SAFETY_POLL):
+        super().__init__(sb, poll, safety_poll)
+        self._wake = asyncio.Event()
+        self._listener: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        await self.refresh()
+        if DATABASE_URL and _PSYCOPG:
+            self._listener = asyncio.create_task(self._listen())
+        elif DATABASE_URL:
+            print("[scheduler] DATABASE_URL set but psycopg is not installed; polling only")
+
+    async def stop(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+
+    async def refresh(self) -> None:
+        try:
+            self._load((await _upcoming(self.sb).execute()).data or [])
+        except Exception as e:
+            self._last_refresh = time.monotonic()  # no martillar la BD si falla
+            print(f"[scheduler] refresh error: {e}")
+
+    def notify(self, due: float, nid: Optional[str] = None) -> None:
+        """Agregar un vencimiento desde el propio proceso (o desde el listener)."""
+        self.heap.push(due, nid)
+        self._wake.set()
+
+    async def wait(self) -> str:
+        """Bloquea hasta que algo venza ("due") o toque el polling de respaldo ("poll")."""
+        while True:
+            due, timeout = self._timeout()
+            if due:
+                return "due"
+            if timeout <= 0:
+                await self.refresh()
+                return "poll"
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _listen(self) -> None:
+        import psycopg
+        from psycopg import sql
+
+        backoff = 1.0
+        while True:
+            try:
+                async with await psycopg.AsyncConnection.connect(DATABASE_URL, autocommit=True) as conn:
+                    await conn.execute(sql.SQL("LISTEN {}").format(sql.Identifier(NOTIFY_CHANNEL)))
+                    self.listening, backoff = True, 1.0
+                    await self.refresh()  # lo insertado mientras no escuchábamos
+                    async for n in conn.notifies():
+                        self._on_payload(n.payload)
+                        self._wake.set()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[scheduler] LISTEN {NOTIFY_CHANNEL} lost: {e}; retry in {backoff:.0f}s")
+            finally:
+                self.listening = False
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 60.0)
+
@@ -0,0 +1,160 @@
+# bench/_standin.py
+"""
+Utilidades compartidas por los benchmarks: servidores HTTP locales que
+imitan PostgREST / Graph API y cálculo de percentiles.
+Solo stdlib; los benchmarks se ejecutan desde fastapi-auth-backend/:
+    python -m bench.<nombre>
+"""
+
+import json
+import os
+import ssl
+import subprocess
+import sys
+import time
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+
+# handler(method, path, body) -> (status, json_body, extra_headers)
+Route = Callable[[str, str, bytes], Tuple[int, object, Dict[str, str]]]
+
+
+def percentile(samples: List[float], p: float) -> float:
+    if not samples:
+        return 0.0
+    xs = sorted(samples)
+    k = min(len(xs) - 1, max(0, int(round(p / 100.0 * (len(xs) - 1)))))
+    return xs[k]
+
+
+def summary(label: str, samples: List[float], unit: str = "ms") -> str:
+    return (
+        f"{label:<28} n={len(samples):<5} "
+        f"p50={percentile(samples, 50):8.2f} {unit}  p99={percentile(samples, 99):8.2f} {unit}"
+    )
+
+
+def self_signed_cert() -> Tuple[str, str]:
+    """Genera un certificado autofirmado para 127.0.0.1 (requiere openssl en PATH)."""
+    d = tempfile.mkdtemp(prefix="rm-bench-")
+    cert, key = os.path.join(d, "cert.pem"), os.path.join(d, "key.pem")
+    subprocess.run(
+        [
+            "openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes",
+            "-keyout", key, "-out", cert, "-days", "1",
+            "-subj", "/CN=127.0.0.1", "-addext", "subjectAltName=IP:127.0.0.1",
+        ],
+        check=True, capture_output=True,
+    )
+    return cert, key
+
+
+class StandIn:
+    """
+    Servidor HTTP/1.1 (keep-alive) en un hilo. `route` decide la respuesta.
+    Con `tls=True` sirve HTTPS con un certificado autofirmado (ver `cert_path`).
+    `connect_ms` retrasa cada conexión NUEVA (simula los round trips de TCP +
+    TLS a un host remoto); `connections` cuenta las conexiones aceptadas.
+    """
+
+    def __init__(self, route: Route, tls: bool = False, connect_ms: float = 0):
+        self.route = route
+        self.connect_ms = connect_ms
+        self.connections = 0
+        self.requests: Dict[str, int] = {}
+        self.cert_path: Optional[str] = None
+        self._lock = threading.Lock()
+        outer = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):  # silencioso
+                pass
+
+            def setup(self):
+                if isinstance(self.request, ssl.SSLSocket):
+                    self.request.do_handshake()  # en el hilo de la conexión, no en el accept
+                with outer._lock:
+                    outer.connections += 1
+                if outer.connect_ms:
+                    time.sleep(outer.connect_ms / 1000)
+                super().setup()
+
+            def _handle(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                path = self.path.split("?", 1)[0]
+                with outer._lock:
+                    key = f"{self.command} {path}"
+                    outer.requests[key] = outer.requests.get(key, 0) + 1
+                status, data, headers = outer.route(self.command, self.path, body)
+                raw = json.dumps(data).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(raw)))
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(raw)
+
+            do_GET = do_POST = do_PATCH = do_DELETE = do_PUT = _handle
+
+        class _Server(ThreadingHTTPServer):
+            request_queue_size = 1024  # bursts de conexiones concurrentes
+
+        self.server = _Server(("127.0.0.1", 0), _Handler)
+        self.server.daemon_threads = True
+        if tls:
+            cert, key = self_signed_cert()
+            ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            ctx.load_cert_chain(cert, key)
+            self.server.socket = ctx.wrap_socket(self.server.socket, server_side=True, do_handshake_on_connect=False)
+            self.cert_path = cert
+        self.scheme = "https" if tls else "http"
+        self.port = self.server.server_address[1]
+        self.url = f"{self.scheme}://127.0.0.1:{self.port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def reset_counts(self) -> None:
+        with self._lock:
+            self.requests.clear()
+
+    def total_requests(self) -> int:
+        with self._lock:
+            return sum(self.requests.values())
+
+    def close(self) -> None:
+        self.server.shutdown()
+
+
+def spawn_latency_server(latency_ms: float) -> Tuple[subprocess.Popen, str]:
+    """
+    Lanza en OTRO proceso un stand-in que responde `[]` tras `latency_ms`.
+    Así el servidor no compite por el GIL con la app medida.
+    """
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "bench._standin", "--latency-ms", str(latency_ms)],
+        stdout=subprocess.PIPE, text=True,
+    )
+    url = proc.stdout.readline().strip()
+    return proc, url
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--latency-ms", type=float, default=0)
+    a = ap.parse_args()
+
+    def _route(method, path, body):
+        time.sleep(a.latency_ms / 1000)
+        return 200, [], {}
+
+    srv = StandIn(_route)
+    print(srv.url, flush=True)
+    threading.Event().wait()
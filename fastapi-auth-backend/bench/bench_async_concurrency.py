@@ -0,0 +1,82 @@
+# bench/bench_async_concurrency.py
+"""
+Harness de carga: GET /api/tasks (async def, PostgREST no bloqueante) vs la
+misma consulta en un handler `def` síncrono, que ocupa un hilo del threadpool
+de Starlette (40 por defecto) mientras espera. El PostgREST local corre en otro
+proceso y responde con una latencia fija (--latency-ms) para simular la red;
+con 40 hilos el handler síncrono no puede pasar de 40 / latencia rps.
+
+    python -m bench.bench_async_concurrency [--latency-ms 250] [--levels 20,40,100,200,400]
+"""
+
+import argparse
+import asyncio
+import os
+import time
+import uuid
+
+from bench._standin import spawn_latency_server, summary
+
+USER_ID = str(uuid.uuid4())
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--latency-ms", type=float, default=250)
+    ap.add_argument("--levels", default="20,40,100,200,400")
+    args = ap.parse_args()
+    levels = [int(x) for x in args.levels.split(",")]
+
+    proc, url = spawn_latency_server(args.latency_ms)
+    os.environ.update({
+        "SUPABASE_URL": url,
+        "SUPABASE_KEY": "anon-bench",
+        "SUPABASE_SERVICE_ROLE_KEY": "service-bench",
+        "SUPABASE_JWT_SECRET": "bench-secret-bench-secret-bench-secret",
+        "ALLOW_DEV_HEADER": "1",
+        "OPENAI_API_KEY": "sk-bench",
+        "SUPABASE_POOL_MAX_CONNECTIONS": str(max(levels) * 2),
+        "SUPABASE_POOL_MAX_KEEPALIVE": str(max(levels) * 2),
+    })
+
+    import httpx
+    from fastapi import Depends, Request
+    import main as app_main
+    from app.core.auth import get_current_user
+    from app.core.supabase_client import get_supabase_for_request
+
+    @app_main.app.get("/bench/sync-tasks", dependencies=[Depends(get_current_user)])
+    def sync_tasks(request: Request):
+        # Mismo query que list_tasks, pero con I/O bloqueante en un `def`
+        sb = get_supabase_for_request(request)
+        return sb.table("tasks_api").select("*").eq("user_id", USER_ID).order("start_ts").range(0, 49).execute().data
+
+    async def burst(client, path, n):
+        async def one():
+            t0 = time.perf_counter()
+            r = await client.get(path, headers={"X-User-Id": USER_ID})
+            assert r.status_code == 200, r.text
+            return (time.perf_counter() - t0) * 1000
+
+        t0 = time.perf_counter()
+        lat = await asyncio.gather(*[one() for _ in range(n)])
+        return time.perf_counter() - t0, list(lat)
+
+    async def run():
+        transport = httpx.ASGITransport(app=app_main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://app", timeout=120) as client:
+            await burst(client, "/api/tasks", 5)  # warm-up
+            await burst(client, "/bench/sync-tasks", 5)
+            for n in levels:
+                for label, path in (("sync def", "/bench/sync-tasks"), ("async def", "/api/tasks")):
+                    wall, lat = await burst(client, path, n)
+                    print(f"{summary(f'{label} c={n}', lat)}  rps={n / wall:8.1f}")
+
+    try:
+        asyncio.run(run())
+    finally:
+        proc.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+# bench/bench_auth.py
+"""
+Microbenchmark del costo de auth por request:
+- _decode_jwt_hs256 en frío (cache vacío) vs con el cache de claims.
+- Verificaciones HS256 por request en un endpoint que declara
+  Depends(get_current_user) además del router (GET /api/tasks).
+- Llamadas a GoTrue desde la dependencia de auth (deben ser 0).
+
+    python -m bench.bench_auth [--n 20000]
+"""
+
+import argparse
+import os
+import time
+import uuid
+
+from bench._standin import StandIn, summary
+
+SECRET = "bench-secret-bench-secret-bench-secret"
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=20000)
+    args = ap.parse_args()
+
+    srv = StandIn(lambda m, p, b: (200, [], {}))
+    os.environ.update({
+        "SUPABASE_URL": srv.url,
+        "SUPABASE_KEY": "anon-bench",
+        "SUPABASE_SERVICE_ROLE_KEY": "service-bench",
+        "SUPABASE_JWT_SECRET": SECRET,
+        "ALLOW_DEV_HEADER": "0",
+        "OPENAI_API_KEY": "sk-bench",
+    })
+
+    import jwt
+    from fastapi.testclient import TestClient
+    import main as app_main
+    from app.core import auth, metrics
+
+    now = int(time.time())
+    token = jwt.encode(
+        {"sub": str(uuid.uuid4()), "aud": "authenticated", "iss": f"{srv.url}/auth/v1",
+         "exp": now + 3600, "iat": now, "email": "bench@example.com"},
+        SECRET, algorithm="HS256",
+    )
+
+    # 1) Decodificación aislada
+    cold = []
+    for _ in range(args.n):
+        auth._claims_cache.clear()
+        t0 = time.perf_counter()
+        auth._decode_jwt_hs256(token)
+        cold.append((time.perf_counter() - t0) * 1e6)
+    warm = []
+    for _ in range(args.n):
+        t0 = time.perf_counter()
+        auth._decode_jwt_hs256(token)
+        warm.append((time.perf_counter() - t0) * 1e6)
+    print(summary("decode cold", cold, "us"))
+    print(summary("decode cached", warm, "us"))
+
+    # 2) Verificaciones por request (cuenta llamadas a jwt.decode)
+    calls = {"n": 0}
+    real_decode = jwt.decode
+
+    def counting_decode(*a, **kw):
+        calls["n"] += 1
+        return real_decode(*a, **kw)
+
+    auth.jwt.decode = counting_decode
+    auth._claims_cache.clear()
+    client = TestClient(app_main.app)
+    headers = {"Authorization": f"Bearer {token}"}
+    for i in range(3):
+        calls["n"] = 0
+        r = client.get("/api/tasks", headers=headers)
+        print(f"request #{i + 1}: status={r.status_code} jwt.decode calls={calls['n']}")
+    print(f"auth server (GoTrue) calls: {metrics.get('auth_server.calls'):.0f}")
+    auth.jwt.decode = real_decode
+    srv.close()
+
+
+if __name__ == "__main__":
+    main()
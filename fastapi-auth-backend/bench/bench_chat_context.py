@@ -0,0 +1,165 @@
+# bench/bench_chat_context.py
+"""
+Tokens de prompt por request del chat a lo largo de una conversación larga
+(`--turns` turnos de un mismo usuario), con tres estrategias:
+
+  - solo el último mensaje : lo que mandaba /chat/message antes (sin contexto)
+  - historial completo     : todos los mensajes de chat_messages
+  - ventana + resumen      : app.core.chat_context (los topes CHAT_CONTEXT_*)
+
+Los conteos son locales (app.core.tokens; tiktoken si está instalado, si no la
+estimación) y no incluyen el schema de TOOLS, que suma lo mismo en las tres.
+PostgREST y OpenAI (el que resume) son servidores locales con `--rest-ms` /
+`--llm-ms`. Reporta p50/p99/máximo de tokens por request, resúmenes hechos y
+la latencia de chat_context.load en caliente (cache), desde el snapshot y
+desde chat_messages (sin snapshot).
+
+    python -m bench.bench_chat_context [--turns 200] [--rest-ms 20] [--llm-ms 600]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from urllib.parse import urlsplit
+
+from bench._standin import StandIn, percentile, summary
+
+_USER = (
+    "Agenda correr 5k el {d} a las {h}",
+    "¿Qué tengo para el {d}?",
+    "Mueve la reunión con el equipo de ventas al {d} a las {h}, y avísame un día antes por WhatsApp",
+    "Ponle etiqueta Job a la última tarea",
+    "Repite la clase de inglés los martes y jueves durante {m} meses",
+    "Cancela lo del gimnasio del {d}, me lesioné la rodilla y no voy a poder ir por un tiempo",
+)
+_ASSISTANT = (
+    "He creado tu tarea.",
+    "¿Qué fecha/hora (ISO) para “Correr 5k”? Ej: 2025-10-22T07:00:00Z",
+    "He actualizado tus tareas.",
+    "¿Podrías indicar título y fecha/hora (ISO) para la tarea?",
+)
+
+
+def _conversation(n, seed=7):
+    rng = random.Random(seed)
+    for _ in range(n):
+        user = rng.choice(_USER).format(d=f"2026-11-{rng.randint(1, 28):02d}", h=f"{rng.randint(6, 21)}:00",
+                                        m=rng.randint(1, 6))
+        if rng.random() < 0.5:
+            task = {"ok": True, "task": {"id": str(uuid.UUID(int=rng.getrandbits(128))), "title": user[:24],
+                                         "start_ts": "2026-11-03T07:00:00Z"}}
+            yield user, _ASSISTANT[0], "create_task", task
+        else:
+            yield user, rng.choice(_ASSISTANT[1:]), None, None
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--turns", type=int, default=200)
+    ap.add_argument("--rest-ms", type=float, default=20)
+    ap.add_argument("--llm-ms", type=float, default=600)
+    args = ap.parse_args()
+
+    lock = threading.Lock()
+    rows = {"chat_context": {}, "chat_messages": []}
+    counts = {"summaries": 0, "snapshots": 0}
+
+    def _rest(method, path, body):
+        time.sleep(args.rest_ms / 1000)
+        table = urlsplit(path).path.rsplit("/", 1)[-1]
+        with lock:
+            if table == "chat_context":
+                if method == "POST":
+                    row = json.loads(body)
+                    rows["chat_context"][row["user_id"]] = row
+                    counts["snapshots"] += 1
+                    return 201, [], {}
+                return 200, list(rows["chat_context"].values())[:1], {}
+            if table == "chat_messages":
+                return 200, list(reversed(rows["chat_messages"]))[:48], {}
+        return 200, [], {}
+
+    def _llm(method, path, body):
+        time.sleep(args.llm_ms / 1000)
+        req = json.loads(body)
+        text = req["messages"][-1]["content"]
+        with lock:
+            counts["summaries"] += 1
+        # "resumen": las últimas líneas de lo que recibe (el tope lo pone chat_context)
+        content = " ".join(text.split()[-120:])
+        return 200, {
+            "id": "chatcmpl-bench", "object": "chat.completion", "created": 0, "model": "gpt-4o-mini",
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": len(text) // 4, "completion_tokens": 160, "total_tokens": len(text) // 4 + 160},
+        }, {}
+
+    rest, llm = StandIn(_rest), StandIn(_llm)
+    os.environ.update({
+        "SUPABASE_URL": rest.url,
+        "SUPABASE_KEY": "anon-bench",
+        "SUPABASE_SERVICE_ROLE_KEY": "service-bench",
+        "OPENAI_API_KEY": "sk-bench",
+        "OPENAI_BASE_URL": f"{llm.url}/v1",
+    })
+    from app.api.routers.chat import SYSTEM
+    from app.core import chat_context, metrics, tokens
+    from app.core.supabase_client import get_async_supabase_for_token
+
+    user_id = str(uuid.uuid4())
+
+    async def run():
+        sb = get_async_supabase_for_token("bench-token")
+        last, full, window = [], [], []
+        history = []
+        for user, reply, tool, result in _conversation(args.turns):
+            last.append(tokens.count_messages([{"role": "system", "content": SYSTEM},
+                                               {"role": "user", "content": user}]))
+            full.append(tokens.count_messages([{"role": "system", "content": SYSTEM}, *history,
+                                               {"role": "user", "content": user}]))
+            ctx = await chat_context.load(sb, user_id)
+            window.append(tokens.count_messages(ctx.messages(SYSTEM, user)))
+            ctx.record(user, reply, tool, result)
+            chat_context.commit(sb, ctx)
+            history += [{"role": "user", "content": user}, {"role": "assistant", "content": reply}]
+            rows["chat_messages"] += [{"role": "user", "content": {"message": user}},
+                                      {"role": "assistant", "content": {"message": reply}}]
+            await asyncio.sleep(0.05)  # el usuario lee y escribe: deja correr los flush en background
+        await chat_context.aflush()
+
+        print(f"{args.turns} turnos, tokenizer={'tiktoken ' + tokens.ENCODING if tokens._HAS_TIKTOKEN else 'estimación'}")
+        for label, xs in (("solo el último mensaje", last), ("historial completo", full),
+                          ("ventana + resumen", window)):
+            print(f"{summary(label, xs, 'tok')}  max={max(xs):6.0f}  total={sum(xs):,.0f}")
+        print(f"resúmenes (OpenAI)={counts['summaries']}  snapshots={counts['snapshots']}  "
+              f"resumen final={tokens.count(ctx.summary)} tok, ventana={len(ctx.turns) // 2} turnos")
+
+        # load: cache del proceso / snapshot persistido / arranque desde chat_messages
+        for label, prepare in (("load en caliente", lambda: None),
+                               ("load desde snapshot", chat_context._cache.clear),
+                               ("load desde chat_messages", lambda: (chat_context._cache.clear(),
+                                                                     rows["chat_context"].clear()))):
+            lat = []
+            for _ in range(30):
+                prepare()
+                t0 = time.perf_counter()
+                await chat_context.load(sb, user_id)
+                lat.append((time.perf_counter() - t0) * 1000)
+            print(f"{summary(label, lat)}  max={percentile(lat, 100):6.2f} ms")
+
+        snap = metrics.snapshot()
+        for name, value in sorted({**snap["counters"], **snap["gauges"]}.items()):
+            if name.startswith("chat.context"):
+                print(f"  {name:<44} {value:,.2f}")
+
+    asyncio.run(run())
+    rest.close()
+    llm.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+# bench/bench_chat_stream.py
+"""
+Time-to-first-token de POST /api/chat/message (respuesta completa) vs
+POST /api/chat/message/stream (SSE), contra un OpenAI local que genera
+`--tokens` tokens: el primero a los `--first-ms` y luego uno cada `--tok-ms`
+(en modo no-stream responde todo junto al final). PostgREST es otro servidor
+local con `--rest-ms` por request (inserts de tasks y chat_messages).
+
+Dos casos: respuesta de texto, y un create_task cuyos arguments llegan en
+fragmentos. Por endpoint reporta p50/p99 de:
+  - primer byte útil : la respuesta (no-stream) / el primer evento SSE
+  - respuesta        : `reply` final (no-stream) / evento `done`
+y cuántos writes a chat_messages quedaron en el camino de la respuesta.
+
+    python -m bench.bench_chat_stream [--n 30] [--tokens 60] [--first-ms 400] [--tok-ms 15] [--rest-ms 40]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from bench._standin import StandIn, summary
+
+USER_ID = str(uuid.uuid4())
+
+
+def _chunk(delta, finish=None):
+    return {"id": "chatcmpl-bench", "object": "chat.completion.chunk", "created": 0, "model": "gpt-4o-mini",
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish}]}
+
+
+def _mock_openai(args, mode):
+    """Servidor /v1/chat/completions; `mode["kind"]` = "text" | "tool"."""
+    args_json = json.dumps({"title": "Correr 5k", "start_ts": "2026-10-20T07:00:00Z", "tag": "Workout",
+                            "description": "parque"})
+    # exactamente `tokens` fragmentos (el primero junto con el nombre): el stream de
+    # un tool dura lo mismo que el de texto y que la espera del modo no-stream
+    n = max(1, args.tokens)
+    pieces = [args_json[i * len(args_json) // n:(i + 1) * len(args_json) // n] for i in range(n)]
+
+    def deltas():
+        if mode["kind"] == "text":
+            for i in range(args.tokens):
+                yield {"content": f"tok{i} "}, None
+            yield {}, "stop"
+            return
+        yield {"tool_calls": [{"index": 0, "id": "call_1", "type": "function",
+                               "function": {"name": "create_task", "arguments": pieces[0]}}]}, None
+        for piece in pieces[1:]:
+            yield {"tool_calls": [{"index": 0, "function": {"arguments": piece}}]}, None
+        yield {}, "tool_calls"
+
+    class _Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def log_message(self, *a):
+            pass
+
+        def do_POST(self):
+            req = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)))
+            time.sleep(args.first_ms / 1000)
+            if not req.get("stream"):
+                time.sleep(args.tokens * args.tok_ms / 1000)
+                if mode["kind"] == "text":
+                    msg = {"role": "assistant", "content": " ".join(f"tok{i}" for i in range(args.tokens))}
+                else:
+                    msg = {"role": "assistant", "content": None, "tool_calls": [
+                        {"id": "call_1", "type": "function",
+                         "function": {"name": "create_task", "arguments": args_json}}]}
+                raw = json.dumps({"id": "chatcmpl-bench", "object": "chat.completion", "created": 0,
+                                  "model": "gpt-4o-mini",
+                                  "choices": [{"index": 0, "message": msg, "finish_reason": "stop"}]}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(raw)))
+                self.end_headers()
+                self.wfile.write(raw)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+
+            def send(text):
+                data = text.encode()
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+
+            for i, (delta, finish) in enumerate(deltas()):
+                if i:
+                    time.sleep(args.tok_ms / 1000)
+                send(f"data: {json.dumps(_chunk(delta, finish))}\n\n")
+            send("data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=30)
+    ap.add_argument("--tokens", type=int, default=60)
+    ap.add_argument("--first-ms", type=float, default=400)
+    ap.add_argument("--tok-ms", type=float, default=15)
+    ap.add_argument("--rest-ms", type=float, default=40)
+    args = ap.parse_args()
+
+    writes = {"chat_messages": 0}
+    lock = threading.Lock()
+
+    def _rest(method, path, body):
+        time.sleep(args.rest_ms / 1000)
+        if method == "POST" and "/chat_messages" in path:
+            with lock:
+                writes["chat_messages"] += 1
+            return 201, [], {}
+        if method == "POST" and "/tasks" in path:
+            return 201, [{**json.loads(body), "id": str(uuid.uuid4())}], {}
+        return 200, [], {}
+
+    mode = {"kind": "text"}
+    llm, llm_url = _mock_openai(args, mode)
+    rest = StandIn(_rest)
+    os.environ.update({
+        "SUPABASE_URL": rest.url,
+        "SUPABASE_KEY": "anon-bench",
+        "SUPABASE_SERVICE_ROLE_KEY": "service-bench",
+        "SUPABASE_JWT_SECRET": "bench-secret-bench-secret-bench-secret",
+        "OPENAI_API_KEY": "sk-bench",
+        "OPENAI_BASE_URL": f"{llm_url}/v1",
+    })
+    from fastapi import BackgroundTasks
+    from app.api.routers import chat
+    from app.core.supabase_client import get_async_supabase_for_token
+    from app.schemas.chat import ChatMessage
+
+    payload = ChatMessage(message="Agenda correr 5k el lunes a las 7")
+
+    async def blocking():
+        sb = get_async_supabase_for_token("bench-token")
+        before = writes["chat_messages"]
+        t0 = time.perf_counter()
+        await chat.chat_message(payload, USER_ID, sb)
+        done = (time.perf_counter() - t0) * 1000
+        return done, done, writes["chat_messages"] - before
+
+    async def streaming():
+        sb = get_async_supabase_for_token("bench-token")
+        bg = BackgroundTasks()
+        before = writes["chat_messages"]
+        t0 = time.perf_counter()
+        response = await chat.chat_message_stream(payload, bg, USER_ID, sb)
+        first = done = None
+        async for part in response.body_iterator:
+            now = (time.perf_counter() - t0) * 1000
+            first = first if first is not None else now
+            if part.startswith("event: done"):
+                done = now
+            assert not part.startswith("event: error"), part
+        on_path = writes["chat_messages"] - before
+        await bg()  # lo que Starlette corre después del último byte
+        return first, done, on_path
+
+    async def run():
+        for kind in ("text", "tool"):
+            mode["kind"] = kind
+            for label, fn in (("message", blocking), ("message/stream", streaming)):
+                await fn()  # warm-up (conexiones)
+                firsts, dones, on_path = [], [], 0
+                for _ in range(args.n):
+                    first, done, w = await fn()
+                    firsts.append(first)
+                    dones.append(done)
+                    on_path += w
+                print(f"{summary(f'{kind} {label} primer byte', firsts)}")
+                print(f"{summary(f'{kind} {label} respuesta', dones)}  "
+                      f"writes en el camino={on_path / args.n:.1f}/req")
+
+    print(f"OpenAI: {args.tokens} tokens, primero a {args.first_ms:.0f} ms, {args.tok_ms:.0f} ms/token; "
+          f"PostgREST {args.rest_ms:.0f} ms")
+    asyncio.run(run())
+    rest.close()
+    llm.shutdown()
+
+
+if __name__ == "__main__":
+    main()
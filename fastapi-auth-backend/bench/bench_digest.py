@@ -0,0 +1,159 @@
+# bench/bench_digest.py
+"""
+Hora pico sintética: `--users` usuarios con 1..`--max-per-user` recordatorios
+cada uno (sesgado: la mayoría pocos, algunos muchos), todos vencidos dentro de
+los últimos `--spread` segundos, como los "09:00" de una mañana.
+
+Mismo worker (app.worker.engine) contra un PostgREST local que implementa
+claim_notifications con p_digest_window_seconds (sql/notifications_digest.sql)
+y un mock de Graph con `--graph-ms` de latencia:
+
+  - sin digest (antes): un template rm_task_summary por recordatorio
+  - digest: DISPATCHER_DIGEST_WINDOW_SECONDS=`--window`, un mensaje por usuario
+
+Reporta llamadas a Graph por recordatorio, writes de estado y tiempo total, y
+verifica que cada recordatorio quede `sent` una sola vez y que los digests
+cubran exactamente los recordatorios.
+
+    python -m bench.bench_digest [--users 300] [--max-per-user 10] [--window 120] [--graph-ms 50]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from bench._standin import StandIn
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=300)
+    ap.add_argument("--max-per-user", type=int, default=10)
+    ap.add_argument("--spread", type=float, default=60)
+    ap.add_argument("--window", type=float, default=120)
+    ap.add_argument("--graph-ms", type=float, default=50)
+    ap.add_argument("--concurrency", type=int, default=16)
+    args = ap.parse_args()
+
+    rng = random.Random(7)
+    lock = threading.Lock()
+    state = {}
+
+    def _iso(epoch):
+        return datetime.fromtimestamp(epoch, timezone.utc).isoformat()
+
+    def _reset():
+        now = time.time()
+        rows = []
+        for u in range(args.users):
+            # Pareto: la mayoría 1-2 recordatorios, una cola larga hasta max-per-user
+            k = min(args.max_per_user, int(rng.paretovariate(1.2)))
+            uid = str(uuid.UUID(int=u + 10**6))
+            for j in range(k):
+                due = now - rng.uniform(0, args.spread)
+                rows.append({
+                    "id": str(uuid.UUID(int=len(rows) + 1)), "user_id": uid, "channel": "whatsapp",
+                    "attempts": 0, "scheduled_for": _iso(due), "_due": due,
+                    "payload": {"task_snapshot": {"title": f"task {j}", "start_ts": _iso(due + 900)}},
+                })
+        state.update(rows=rows, free={r["id"] for r in rows}, status={}, graph=0, covered=0,
+                     writes=0, claims=0)
+
+    def _db(method, path, body):
+        url = urlsplit(path)
+        if url.path.endswith("/rpc/claim_notifications"):
+            req = json.loads(body)
+            horizon = time.time() + req.get("p_digest_window_seconds", 0)
+            with lock:
+                state["claims"] += 1
+                free = [r for r in state["rows"] if r["id"] in state["free"]]
+                due = sorted((r for r in free if r["_due"] <= time.time()),
+                             key=lambda r: (r["_due"], r["user_id"]))[:req["p_limit"]]
+                picked = {r["id"] for r in due}
+                if req.get("p_digest_window_seconds"):
+                    # todas son rm_task_summary "en": misma digest key; ventana desde la primera
+                    # vencida del usuario y hasta p_digest_max - 1 hermanas por usuario
+                    firsts, per_user = {}, Counter()
+                    for r in due:
+                        firsts[r["user_id"]] = min(r["_due"], firsts.get(r["user_id"], r["_due"]))
+                    for r in sorted(free, key=lambda r: r["_due"]):
+                        uid = r["user_id"]
+                        if (uid in firsts and r["id"] not in picked and r["_due"] <= horizon
+                                and r["_due"] <= firsts[uid] + req["p_digest_window_seconds"]
+                                and per_user[uid] < req["p_digest_max"] - 1):
+                            per_user[uid] += 1
+                            picked.add(r["id"])
+                state["free"] -= picked
+                batch = [r for r in free if r["id"] in picked]
+            return 200, [{k: v for k, v in r.items() if k != "_due"} | {"processing": True,
+                                                                          "claimed_by": req["p_worker"]}
+                         for r in batch], {}
+        if url.path.endswith("/rpc/apply_notification_outcomes"):
+            with lock:
+                state["writes"] += 1
+                for o in json.loads(body)["p_rows"]:
+                    if "status" not in o:
+                        state["free"].add(o["id"])  # hermana liberada sin enviar
+                        continue
+                    state["status"].setdefault(o["id"], []).append(o["status"])
+            return 200, 0, {}
+        if url.path.endswith("/profiles"):
+            ids = unquote(parse_qs(url.query)["id"][0])[4:-1].split(",")
+            return 200, [{"id": i, "phone": "5215550000000", "notify_enabled": True} for i in ids], {}
+        return 200, [], {}
+
+    def _graph(method, path, body):
+        tpl = json.loads(body)["template"]
+        body_params = next(c for c in tpl["components"] if c["type"] == "body")["parameters"]
+        covered = int(body_params[0]["text"]) if tpl["name"] == "rm_task_digest" else 1
+        time.sleep(args.graph_ms / 1000)
+        with lock:
+            state["graph"] += 1
+            state["covered"] += covered
+        return 200, {"messages": [{"id": "wamid.bench"}]}, {}
+
+    db, graph = StandIn(_db), StandIn(_graph)
+    os.environ.update({
+        "SUPABASE_URL": db.url,
+        "SUPABASE_SERVICE_ROLE_KEY": "service-bench",
+        "META_WA_TOKEN": "bench",
+        "META_WA_PHONE_ID": "1000",
+        "META_WA_GRAPH_URL": graph.url,
+        "WORKER_STATS_SECONDS": "0",
+        "META_WA_RATE_PER_SECOND": "0",  # el mock no limita; sin bucket
+    })
+    from app.worker import engine
+
+    def run(label, window):
+        rng.seed(7)
+        _reset()
+        n = len(state["rows"])
+        t0 = time.perf_counter()
+        asyncio.run(engine.arun(once=True, concurrency=args.concurrency, digest_window=window))
+        wall = time.perf_counter() - t0
+        statuses = Counter(",".join(s) for s in state["status"].values())
+        assert statuses == Counter({"sent": n}), (label, statuses)
+        assert state["covered"] == n, (label, state["covered"], n)
+        print(f"{label:<22} {n:>6} {state['graph']:>7} {state['graph'] / n:>10.2f} {state['writes']:>7} "
+              f"{state['claims']:>7} {wall:>7.2f} {n / wall:>9.0f}")
+
+    print(f"{args.users} usuarios, hasta {args.max_per_user} recordatorios c/u en {args.spread:.0f} s, "
+          f"Graph {args.graph_ms:.0f} ms, concurrency={args.concurrency}")
+    print(f"{'config':<22} {'recs':>6} {'graph':>7} {'graph/rec':>10} {'writes':>7} {'claims':>7} "
+          f"{'wall s':>7} {'recs/s':>9}")
+    run("sin digest (antes)", 0)
+    run(f"digest {args.window:.0f}s", args.window)
+    db.close()
+    graph.close()
+
+
+if __name__ == "__main__":
+    main()
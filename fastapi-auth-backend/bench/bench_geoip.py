@@ -0,0 +1,111 @@
+# bench/bench_geoip.py
+"""
+Geolocalización local (app.core.geoip) vs la consulta HTTP a ip-api.com que
+hacía get_location_from_ip:
+
+  - genera una base sintética de `--ranges` rangos IPv4 + IPv6 (archivo temporal)
+  - lookups en frío (sin LRU) y con tráfico sesgado (pocas IPs calientes)
+  - verifica cada respuesta contra el rango esperado
+
+La llamada a ip-api se simula con un servidor local de `--http-ms` de latencia
+(el endpoint real además limita a 45 requests/min), con un AsyncClient nuevo por
+consulta como antes.
+
+    python -m bench.bench_geoip [--ranges 500000] [--lookups 200000] [--http-ms 150]
+"""
+
+import argparse
+import asyncio
+import ipaddress
+import os
+import random
+import tempfile
+import time
+
+from bench._standin import StandIn, percentile
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--ranges", type=int, default=500_000)
+    ap.add_argument("--lookups", type=int, default=200_000)
+    ap.add_argument("--hot", type=int, default=2_000, help="IPs distintas en el tráfico sesgado")
+    ap.add_argument("--http-ms", type=float, default=150)
+    ap.add_argument("--http-n", type=int, default=50)
+    args = ap.parse_args()
+
+    from app.core import geoip
+
+    rng = random.Random(3)
+    # rangos IPv4 contiguos de tamaño variable a partir de 1.0.0.0, algunos IPv6 al final
+    rows, expected, start = [], [], int(ipaddress.IPv4Address("1.0.0.0"))
+    n6 = args.ranges // 10
+    for i in range(args.ranges - n6):
+        size = rng.choice((256, 512, 1024, 4096))
+        rows.append((str(ipaddress.IPv4Address(start)), str(ipaddress.IPv4Address(start + size - 1)),
+                     f"C{i % 200}", f"city {i % 5000}", str(rng.uniform(-60, 60)), str(rng.uniform(-180, 180))))
+        expected.append((start, start + size - 1, f"C{i % 200}"))
+        start += size + rng.choice((0, 0, 256))  # algunos huecos sin ubicación
+    base6 = int(ipaddress.IPv6Address("2a00::"))
+    for i in range(n6):
+        a = base6 + i * 2**80
+        rows.append((str(ipaddress.IPv6Address(a)), str(ipaddress.IPv6Address(a + 2**80 - 1)), "V6", "", "", ""))
+
+    path = os.path.join(tempfile.mkdtemp(prefix="rm-geoip-"), "geoip.bin")
+    t0 = time.perf_counter()
+    geoip.build(rows, path)
+    print(f"build: {args.ranges} rangos en {time.perf_counter() - t0:.1f} s, {os.path.getsize(path) / 1e6:.1f} MB")
+
+    def sample(k):
+        out = []
+        for _ in range(k):
+            lo, hi, country = expected[rng.randrange(len(expected))]
+            out.append((str(ipaddress.IPv4Address(rng.randint(lo, hi))), country))
+        return out
+
+    def run(label, db, ips):
+        lat = []
+        t0 = time.perf_counter()
+        for ip, country in ips:
+            t = time.perf_counter()
+            loc = db.lookup(ip)
+            lat.append((time.perf_counter() - t) * 1e6)
+            assert loc is not None and loc.country == country, (ip, loc, country)
+        wall = time.perf_counter() - t0
+        print(f"{label:<26} {len(ips) / wall:>12,.0f} lookups/s  p50={percentile(lat, 50):6.2f} us  "
+              f"p99={percentile(lat, 99):6.2f} us")
+
+    cold = geoip.RangeDB(path, cache_size=0)
+    run("frío (sin LRU)", cold, sample(args.lookups))
+    hot_ips = sample(args.hot)
+    skewed = [hot_ips[min(len(hot_ips) - 1, int(rng.paretovariate(1.1)) - 1)] for _ in range(args.lookups)]
+    lru = geoip.RangeDB(path)
+    run(f"sesgado ({args.hot} IPs) + LRU", lru, skewed)
+    print(f"LRU: {lru.lookup.cache_info()}")
+    v6 = geoip.RangeDB(path, cache_size=0).lookup(str(ipaddress.IPv6Address(base6 + 5 * 2**80 + 7)))
+    assert v6 is not None and v6.country == "V6" and v6.latitude is None, v6
+    assert cold.lookup("0.0.0.1") is None
+
+    # antes: un AsyncClient nuevo + GET a ip-api por consulta
+    import httpx
+
+    srv = StandIn(lambda m, p, b: (time.sleep(args.http_ms / 1000) or 200,
+                                   {"status": "success", "city": "X", "country": "Y"}, {}))
+
+    async def http_lookups():
+        lat = []
+        for _ in range(args.http_n):
+            t = time.perf_counter()
+            async with httpx.AsyncClient() as client:
+                (await client.get(f"{srv.url}/json/8.8.8.8", timeout=5)).json()
+            lat.append((time.perf_counter() - t) * 1e6)
+        return lat
+
+    lat = asyncio.run(http_lookups())
+    print(f"{'ip-api (antes, simulado)':<26} {1e6 / (sum(lat) / len(lat)):>12,.0f} lookups/s  "
+          f"p50={percentile(lat, 50):6.0f} us  p99={percentile(lat, 99):6.0f} us")
+    srv.close()
+
+
+if __name__ == "__main__":
+    main()
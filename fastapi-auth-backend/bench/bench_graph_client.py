@@ -0,0 +1,175 @@
+# bench/bench_graph_client.py
+"""
+Latencia por mensaje hacia Graph API contra mocks TLS locales:
+
+  - antes: httpx.Client nuevo por envío (app/core/whatsapp) y requests.post sin
+    sesión (app/integrations/whatsapp_client); cada mensaje paga TCP + TLS
+  - después: GraphClient compartido (keep-alive), por HTTP/1.1 y por HTTP/2
+    (un mock h2 con ALPN; requiere el paquete 'h2')
+
+`--connect-ms` simula los round trips de TCP + TLS hacia un host remoto en cada
+conexión NUEVA y `--graph-ms` el tiempo de respuesta de Graph. Se reportan
+latencias secuenciales y con `--concurrency` envíos en vuelo, más el número de
+conexiones que abrió cada variante.
+
+    python -m bench.bench_graph_client [--n 200] [--graph-ms 20] [--connect-ms 30] [--concurrency 32]
+"""
+
+import argparse
+import asyncio
+import importlib.util
+import json
+import os
+import ssl
+import threading
+import time
+
+from bench._standin import StandIn, percentile, self_signed_cert
+
+_BODY = {"messages": [{"id": "wamid.bench"}]}
+
+
+class H2StandIn:
+    """Mock HTTP/2 (TLS + ALPN h2) en su propio event loop; responde _BODY tras `latency_ms`."""
+
+    def __init__(self, latency_ms: float, connect_ms: float):
+        import h2.config
+        import h2.connection
+        import h2.events
+
+        cert, key = self_signed_cert()
+        self.cert_path = cert
+        self.connections = 0
+        ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        ctx.load_cert_chain(cert, key)
+        ctx.set_alpn_protocols(["h2"])
+        loop = asyncio.new_event_loop()
+        raw = json.dumps(_BODY).encode()
+        outer = self
+
+        class _Proto(asyncio.Protocol):
+            def connection_made(self, transport):
+                outer.connections += 1
+                self.t = transport
+                self.ready = loop.time() + connect_ms / 1000  # hasta aquí la conexión "no ha llegado"
+                self.conn = h2.connection.H2Connection(config=h2.config.H2Configuration(client_side=False))
+                self.conn.initiate_connection()
+                transport.write(self.conn.data_to_send())
+
+            def data_received(self, data):
+                for ev in self.conn.receive_data(data):
+                    if isinstance(ev, h2.events.DataReceived):
+                        self.conn.acknowledge_received_data(ev.flow_controlled_length, ev.stream_id)
+                    elif isinstance(ev, h2.events.StreamEnded):
+                        delay = max(0.0, self.ready - loop.time()) + latency_ms / 1000
+                        loop.call_later(delay, self._respond, ev.stream_id)
+                self.t.write(self.conn.data_to_send())
+
+            def _respond(self, stream_id):
+                if self.t.is_closing():
+                    return
+                self.conn.send_headers(stream_id, [
+                    (":status", "200"), ("content-type", "application/json"), ("content-length", str(len(raw))),
+                ])
+                self.conn.send_data(stream_id, raw, end_stream=True)
+                self.t.write(self.conn.data_to_send())
+
+        server = loop.run_until_complete(loop.create_server(_Proto, "127.0.0.1", 0, ssl=ctx))
+        self.url = f"https://127.0.0.1:{server.sockets[0].getsockname()[1]}"
+        threading.Thread(target=loop.run_forever, daemon=True).start()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=200)
+    ap.add_argument("--graph-ms", type=float, default=20)
+    ap.add_argument("--connect-ms", type=float, default=30)
+    ap.add_argument("--concurrency", type=int, default=32)
+    args = ap.parse_args()
+
+    def _route(method, path, body):
+        time.sleep(args.graph_ms / 1000)
+        return 200, _BODY, {}
+
+    h1 = StandIn(_route, tls=True, connect_ms=args.connect_ms)
+    h2srv = H2StandIn(args.graph_ms, args.connect_ms) if importlib.util.find_spec("h2") else None
+    os.environ.update({
+        "META_WA_TOKEN": "bench",
+        "META_WA_PHONE_ID": "1000",
+        "META_WA_GRAPH_URL": f"{h1.url}/v19.0",
+        "META_WA_CA_BUNDLE": h1.cert_path,
+        "META_WA_RATE_PER_SECOND": "0",  # aquí se mide el pool, no el rate limit
+    })
+    import httpx
+    from app.core import whatsapp
+
+    payload = whatsapp._template_payload("5215550000000", "rm_task_summary", "en", None,
+                                         [{"type": "text", "text": "bench"}], None)
+    h1_ctx = ssl.create_default_context(cafile=h1.cert_path)
+    h1_url = f"{h1.url}/v19.0/1000/messages"
+
+    def sequential(label, srv, send):
+        srv.connections = 0
+        lat = []
+        for _ in range(args.n):
+            t0 = time.perf_counter()
+            send()
+            lat.append((time.perf_counter() - t0) * 1000)
+        print(f"{label:<34} {'1':>4} {percentile(lat, 50):>8.1f} {percentile(lat, 99):>8.1f} "
+              f"{args.n / (sum(lat) / 1000):>8.0f} {srv.connections:>6}")
+
+    def concurrent(label, srv, asend):
+        srv.connections = 0
+
+        async def go():
+            sem = asyncio.Semaphore(args.concurrency)
+            lat = []
+
+            async def one():
+                async with sem:
+                    t0 = time.perf_counter()
+                    await asend()
+                    lat.append((time.perf_counter() - t0) * 1000)
+
+            t0 = time.perf_counter()
+            await asyncio.gather(*(one() for _ in range(args.n)))
+            return lat, time.perf_counter() - t0
+
+        lat, wall = asyncio.run(go())
+        print(f"{label:<34} {args.concurrency:>4} {percentile(lat, 50):>8.1f} {percentile(lat, 99):>8.1f} "
+              f"{args.n / wall:>8.0f} {srv.connections:>6}")
+
+    def per_call_httpx():
+        with httpx.Client(timeout=30, verify=h1_ctx) as c:
+            c.post(h1_url, json=payload, headers={"Authorization": "Bearer bench"}).json()
+
+    async def per_call_httpx_async():
+        async with httpx.AsyncClient(timeout=30, verify=h1_ctx) as c:
+            (await c.post(h1_url, json=payload, headers={"Authorization": "Bearer bench"})).json()
+
+    print(f"{args.n} mensajes, Graph {args.graph_ms:.0f} ms, conexión nueva +{args.connect_ms:.0f} ms (TCP + TLS simulado)")
+    print(f"{'variante':<34} {'c':>4} {'p50 ms':>8} {'p99 ms':>8} {'msg/s':>8} {'conns':>6}")
+
+    sequential("httpx.Client por envío (antes)", h1, per_call_httpx)
+    if importlib.util.find_spec("requests"):
+        import requests
+        sequential("requests.post sin sesión (antes)", h1, lambda: requests.post(
+            h1_url, json=payload, headers={"Authorization": "Bearer bench"}, timeout=20, verify=h1.cert_path).json())
+    shared_h1 = whatsapp.GraphClient(f"{h1.url}/v19.0", http2=False, ca_bundle=h1.cert_path)
+    sequential("send_template_positional (pool)", h1, lambda: whatsapp.send_template_positional(
+        "5215550000000", "rm_task_summary", "en", body_params=[{"type": "text", "text": "bench"}]))
+    if h2srv is not None:
+        shared_h2 = whatsapp.GraphClient(f"{h2srv.url}/v19.0", http2=True, ca_bundle=h2srv.cert_path)
+        sequential("GraphClient HTTP/2", h2srv, lambda: shared_h2.post("1000/messages", payload))
+
+    concurrent("AsyncClient por envío (antes)", h1, per_call_httpx_async)
+    concurrent("GraphClient HTTP/1.1", h1, lambda: shared_h1.apost("1000/messages", payload))
+    if h2srv is not None:
+        concurrent("GraphClient HTTP/2", h2srv, lambda: shared_h2.apost("1000/messages", payload))
+        shared_h2.close()
+    shared_h1.close()
+    h1.close()
+
+
+if __name__ == "__main__":
+    main()
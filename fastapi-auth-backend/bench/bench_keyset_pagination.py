@@ -0,0 +1,94 @@
+# bench/bench_keyset_pagination.py
+"""
+Latencia por página: OFFSET (page/limit) vs keyset (cursor) sobre 100k filas
+sintéticas de un usuario (+ ruido de otros usuarios), en SQLite en memoria
+con el mismo índice (user_id, start_ts, id) que sql/keyset_indexes.sql.
+Las consultas tienen la misma forma que generan los routers:
+
+    OFFSET:  ... ORDER BY start_ts, id LIMIT ? OFFSET ?
+    keyset:  ... AND start_ts >= ? AND (start_ts > ? OR id > ?) ORDER BY start_ts, id LIMIT ?
+
+    python -m bench.bench_keyset_pagination [--rows 100000] [--limit 50]
+"""
+
+import argparse
+import random
+import sqlite3
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from bench._standin import percentile
+
+USER_ID = str(uuid.uuid4())
+
+
+def build(rows: int) -> sqlite3.Connection:
+    db = sqlite3.connect(":memory:")
+    db.execute(
+        "CREATE TABLE tasks (id TEXT PRIMARY KEY, user_id TEXT, title TEXT, start_ts TEXT, status TEXT)"
+    )
+    db.execute("CREATE INDEX idx_tasks_user_start_id ON tasks (user_id, start_ts, id)")
+    rnd = random.Random(7)
+    base = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+    def gen(user, n):
+        for i in range(n):
+            # minutos enteros: muchos empates en start_ts para ejercitar el desempate por id
+            ts = base + timedelta(minutes=rnd.randrange(0, rows // 4))
+            yield (str(uuid.UUID(int=rnd.getrandbits(128))), user, f"task {i}", ts.isoformat(), "pending")
+
+    db.executemany("INSERT INTO tasks VALUES (?,?,?,?,?)", gen(USER_ID, rows))
+    for _ in range(5):
+        db.executemany("INSERT INTO tasks VALUES (?,?,?,?,?)", gen(str(uuid.uuid4()), rows // 5))
+    db.execute("ANALYZE")
+    return db
+
+
+def timed(db, sql, params, repeat):
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = db.execute(sql, params).fetchall()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return percentile(samples, 50), out
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=100_000)
+    ap.add_argument("--limit", type=int, default=50)
+    ap.add_argument("--repeat", type=int, default=20)
+    args = ap.parse_args()
+
+    db = build(args.rows)
+    last_page = args.rows // args.limit
+    depths = sorted({1, 10, 100, last_page // 4, last_page // 2, last_page})
+
+    offset_sql = (
+        "SELECT * FROM tasks WHERE user_id = ? ORDER BY start_ts, id LIMIT ? OFFSET ?"
+    )
+    keyset_sql = (
+        "SELECT * FROM tasks WHERE user_id = ? AND start_ts >= ? AND (start_ts > ? OR id > ?) "
+        "ORDER BY start_ts, id LIMIT ?"
+    )
+    first_sql = "SELECT * FROM tasks WHERE user_id = ? ORDER BY start_ts, id LIMIT ?"
+
+    print(f"{args.rows} filas del usuario, limit={args.limit}  (p50 de {args.repeat} corridas)")
+    print(f"{'page':>6} {'OFFSET ms':>10} {'keyset ms':>10}")
+    for page in depths:
+        offset = (page - 1) * args.limit
+        t_off, rows_off = timed(db, offset_sql, (USER_ID, args.limit, offset), args.repeat)
+        if page == 1:
+            t_key, rows_key = timed(db, first_sql, (USER_ID, args.limit), args.repeat)
+        else:
+            # cursor = última fila de la página anterior (lo que mandaría X-Next-Cursor)
+            prev = db.execute(offset_sql, (USER_ID, 1, offset - 1)).fetchone()
+            ts, last_id = prev[3], prev[0]
+            t_key, rows_key = timed(db, keyset_sql, (USER_ID, ts, ts, last_id, args.limit), args.repeat)
+        assert rows_off == rows_key, f"páginas distintas en page={page}"
+        print(f"{page:>6} {t_off:>10.3f} {t_key:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+# bench/bench_login_anomaly.py
+"""
+Latencia del análisis de anomalías en /auth/login con logins concurrentes en
+un solo event loop (como uvicorn):
+
+  - antes : process_login_attempt síncrono dentro del `async def` (SELECT e
+            INSERT de login_history, SELECT de profiles y OpenAI bloqueantes)
+            para TODOS los logins con historial
+  - ahora : app.api.security.anomaly_agent.process_login_attempt (reglas en
+            proceso, OpenAI async con timeout solo para los dudosos, INSERT
+            por la cola de login_log)
+
+PostgREST y OpenAI son servidores locales con `--rest-ms` / `--llm-ms` de
+latencia. Mezcla de logins: ~80% desde red y dispositivo conocidos, ~12%
+dispositivo nuevo en red conocida, ~8% red y dispositivo nuevos (dudosos).
+Los logins llegan a `--rps` por segundo (Poisson). Reporta p50/p99 por login,
+llamadas a OpenAI e INSERTs a login_history. Una segunda ronda "ahora" repite
+los mismos logins (historial releído, fuera del cooldown) para mostrar el
+cache de decisiones; al final imprime las métricas login.anomaly.* (hit rate, casos
+por request, tokens).
+
+    python -m bench.bench_login_anomaly [--logins 400] [--rps 40] [--rest-ms 20] [--llm-ms 700]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from bench._standin import StandIn, summary
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--logins", type=int, default=400)
+    ap.add_argument("--rps", type=float, default=40)
+    ap.add_argument("--rest-ms", type=float, default=20)
+    ap.add_argument("--llm-ms", type=float, default=700)
+    args = ap.parse_args()
+
+    lock = threading.Lock()
+    counts = {"llm": 0, "inserts": 0, "inserted_rows": 0}
+    old = (datetime.now(timezone.utc) - timedelta(hours=6)).isoformat()
+
+    def _history(user_id):
+        return [{"user_id": user_id, "ip_address": f"10.1.{i}.7", "user_agent": "Mozilla/5.0 (bench)",
+                 "timestamp": old} for i in range(4)]
+
+    def _rest(method, path, body):
+        time.sleep(args.rest_ms / 1000)
+        url = urlsplit(path)
+        if url.path.endswith("/login_history"):
+            if method == "POST":
+                rows = json.loads(body)
+                with lock:
+                    counts["inserts"] += 1
+                    counts["inserted_rows"] += len(rows) if isinstance(rows, list) else 1
+                return 201, [], {}
+            user_id = unquote(parse_qs(url.query)["user_id"][0])[3:]
+            return 200, _history(user_id), {}
+        if url.path.endswith("/profiles"):
+            return 200, {"registration_location": "Tijuana, Mexico"}, {}
+        return 200, [], {}
+
+    def _llm(method, path, body):
+        time.sleep(args.llm_ms / 1000)
+        with lock:
+            counts["llm"] += 1
+        req = json.loads(body)
+        prompt = req["messages"][-1]["content"]
+        cases = re.findall(r"^Caso (\d+):", prompt, re.M)
+        content = json.dumps({n: "CONTINUAR" for n in cases}) if cases else "CONTINUAR"
+        tokens = sum(len(m["content"]) for m in req["messages"]) // 4
+        return 200, {
+            "id": "chatcmpl-bench", "object": "chat.completion", "created": 0, "model": "gpt-4o-mini",
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": tokens, "completion_tokens": 6 * max(1, len(cases)),
+                      "total_tokens": tokens + 6 * max(1, len(cases))},
+        }, {}
+
+    rest, llm = StandIn(_rest), StandIn(_llm)
+    os.environ.update({
+        "SUPABASE_URL": rest.url,
+        "SUPABASE_KEY": "anon-bench",
+        "SUPABASE_SERVICE_ROLE_KEY": "service-bench",
+        "OPENAI_API_KEY": "sk-bench",
+        "OPENAI_BASE_URL": f"{llm.url}/v1",
+    })
+    import openai
+    from app.api.security import anomaly_agent, login_log
+    from app.core import metrics
+    from app.core.supabase_client import get_supabase_for_token
+
+    def legacy_process_login_attempt(sb, user_id, ip_address, user_agent):
+        """El process_login_attempt de antes (sin los prints)."""
+        login_history = (sb.table("login_history").select("*").eq("user_id", user_id)
+                         .order("timestamp", desc=True).limit(5).execute().data)
+        sb.table("login_history").insert({
+            "user_id": user_id, "ip_address": ip_address, "user_agent": user_agent,
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+        }).execute()
+        if len(login_history) < 3:
+            return "CONTINUAR"
+        if datetime.now(timezone.utc) - datetime.fromisoformat(login_history[0]["timestamp"]) < timedelta(minutes=5):
+            return "RECHAZAR"
+        sb.table("profiles").select("registration_location").eq("id", user_id).single().execute()
+        response = openai.OpenAI().chat.completions.create(
+            model="gpt-4o-mini", messages=[{"role": "user", "content": "bench"}], max_tokens=50, temperature=0.1,
+        )
+        return response.choices[0].message.content.strip().upper()
+
+    def _attempts(seed):
+        rng = random.Random(seed)
+        out = []
+        for i in range(args.logins):
+            x = rng.random()
+            ip, ua = "10.1.0.42", "Mozilla/5.0 (bench)"
+            if x > 0.92:
+                ip, ua = f"203.0.{i % 250}.9", "curl/8.0"
+            elif x > 0.80:
+                ua = "Mozilla/5.0 (other)"
+            out.append((str(uuid.UUID(int=seed * 10**6 + i)), ip, ua, rng.expovariate(args.rps)))
+        return out
+
+    async def run(label, login, seed):
+        attempts = _attempts(seed)
+        for k in counts:
+            counts[k] = 0
+        lat = []
+
+        async def one(user_id, ip, ua):
+            t0 = time.perf_counter()
+            decision = await login(user_id, ip, ua)
+            lat.append((time.perf_counter() - t0) * 1000)
+            assert decision in ("CONTINUAR", "RECHAZAR"), decision
+
+        tasks = []
+        for user_id, ip, ua, gap in attempts:
+            await asyncio.sleep(gap)
+            tasks.append(asyncio.create_task(one(user_id, ip, ua)))
+        await asyncio.gather(*tasks)
+        await login_log.aflush()
+        print(f"{summary(label, lat)}  openai={counts['llm']:<4} inserts={counts['inserts']:<4} "
+              f"rows={counts['inserted_rows']}")
+
+    async def legacy(user_id, ip, ua):
+        # como en AuthService antes: llamada síncrona dentro del async def
+        return legacy_process_login_attempt(get_supabase_for_token("service-bench"), user_id, ip, ua)
+
+    async def tiered(user_id, ip, ua):
+        return await anomaly_agent.process_login_attempt(user_id, ip, ua)
+
+    async def both():
+        print(f"{args.logins} logins a {args.rps:.0f}/s, PostgREST {args.rest_ms:.0f} ms, OpenAI {args.llm_ms:.0f} ms")
+        await run("antes (síncrono)", legacy, 1)
+        await run("ahora (por etapas)", tiered, 2)
+        # los mismos usuarios otra vez, fuera del cooldown: historial y decisiones en cache
+        anomaly_agent._history.clear()
+        await run("ahora, repetidos", tiered, 2)
+        snap = metrics.snapshot()
+        for name, value in sorted({**snap["counters"], **snap["gauges"]}.items()):
+            if name.startswith("login.anomaly."):
+                print(f"  {name:<48} {value:,.2f}")
+
+    asyncio.run(both())
+    rest.close()
+    llm.close()
+
+
+if __name__ == "__main__":
+    main()
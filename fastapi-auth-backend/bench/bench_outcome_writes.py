@@ -0,0 +1,121 @@
+# bench/bench_outcome_writes.py
+"""
+Write-back de estados de notifications: filas escritas por segundo con un
+UPDATE por notificación (antes) vs OutcomeBuffer (RPC
+apply_notification_outcomes, un round trip por flush), contra un PostgREST
+local con `--latency-ms`. También el fallback por fila cuando no hay RPC.
+
+    python -m bench.bench_outcome_writes [--n 1000] [--latency-ms 5] [--flush-rows 50]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+
+from bench._standin import StandIn
+
+
+def _update(k: int) -> dict:
+    return {
+        "status": "sent", "processing": False, "attempts": 1,
+        "payload": {"last_delivery": {"messages": [{"id": f"wamid.{k}"}]}},
+        "updated_at": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=1000)
+    ap.add_argument("--latency-ms", type=float, default=5)
+    ap.add_argument("--flush-rows", type=int, default=50)
+    args = ap.parse_args()
+
+    lock = threading.Lock()
+    state = {"rows": 0, "rpc": True}
+
+    def _route(method, path, body):
+        time.sleep(args.latency_ms / 1000)
+        if urlsplit(path).path.endswith("/rpc/apply_notification_outcomes"):
+            if not state["rpc"]:
+                return 404, {"code": "PGRST202", "message": "Could not find the function", "hint": None, "details": None}, {}
+            n = len(json.loads(body)["p_rows"])
+            with lock:
+                state["rows"] += n
+            return 200, n, {}
+        if method == "PATCH":
+            with lock:
+                state["rows"] += 1
+        return 200, [], {}
+
+    srv = StandIn(_route)
+    os.environ.update({"SUPABASE_URL": srv.url, "SUPABASE_SERVICE_ROLE_KEY": "service-bench"})
+    from postgrest import SyncPostgrestClient
+    from app.worker import engine, outcomes
+
+    ids = [str(uuid.uuid4()) for _ in range(args.n)]
+    headers = {"apikey": "service-bench", "Authorization": "Bearer service-bench"}
+
+    def run(label, fn):
+        srv.reset_counts()
+        state["rows"] = 0
+        t0 = time.perf_counter()
+        fn()
+        dt = time.perf_counter() - t0
+        assert state["rows"] == args.n, (label, state["rows"])
+        print(f"{label:<34} {srv.total_requests():>6} {dt:>8.2f} {args.n / dt:>10.0f}")
+
+    def per_row_sync():
+        with SyncPostgrestClient(f"{srv.url}/rest/v1", headers=headers) as sb:
+            for k, nid in enumerate(ids):
+                sb.table("notifications").update(_update(k)).eq("id", nid).execute()
+
+    def sync_buffer():
+        with SyncPostgrestClient(f"{srv.url}/rest/v1", headers=headers) as sb:
+            buf = outcomes.SyncOutcomeBuffer(sb, max_rows=args.flush_rows)
+            for k, nid in enumerate(ids):
+                buf.add(nid, _update(k))
+            buf.flush()
+
+    def per_row_async():
+        async def go():
+            sb = engine._sb()
+            sem = asyncio.Semaphore(16)  # escrituras en vuelo como DISPATCHER_CONCURRENCY=16
+
+            async def one(k, nid):
+                async with sem:
+                    await sb.table("notifications").update(_update(k)).eq("id", nid).execute()
+            await asyncio.gather(*(one(k, nid) for k, nid in enumerate(ids)))
+            await sb.aclose()
+        asyncio.run(go())
+
+    def async_buffer():
+        async def go():
+            sb = engine._sb()
+            buf = outcomes.OutcomeBuffer(sb, max_rows=args.flush_rows)
+            for k, nid in enumerate(ids):
+                buf.add(nid, _update(k))
+                if k % 20 == 19:
+                    await asyncio.sleep(0)  # como el pipeline: los resultados llegan de a poco
+            await buf.flush()
+            await sb.aclose()
+        asyncio.run(go())
+
+    print(f"{args.n} resultados, PostgREST {args.latency_ms} ms, flush cada {args.flush_rows} filas")
+    print(f"{'modo':<34} {'trips':>6} {'seg':>8} {'filas/s':>10}")
+    run("dispatcher: UPDATE por fila", per_row_sync)
+    run("dispatcher: SyncOutcomeBuffer", sync_buffer)
+    run("reminder_loop: UPDATE por fila c=16", per_row_async)
+    run("reminder_loop: OutcomeBuffer", async_buffer)
+    state["rpc"] = False
+    run("OutcomeBuffer sin RPC (fallback)", async_buffer)
+    srv.close()
+
+
+if __name__ == "__main__":
+    main()
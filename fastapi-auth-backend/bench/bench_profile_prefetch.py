@@ -0,0 +1,86 @@
+# bench/bench_profile_prefetch.py
+"""
+Lookup de contactos (profiles.phone / notify_enabled) para los lotes que
+reclama el worker: un SELECT por notificación (antes, N+1) vs
+profile_cache.aprefetch (un `in_` por lote solo con los user_id que no están
+en cache), con cache frío y caliente. PostgREST local con `--latency-ms`.
+
+    python -m bench.bench_profile_prefetch [--n 1000] [--users 50] [--batch 20] [--latency-ms 5]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import time
+import uuid
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from bench._standin import StandIn
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=1000)
+    ap.add_argument("--users", type=int, default=50)
+    ap.add_argument("--batch", type=int, default=20)
+    ap.add_argument("--latency-ms", type=float, default=5)
+    args = ap.parse_args()
+
+    users = [str(uuid.uuid4()) for _ in range(args.users)]
+    rnd = random.Random(3)
+    # pocos usuarios concentran muchos recordatorios (rutinas diarias)
+    notifs = [{"user_id": rnd.choices(users, weights=range(args.users, 0, -1))[0]} for _ in range(args.n)]
+    batches = [notifs[i:i + args.batch] for i in range(0, args.n, args.batch)]
+
+    def _route(method, path, body):
+        time.sleep(args.latency_ms / 1000)
+        raw = unquote(parse_qs(urlsplit(path).query)["id"][0])
+        ids = raw[4:-1].split(",") if raw.startswith("in.") else [raw[3:]]
+        return 200, [{"id": uid, "phone": "5215550000000", "notify_enabled": True} for uid in ids], {}
+
+    srv = StandIn(_route)
+    os.environ.update({"SUPABASE_URL": srv.url, "SUPABASE_SERVICE_ROLE_KEY": "service-bench"})
+    from app.core import metrics, profile_cache
+    from app.worker import engine
+
+    async def per_row(sb):
+        sem = asyncio.Semaphore(16)
+
+        async def one(uid):
+            async with sem:
+                await sb.table("profiles").select("phone, notify_enabled").eq("id", uid).limit(1).execute()
+        for b in batches:
+            await asyncio.gather(*(one(n["user_id"]) for n in b))
+
+    async def prefetch(sb):
+        for b in batches:
+            contacts = await profile_cache.aprefetch(sb, (n["user_id"] for n in b))
+            assert all(profile_cache.phone(contacts[n["user_id"]]) for n in b)
+
+    def run(label, fn):
+        async def go():
+            sb = engine._sb()
+            await fn(sb)
+            await sb.aclose()
+        srv.reset_counts()
+        t0 = time.perf_counter()
+        asyncio.run(go())
+        dt = (time.perf_counter() - t0) * 1000
+        print(f"{label:<30} {srv.total_requests():>8} {dt:>9.0f}")
+
+    print(f"{args.n} notificaciones de {args.users} usuarios en lotes de {args.batch}, PostgREST {args.latency_ms} ms")
+    print(f"{'modo':<30} {'queries':>8} {'ms':>9}")
+    run("SELECT por notificación", per_row)
+    profile_cache._contacts.clear()
+    metrics.reset()
+    run("prefetch, cache frío", prefetch)
+    run("prefetch, cache caliente", prefetch)
+    snap = metrics.snapshot()["counters"]
+    hits, misses = snap.get("profiles.contact.hit", 0), snap.get("profiles.contact.miss", 0)
+    print(f"profiles.contact hit rate {hits / max(1, hits + misses):.1%} ({int(hits)} hits / {int(misses)} misses)")
+    srv.close()
+
+
+if __name__ == "__main__":
+    main()
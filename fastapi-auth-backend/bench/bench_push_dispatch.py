@@ -0,0 +1,166 @@
+# bench/bench_push_dispatch.py
+"""
+Retraso de despacho (envío - scheduled_for) y claims en vacío del worker:
+
+  - polling (antes): claim; si no hay nada, dormir DISPATCHER_POLL_SECONDS
+  - heap + polling : app.worker.scheduler sin LISTEN (duerme hasta el próximo
+                     vencimiento conocido; lo nuevo se ve al siguiente refresh)
+  - heap + NOTIFY  : además despierta con cada alta (LISTEN/NOTIFY)
+
+Un productor da de alta `--n` recordatorios durante `--duration` s, cada uno
+vence entre 0 y 5 s después de crearse. PostgREST y Graph son stand-ins
+locales. Por defecto el NOTIFY se simula llamando a Scheduler.notify(); con
+`--database-url` (Postgres local, p.ej. postgresql://postgres@localhost/postgres)
+el productor hace un NOTIFY real y el worker escucha con psycopg.
+
+    python -m bench.bench_push_dispatch [--n 200] [--duration 20] [--poll 5] [--database-url ...]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from bench._standin import StandIn, percentile
+
+
+def _iso(epoch: float) -> str:
+    return datetime.fromtimestamp(epoch, timezone.utc).isoformat()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=200)
+    ap.add_argument("--duration", type=float, default=20)
+    ap.add_argument("--poll", type=float, default=5)
+    ap.add_argument("--database-url", default="")
+    args = ap.parse_args()
+
+    lock = threading.Lock()
+    state = {"rows": {}, "sent": {}, "claims": 0}
+
+    def _db(method, path, body):
+        url = urlsplit(path)
+        now = time.time()
+        if url.path.endswith("/rpc/claim_notifications"):
+            limit = json.loads(body)["p_limit"]
+            with lock:
+                state["claims"] += 1
+                due = sorted(
+                    (r for r in state["rows"].values() if r["status"] == "scheduled" and not r["processing"] and r["due"] <= now),
+                    key=lambda r: r["due"],
+                )[:limit]
+                for r in due:
+                    r["processing"] = True
+            return 200, [{"id": r["id"], "user_id": r["user_id"], "attempts": 0,
+                          "payload": {"task_snapshot": {"title": r["id"]}}} for r in due], {}
+        if url.path.endswith("/rpc/apply_notification_outcomes"):
+            with lock:
+                for o in json.loads(body)["p_rows"]:
+                    state["rows"][o["id"]].update(status=o["status"], processing=False)
+            return 200, 0, {}
+        if url.path.endswith("/profiles"):
+            ids = unquote(parse_qs(url.query)["id"][0])[4:-1].split(",")
+            return 200, [{"id": i, "phone": "5215550000000", "notify_enabled": True} for i in ids], {}
+        if url.path.endswith("/notifications") and method == "GET":
+            with lock:
+                rows = sorted(
+                    (r for r in state["rows"].values() if r["status"] == "scheduled" and not r["processing"]),
+                    key=lambda r: r["due"],
+                )
+            return 200, [{"id": r["id"], "scheduled_for": _iso(r["due"]), "next_retry_at": None} for r in rows], {}
+        return 200, [], {}
+
+    def _graph(method, path, body):
+        nid = json.loads(body)["template"]["components"][1]["parameters"][0]["text"]
+        with lock:
+            state["sent"][nid] = time.time()
+        return 200, {"messages": [{"id": "wamid.bench"}]}, {}
+
+    db, graph = StandIn(_db), StandIn(_graph)
+    os.environ.update({
+        "SUPABASE_URL": db.url,
+        "SUPABASE_SERVICE_ROLE_KEY": "service-bench",
+        "META_WA_TOKEN": "bench",
+        "META_WA_PHONE_ID": "1000",
+        "META_WA_GRAPH_URL": graph.url,
+        "DISPATCHER_POLL_SECONDS": str(args.poll),
+        "DATABASE_URL": args.database_url,
+    })
+    from app.worker import engine, scheduler
+
+    class FixedPoll:
+        """El bucle anterior: dormir POLL segundos cuando no hay nada que reclamar."""
+        listening = False
+
+        async def start(self): ...
+        async def stop(self): ...
+        async def wait(self):
+            await asyncio.sleep(args.poll)
+
+    def produce(on_insert):
+        rnd = random.Random(11)
+        gap = args.duration / args.n
+        for _ in range(args.n):
+            nid = str(uuid.uuid4())
+            due = time.time() + rnd.choice([0, 0, rnd.uniform(0, 5)])
+            with lock:
+                state["rows"][nid] = {"id": nid, "user_id": str(uuid.uuid4()), "due": due,
+                                      "status": "scheduled", "processing": False}
+            on_insert(nid, due)
+            time.sleep(gap)
+
+    def run(label, make_sched, notify_mode=None):
+        state.update(rows={}, sent={}, claims=0)
+
+        async def go():
+            loop = asyncio.get_running_loop()
+            sched = make_sched(engine._sb())
+            worker = asyncio.create_task(engine.arun(scheduler=sched))
+            await asyncio.sleep(0.2)
+            claims0 = state["claims"]
+
+            if notify_mode == "local":
+                on_insert = lambda nid, due: loop.call_soon_threadsafe(sched.notify, due, nid)
+            elif notify_mode == "pg":
+                import psycopg
+                conn = psycopg.connect(args.database_url, autocommit=True)
+                on_insert = lambda nid, due: conn.execute(
+                    "SELECT pg_notify(%s, %s)", (scheduler.NOTIFY_CHANNEL, json.dumps({"id": nid, "due": _iso(due)}))
+                )
+            else:
+                on_insert = lambda nid, due: None
+
+            await asyncio.to_thread(produce, on_insert)
+            deadline = time.time() + args.poll + 6
+            while len(state["sent"]) < args.n and time.time() < deadline:
+                await asyncio.sleep(0.1)
+            worker.cancel()
+            await asyncio.gather(worker, return_exceptions=True)
+            return state["claims"] - claims0
+
+        claims = asyncio.run(go())
+        late = [(state["sent"][i] - r["due"]) * 1000 for i, r in state["rows"].items() if i in state["sent"]]
+        assert len(late) == args.n, (label, len(late))
+        print(f"{label:<22} {percentile(late, 50):>8.0f} {percentile(late, 99):>8.0f} {max(late):>8.0f} {claims:>7}")
+
+    print(f"{args.n} recordatorios en {args.duration:.0f} s, poll={args.poll:.0f} s")
+    print(f"{'modo':<22} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'claims':>7}")
+    run("polling (antes)", lambda sb: FixedPoll())
+    run("heap + polling", lambda sb: scheduler.Scheduler(sb, poll=args.poll))
+    if args.database_url:
+        run("heap + NOTIFY (pg)", lambda sb: scheduler.Scheduler(sb, poll=args.poll), notify_mode="pg")
+    else:
+        run("heap + NOTIFY (sim.)", lambda sb: scheduler.Scheduler(sb, poll=args.poll), notify_mode="local")
+    db.close()
+    graph.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+# bench/bench_rate_limit.py
+"""
+Ráfaga de recordatorios "a las 09:00" contra un mock de Graph que aplica el
+límite de throughput de Meta por número (`--meta-rate` msg/s; al pasarse
+responde 429 con error.code 130429 y, con `--retry-after`, ese header).
+
+Todo pasa por el worker (app.worker.engine, --concurrency en vuelo) con tres
+configuraciones del GraphClient:
+
+  - sin limitador (antes): cada 429 vuelve al worker y la notificación se
+    reprograma (el código anterior además gastaba un intento por cada una)
+  - bucket 80/s + adaptativo: el default de Meta; el número real aguanta menos
+    y el AIMD tiene que encontrarlo
+  - bucket = límite real
+
+    python -m bench.bench_rate_limit [--n 600] [--meta-rate 50] [--concurrency 64] [--retry-after 1]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import threading
+import time
+import uuid
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from bench._standin import StandIn
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=600)
+    ap.add_argument("--meta-rate", type=float, default=50)
+    ap.add_argument("--graph-ms", type=float, default=30)
+    ap.add_argument("--concurrency", type=int, default=64)
+    ap.add_argument("--retry-after", type=float, default=0, help="0 = sin header Retry-After")
+    args = ap.parse_args()
+
+    lock = threading.Lock()
+    state = {}
+
+    def _reset():
+        state.update(
+            queue=[{"id": str(uuid.UUID(int=k + 1)), "user_id": str(uuid.UUID(int=k + 10**6)), "attempts": 0,
+                    "payload": {"task_snapshot": {"title": "09:00"}}} for k in range(args.n)],
+            status={}, tokens=args.meta_rate, t=time.monotonic(), sent=0, throttled=0,
+        )
+
+    def _db(method, path, body):
+        url = urlsplit(path)
+        if url.path.endswith("/rpc/claim_notifications"):
+            limit = json.loads(body)["p_limit"]
+            with lock:
+                batch, state["queue"] = state["queue"][:limit], state["queue"][limit:]
+            return 200, batch, {}
+        if url.path.endswith("/rpc/apply_notification_outcomes"):
+            with lock:
+                for o in json.loads(body)["p_rows"]:
+                    state["status"][o["id"]] = (o["status"], o.get("attempts"))
+            return 200, 0, {}
+        if url.path.endswith("/profiles"):
+            ids = unquote(parse_qs(url.query)["id"][0])[4:-1].split(",")
+            return 200, [{"id": i, "phone": "5215550000000", "notify_enabled": True} for i in ids], {}
+        return 200, [], {}
+
+    def _graph(method, path, body):
+        # bucket del lado de Meta: meta-rate msg/s, ráfaga de un segundo
+        with lock:
+            now = time.monotonic()
+            state["tokens"] = min(args.meta_rate, state["tokens"] + (now - state["t"]) * args.meta_rate)
+            state["t"] = now
+            ok = state["tokens"] >= 1
+            if ok:
+                state["tokens"] -= 1
+                state["sent"] += 1
+            else:
+                state["throttled"] += 1
+        if not ok:
+            headers = {"Retry-After": f"{args.retry_after:g}"} if args.retry_after else {}
+            return 429, {"error": {"message": "(#130429) Rate limit hit", "code": 130429}}, headers
+        time.sleep(args.graph_ms / 1000)
+        return 200, {"messages": [{"id": "wamid.bench"}]}, {}
+
+    db, graph = StandIn(_db), StandIn(_graph)
+    os.environ.update({
+        "SUPABASE_URL": db.url,
+        "SUPABASE_SERVICE_ROLE_KEY": "service-bench",
+        "META_WA_TOKEN": "bench",
+        "META_WA_PHONE_ID": "1000",
+        "META_WA_GRAPH_URL": graph.url,
+        "WORKER_STATS_SECONDS": "0",
+    })
+    from app.core import metrics, whatsapp
+    from app.worker import engine
+
+    def run(label, **client):
+        _reset()
+        metrics.reset()
+        whatsapp._graph = whatsapp.GraphClient(graph.url, **client)
+        t0 = time.perf_counter()
+        asyncio.run(engine.arun(once=True, concurrency=args.concurrency))
+        wall = time.perf_counter() - t0
+        whatsapp._graph.close()
+        statuses = [s for s, _ in state["status"].values()]
+        sent, later = statuses.count("sent"), statuses.count("scheduled")
+        burned = sum(1 for s, a in state["status"].values() if s != "sent" and a)
+        print(f"{label:<30} {wall:>6.1f} {sent:>7} {later:>11} {burned:>9} {state['throttled']:>6} "
+              f"{sent / wall:>7.1f} {metrics.get('whatsapp.rate_limit.1000.concurrency'):>8.0f}")
+
+    print(f"{args.n} recordatorios a la vez, Meta {args.meta_rate:.0f} msg/s por número, worker concurrency={args.concurrency}")
+    print(f"{'config':<30} {'wall s':>6} {'enviadas':>7} {'reprogramadas':>11} {'intentos':>9} {'429s':>6} "
+          f"{'msg/s':>7} {'en vuelo':>8}")
+    run("sin limitador (antes)", rate=0, max_in_flight=10**6, throttle_retries=0)
+    run("bucket 80/s + adaptativo", rate=80)
+    run(f"bucket {args.meta_rate:.0f}/s", rate=args.meta_rate)
+    db.close()
+    graph.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+# bench/bench_recurrence.py
+"""
+Expansión de task_recurrence para ventanas largas (1/5/10 años):
+
+  - naive : avanzar ocurrencia por ocurrencia desde la semilla (lo que haría
+            un "for" simple), filtrando las que caen en la ventana
+  - lazy  : app.core.recurrence.occurrences (salta directo a la ventana)
+  - cache : app.core.recurrence.expand con la misma ventana ya pedida
+
+Al final, GET /api/planner/range de un año con `--rules` reglas contra un
+PostgREST local (round trips y latencia extremo a extremo).
+
+    python -m bench.bench_recurrence [--rules 50] [--repeat 20]
+"""
+
+import argparse
+import os
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from urllib.parse import parse_qs, urlsplit
+
+from bench._standin import StandIn, percentile
+from app.core import recurrence
+from app.core.recurrence import Rule
+
+UTC = timezone.utc
+SEED = datetime(2020, 1, 6, 7, 30, tzinfo=UTC)  # lunes
+RULES = {
+    "DAILY": Rule("DAILY"),
+    "WEEKLY L-M-V": Rule("WEEKLY", byweekday=(0, 2, 4)),
+    "MONTHLY": Rule("MONTHLY"),
+}
+
+
+def naive(seed, rule, start, end):
+    """Referencia: recorre día por día desde la semilla."""
+    out, d = [], seed
+    while d <= end:
+        ok = (
+            (rule.freq == "DAILY" and (d - seed).days % rule.interval == 0)
+            or (rule.freq == "WEEKLY" and d.weekday() in (rule.byweekday or (seed.weekday(),)))
+            or (rule.freq == "MONTHLY" and d.day == seed.day)
+        )
+        if ok and d >= start:
+            out.append(d)
+        d += timedelta(days=1)
+    return out
+
+
+def timed(fn, repeat):
+    samples, out = [], None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return percentile(samples, 50), out
+
+
+def engine(repeat):
+    print(f"semilla {SEED.date()}, ventanas que empiezan en 2030 (p50 de {repeat} corridas, ms)")
+    print(f"{'regla':<14} {'años':>4} {'ocurr.':>7} {'naive':>9} {'lazy':>9} {'cache':>9}")
+    for name, rule in RULES.items():
+        for years in (1, 5, 10):
+            start = datetime(2030, 1, 1, tzinfo=UTC)
+            end = start + timedelta(days=365 * years)
+            t_naive, ref = timed(lambda: naive(SEED, rule, start, end), max(1, repeat // 5))
+            t_lazy, occ = timed(lambda: list(recurrence.occurrences(SEED, rule, start, end)), repeat)
+            assert occ == ref, (name, years, len(occ), len(ref))
+            recurrence.invalidate("bench")
+            recurrence.expand("bench", SEED, rule, start, end)
+            t_cache, _ = timed(lambda: recurrence.expand("bench", SEED, rule, start, end), repeat)
+            print(f"{name:<14} {years:>4} {len(occ):>7} {t_naive:>9.3f} {t_lazy:>9.3f} {t_cache:>9.4f}")
+
+
+def endpoint(n_rules, repeat):
+    user_id = str(uuid.uuid4())
+    seeds = []
+    for i in range(n_rules):
+        start = SEED + timedelta(days=i, hours=i % 12)
+        rule = list(RULES.values())[i % len(RULES)]
+        seeds.append({
+            "id": str(uuid.UUID(int=i + 1)), "user_id": user_id, "title": f"rutina {i}",
+            "start_ts": start.isoformat(), "end_ts": (start + timedelta(minutes=45)).isoformat(),
+            "deleted_at": None,
+            "task_recurrence": {"task_id": str(uuid.UUID(int=i + 1)), "freq": rule.freq,
+                                "interval": rule.interval, "byweekday": list(rule.byweekday), "until": None},
+        })
+
+    def _route(method, path, body):
+        time.sleep(0.002)
+        qs = parse_qs(urlsplit(path).query)
+        if "task_recurrence" in qs.get("select", [""])[0]:
+            return 200, [dict(s) for s in seeds], {}
+        return 200, [], {}
+
+    srv = StandIn(_route)
+    os.environ.update({
+        "SUPABASE_URL": srv.url,
+        "SUPABASE_KEY": "anon-bench",
+        "SUPABASE_SERVICE_ROLE_KEY": "service-bench",
+        "SUPABASE_JWT_SECRET": "bench-secret",
+        "ALLOW_DEV_HEADER": "1",
+        "OPENAI_API_KEY": "sk-bench",
+    })
+    from fastapi.testclient import TestClient
+    import main as app_main
+
+    params = {"start": "2030-01-01T00:00:00Z", "end": "2030-12-31T23:59:59Z"}
+    headers = {"X-User-Id": user_id}
+    with TestClient(app_main.app) as client:
+        for s in seeds:
+            recurrence.invalidate(s["id"])
+        srv.reset_counts()
+        t0 = time.perf_counter()
+        r = client.get("/api/planner/range", params=params, headers=headers)
+        cold = (time.perf_counter() - t0) * 1000
+        assert r.status_code == 200, r.text
+        rows = r.json()
+        trips = srv.total_requests()
+        t_warm, _ = timed(lambda: client.get("/api/planner/range", params=params, headers=headers), repeat)
+    srv.close()
+
+    assert all(row["is_virtual"] for row in rows)
+    assert rows == sorted(rows, key=lambda row: row["start_ts"])
+    print(f"\nGET /api/planner/range (1 año, {n_rules} reglas): {len(rows)} ocurrencias, {trips} round trips")
+    print(f"  frío {cold:.1f} ms   con cache p50 {t_warm:.1f} ms")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rules", type=int, default=50)
+    ap.add_argument("--repeat", type=int, default=20)
+    args = ap.parse_args()
+    engine(args.repeat)
+    endpoint(args.rules, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
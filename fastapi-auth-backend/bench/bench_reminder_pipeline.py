@@ -0,0 +1,147 @@
+# bench/bench_reminder_pipeline.py
+"""
+Throughput del worker de recordatorios: el bucle anterior (una fila a la vez:
+perfil -> POST Graph -> UPDATE, todo síncrono) vs el pipeline asyncio de
+app.worker.engine (modo asyncio) con distintas concurrencias.
+
+Dos servidores locales: un PostgREST (claim_notifications / profiles /
+PATCH notifications, `--db-ms` de latencia) y un mock de Graph API
+(`--graph-ms`). Se verifica que cada notificación se envía exactamente una vez
+y que cada destinatario recibe las suyas en orden.
+
+    python -m bench.bench_reminder_pipeline [--n 400] [--users 40] [--graph-ms 80] [--db-ms 5]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import threading
+import time
+import uuid
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from bench._standin import StandIn
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=400)
+    ap.add_argument("--users", type=int, default=40)
+    ap.add_argument("--graph-ms", type=float, default=80)
+    ap.add_argument("--db-ms", type=float, default=5)
+    ap.add_argument("--levels", default="1,4,16,64")
+    args = ap.parse_args()
+
+    users = [str(uuid.uuid4()) for _ in range(args.users)]
+    phones = {u: f"52155{i:08d}" for i, u in enumerate(users)}
+    lock = threading.Lock()
+    state = {"queue": [], "sent": [], "written": 0}
+
+    def _fill():
+        # notificación k -> usuario k % users; "seq" crece por usuario (orden esperado)
+        state["queue"] = [
+            {
+                "id": str(uuid.UUID(int=k + 1)), "user_id": users[k % args.users], "attempts": 0,
+                "payload": {"task_snapshot": {"title": str(k // args.users), "start_ts": "2030-01-01T07:00:00Z"}},
+            }
+            for k in range(args.n)
+        ]
+        state["sent"], state["written"] = [], 0
+
+    def _db(method, path, body):
+        time.sleep(args.db_ms / 1000)
+        url = urlsplit(path)
+        if url.path.endswith("/rpc/claim_notifications"):
+            limit = json.loads(body)["p_limit"]
+            with lock:
+                batch, state["queue"] = state["queue"][:limit], state["queue"][limit:]
+            return 200, batch, {}
+        if url.path.endswith("/rpc/apply_notification_outcomes"):
+            rows = json.loads(body)["p_rows"]
+            with lock:
+                state["written"] += len(rows)
+            return 200, len(rows), {}
+        if url.path.endswith("/profiles"):
+            ids = unquote(parse_qs(url.query)["id"][0])[4:-1].split(",")  # in.(a,b,...)
+            return 200, [{"id": uid, "phone": phones[uid], "notify_enabled": True} for uid in ids], {}
+        if method == "PATCH":
+            with lock:
+                state["written"] += 1
+            return 200, [], {}
+        return 200, [], {}
+
+    def _graph(method, path, body):
+        time.sleep(args.graph_ms / 1000)
+        msg = json.loads(body)
+        seq = int(msg["template"]["components"][1]["parameters"][0]["text"])
+        with lock:
+            state["sent"].append((msg["to"], seq))
+        return 200, {"messages": [{"id": f"wamid.{uuid.uuid4().hex}"}]}, {}
+
+    db, graph = StandIn(_db), StandIn(_graph)
+    os.environ.update({
+        "SUPABASE_URL": db.url,
+        "SUPABASE_SERVICE_ROLE_KEY": "service-bench",
+        "META_WA_TOKEN": "bench",
+        "META_WA_PHONE_ID": "1000",
+        "META_WA_GRAPH_URL": graph.url,
+        "DISPATCHER_POLL_SECONDS": "1",
+        "META_WA_RATE_PER_SECOND": "0",  # el mock no limita; sin bucket
+    })
+    import httpx
+    from app.core import profile_cache
+    from app.worker import engine
+
+    def check():
+        assert state["written"] == args.n, (state["written"], args.n)
+        assert len(state["sent"]) == args.n, len(state["sent"])
+        by_phone = {}
+        for to, seq in state["sent"]:
+            by_phone.setdefault(to, []).append(seq)
+        for to, seqs in by_phone.items():
+            assert seqs == sorted(seqs) == list(range(len(seqs))), (to, seqs)
+
+    def legacy():
+        """Bucle anterior: secuencial, SELECT de perfil por fila, cliente Graph nuevo por envío."""
+        headers = {"apikey": "service-bench", "Authorization": "Bearer service-bench"}
+        with httpx.Client(base_url=f"{db.url}/rest/v1", headers=headers) as rest:
+            while True:
+                batch = rest.post("/rpc/claim_notifications", json={"p_limit": engine.BATCH_SIZE}).json()
+                if not batch:
+                    return
+                for n in batch:
+                    prof = rest.get("/profiles", params={"select": "id,phone,notify_enabled", "id": f"in.({n['user_id']})"}).json()[0]
+                    snap = n["payload"]["task_snapshot"]
+                    with httpx.Client(timeout=30) as wa:
+                        wa.post(f"{graph.url}/1000/messages", json={
+                            "to": prof["phone"],
+                            "template": {"components": [{}, {"parameters": [{"text": snap["title"]}]}]},
+                        })
+                    rest.patch("/notifications", params={"id": f"eq.{n['id']}"}, json={"status": "sent"})
+
+    print(f"{args.n} notificaciones, {args.users} destinatarios, Graph {args.graph_ms} ms, PostgREST {args.db_ms} ms")
+    print(f"{'modo':<22} {'seg':>7} {'msg/s':>8}")
+
+    _fill()
+    t0 = time.perf_counter()
+    legacy()
+    dt = time.perf_counter() - t0
+    check()
+    print(f"{'secuencial (antes)':<22} {dt:>7.2f} {args.n / dt:>8.1f}")
+
+    for c in [int(x) for x in args.levels.split(",")]:
+        _fill()
+        profile_cache._contacts.clear()  # cada corrida arranca con cache frío
+        t0 = time.perf_counter()
+        asyncio.run(engine.arun(once=True, concurrency=c))
+        dt = time.perf_counter() - t0
+        check()
+        print(f"{f'pipeline c={c}':<22} {dt:>7.2f} {args.n / dt:>8.1f}")
+
+    db.close()
+    graph.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# bench/bench_supabase_pool.py
+"""
+p50/p99 de GET /api/tasks: cliente PostgREST nuevo por request (antes) vs
+vista PostgREST sobre el pool compartido (después), contra un PostgREST
+local con TLS (autofirmado) para que el handshake cuente.
+
+    python -m bench.bench_supabase_pool [--n 300] [--plain]
+"""
+
+import argparse
+import os
+import time
+import uuid
+from datetime import datetime, timezone
+
+from bench._standin import StandIn, summary
+
+USER_ID = str(uuid.uuid4())
+NOW = datetime.now(timezone.utc).isoformat()
+ROWS = [
+    {
+        "id": str(uuid.uuid4()), "user_id": USER_ID, "title": f"task {i}", "description": None,
+        "tag": "Other", "start_ts": NOW, "due_at": None, "status": "pending", "priority": "medium",
+        "position": float(i), "created_at": NOW, "updated_at": NOW, "completed_at": None,
+    }
+    for i in range(50)
+]
+
+
+def _route(method, path, body):
+    if path.startswith("/rest/v1/tasks_api"):
+        return 200, ROWS, {}
+    return 200, [], {}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=300)
+    ap.add_argument("--plain", action="store_true", help="HTTP sin TLS")
+    args = ap.parse_args()
+
+    srv = StandIn(_route, tls=not args.plain)
+    os.environ.update({
+        "SUPABASE_URL": srv.url,
+        "SUPABASE_KEY": "anon-bench",
+        "SUPABASE_SERVICE_ROLE_KEY": "service-bench",
+        "SUPABASE_JWT_SECRET": "bench-secret",
+        "ALLOW_DEV_HEADER": "1",
+        "OPENAI_API_KEY": "sk-bench",
+    })
+    if srv.cert_path:
+        os.environ["SSL_CERT_FILE"] = srv.cert_path
+
+    from fastapi.testclient import TestClient
+    from postgrest import AsyncPostgrestClient
+    import main as app_main
+    from app.api.routers import tasks as tasks_router
+    from app.core.supabase_client import _rest_headers, get_request_token
+
+    def legacy_client(request):
+        # Implementación previa: cliente propio por request (conexión + TLS nuevos cada vez)
+        return AsyncPostgrestClient(
+            f"{os.environ['SUPABASE_URL']}/rest/v1",
+            headers=_rest_headers(get_request_token(request)),
+        )
+
+    client = TestClient(app_main.app)
+    headers = {"X-User-Id": USER_ID, "Authorization": "Bearer bench-token"}
+
+    def run(label):
+        client.get("/api/tasks", headers=headers)  # warm-up
+        samples = []
+        for _ in range(args.n):
+            t0 = time.perf_counter()
+            r = client.get("/api/tasks", headers=headers)
+            samples.append((time.perf_counter() - t0) * 1000)
+            assert r.status_code == 200, r.text
+        print(summary(label, samples))
+
+    # Con `with` el TestClient usa un solo event loop (como uvicorn); sin él,
+    # cada request abre un loop nuevo y el pool async quedaría atado a uno cerrado.
+    with client:
+        pooled = tasks_router.get_async_supabase_for_request
+        tasks_router.get_async_supabase_for_request = legacy_client
+        run("before: client/req")
+        tasks_router.get_async_supabase_for_request = pooled
+        run("after: pooled view")
+    srv.close()
+
+
+if __name__ == "__main__":
+    main()
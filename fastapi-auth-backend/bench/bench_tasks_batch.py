@@ -0,0 +1,118 @@
+# bench/bench_tasks_batch.py
+"""
+N operaciones (mezcla create/update/delete, por defecto 500) enviadas como
+N requests individuales vs un solo POST /api/tasks:batch: round trips a
+PostgREST y tiempo total, contra un PostgREST local con `--latency-ms`.
+
+    python -m bench.bench_tasks_batch [--n 500] [--latency-ms 5] [--no-rpc]
+"""
+
+import argparse
+import json
+import os
+import re
+import time
+import uuid
+from datetime import datetime, timezone
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from bench._standin import StandIn
+
+USER_ID = str(uuid.uuid4())
+NOW = datetime.now(timezone.utc).isoformat()
+_IN = re.compile(r"in\.\((.*)\)")
+
+
+def _task(task_id: str, **fields) -> dict:
+    row = {
+        "id": task_id, "user_id": USER_ID, "title": "bench", "description": None, "tag": "Other",
+        "status": "pending", "priority": "medium", "start_ts": NOW, "end_ts": None, "position": 0.0,
+        "created_at": NOW, "updated_at": NOW, "completed_at": None,
+    }
+    row.update(fields)
+    return row
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=500)
+    ap.add_argument("--latency-ms", type=float, default=5)
+    ap.add_argument("--no-rpc", action="store_true", help="simula que batch_update_tasks no existe")
+    args = ap.parse_args()
+
+    def _route(method, path, body):
+        time.sleep(args.latency_ms / 1000)
+        url = urlsplit(path)
+        qs = {k: v[0] for k, v in parse_qs(url.query).items()}
+        payload = json.loads(body) if body else None
+        if url.path.endswith("/rpc/batch_update_tasks"):
+            if args.no_rpc:
+                return 404, {"message": "function not found"}, {}
+            rows = [_task(o["id"], **o["patch"]) for o in payload["p_ops"]]
+            return 200, [{**r, "due_at": r.pop("end_ts")} for r in rows], {}  # forma tasks_api
+        ids = _IN.match(unquote(qs.get("id", ""))) if "id" in qs else None
+        ids = ids.group(1).split(",") if ids else [unquote(qs.get("id", "eq.")[3:])]
+        if method == "POST":
+            rows = payload if isinstance(payload, list) else [payload]
+            return 201, [_task(str(uuid.uuid4()), **r) for r in rows], {}
+        if method == "PATCH":
+            return 200, [_task(i, **payload) for i in ids], {}
+        if method == "DELETE":
+            return 200, [_task(i) for i in ids], {}
+        return 200, [], {}
+
+    srv = StandIn(_route)
+    os.environ.update({
+        "SUPABASE_URL": srv.url,
+        "SUPABASE_KEY": "anon-bench",
+        "SUPABASE_SERVICE_ROLE_KEY": "service-bench",
+        "SUPABASE_JWT_SECRET": "bench-secret",
+        "ALLOW_DEV_HEADER": "1",
+        "OPENAI_API_KEY": "sk-bench",
+    })
+
+    from fastapi.testclient import TestClient
+    import main as app_main
+
+    # 60% reorder (update position), 30% create, 10% delete
+    ops = []
+    for k in range(args.n):
+        if k % 10 < 6:
+            ops.append({"op": "update", "id": str(uuid.uuid4()), "data": {"position": float(k)}})
+        elif k % 10 < 9:
+            ops.append({"op": "create", "data": {"title": f"import {k}", "start_ts": NOW}})
+        else:
+            ops.append({"op": "delete", "id": str(uuid.uuid4())})
+
+    headers = {"X-User-Id": USER_ID}
+    with TestClient(app_main.app) as client:
+        srv.reset_counts()
+        t0 = time.perf_counter()
+        for o in ops:
+            if o["op"] == "create":
+                r = client.post("/api/tasks", json=o["data"], headers=headers)
+            elif o["op"] == "update":
+                r = client.patch(f"/api/tasks/{o['id']}", json=o["data"], headers=headers)
+            else:
+                r = client.delete(f"/api/tasks/{o['id']}", headers=headers)
+            assert r.status_code < 300, r.text
+        single_ms = (time.perf_counter() - t0) * 1000
+        single_trips = srv.total_requests()
+
+        srv.reset_counts()
+        t0 = time.perf_counter()
+        r = client.post("/api/tasks:batch", json={"ops": ops}, headers=headers)
+        batch_ms = (time.perf_counter() - t0) * 1000
+        assert r.status_code == 200, r.text
+        statuses = [item["status"] for item in r.json()["results"]]
+        assert all(s in (200, 201, 204) for s in statuses), set(statuses)
+        batch_trips = srv.total_requests()
+
+    print(f"{args.n} ops ({'fallback sin RPC' if args.no_rpc else 'RPC'}), latencia PostgREST {args.latency_ms} ms")
+    print(f"  N requests : {single_trips:>4} round trips  {single_ms:8.0f} ms")
+    print(f"  tasks:batch: {batch_trips:>4} round trips  {batch_ms:8.0f} ms")
+    srv.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+# bench/bench_tasks_export.py
+"""
+GET /api/tasks/export: tiempo al primer byte, tiempo total y memoria pico
+(tracemalloc, del proceso de la app) para historiales de distinto tamaño.
+La app corre en uvicorn (HTTP real, para que el streaming se note) contra un
+PostgREST local que respeta limit + cursor keyset y tarda `--latency-ms`.
+
+    python -m bench.bench_tasks_export [--sizes 1000,20000,100000] [--latency-ms 10]
+"""
+
+import argparse
+import os
+import re
+import threading
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta, timezone
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from bench._standin import StandIn
+
+USER_ID = str(uuid.uuid4())
+BASE = datetime(2024, 1, 1, tzinfo=timezone.utc)
+_ID_GT = re.compile(r"id\.gt\.([0-9a-f-]{36})")
+
+
+def _row(i: int) -> dict:
+    ts = (BASE + timedelta(minutes=i)).isoformat()
+    return {
+        "id": str(uuid.UUID(int=i)), "title": f"task {i}", "description": "lorem ipsum " * 4,
+        "tag": "Other", "status": "done", "priority": "medium", "start_ts": ts, "due_at": None,
+        "position": float(i), "created_at": ts, "updated_at": ts, "completed_at": None,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", default="1000,20000,100000")
+    ap.add_argument("--latency-ms", type=float, default=10)
+    args = ap.parse_args()
+
+    state = {"rows": 0}
+
+    def _route(method, path, body):
+        time.sleep(args.latency_ms / 1000)
+        qs = parse_qs(urlsplit(path).query)
+        limit = int(qs.get("limit", ["1000"])[0])
+        m = _ID_GT.search(unquote(qs.get("or", [""])[0]))
+        start = uuid.UUID(m.group(1)).int + 1 if m else 0
+        return 200, [_row(i) for i in range(start, min(start + limit, state["rows"]))], {}
+
+    srv = StandIn(_route)
+    os.environ.update({
+        "SUPABASE_URL": srv.url,
+        "SUPABASE_KEY": "anon-bench",
+        "SUPABASE_SERVICE_ROLE_KEY": "service-bench",
+        "SUPABASE_JWT_SECRET": "bench-secret",
+        "ALLOW_DEV_HEADER": "1",
+        "OPENAI_API_KEY": "sk-bench",
+    })
+
+    import httpx
+    import uvicorn
+    import main as app_main
+
+    server = uvicorn.Server(uvicorn.Config(app_main.app, host="127.0.0.1", port=0, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    url = f"http://127.0.0.1:{port}/api/tasks/export"
+    headers = {"X-User-Id": USER_ID}
+
+    def export(fmt):
+        t0 = time.perf_counter()
+        ttfb, nbytes, lines = None, 0, 0
+        with httpx.stream("GET", url, params={"format": fmt}, headers=headers, timeout=None) as r:
+            assert r.status_code == 200, r.read()
+            for part in r.iter_bytes():
+                if ttfb is None:
+                    ttfb = (time.perf_counter() - t0) * 1000
+                nbytes += len(part)
+                lines += part.count(b"\n")
+        return ttfb, (time.perf_counter() - t0) * 1000, nbytes, lines
+
+    export("ndjson")  # warm-up
+    print(f"{'rows':>7} {'fmt':>6} {'TTFB ms':>8} {'total ms':>9} {'MB':>7} {'peak MB':>8}")
+    for n in [int(x) for x in args.sizes.split(",")]:
+        state["rows"] = n
+        for fmt in ("ndjson", "csv"):
+            ttfb, total, nbytes, lines = export(fmt)
+            assert lines == n + (fmt == "csv"), (lines, n)
+            tracemalloc.start()
+            export(fmt)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"{n:>7} {fmt:>6} {ttfb:>8.1f} {total:>9.0f} {nbytes / 1e6:>7.1f} {peak / 1e6:>8.1f}")
+
+    server.should_exit = True
+    srv.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+# bench/bench_template_render.py
+"""
+Throughput de armado de payloads de template (sin red):
+
+  - a mano (antes): task_template_params + _template_payload como lo hacían
+    channels.py / el router, una lista de dicts nueva por mensaje
+  - renderer: app.core.wa_templates (esquema cargado una vez, cabecera y
+    componentes estáticos compartidos, validación de cantidad y vacíos)
+
+Cubre rm_task_summary, el digest y un template con botón URL cargado desde un
+export de message_templates (formato de Graph) en un archivo temporal.
+Verifica que ambos caminos produzcan los mismos textos para tareas sin
+campos vacíos.
+
+    python -m bench.bench_template_render [--n 200000]
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+from app.core import wa_templates
+
+
+def _fmt(ts, fmt="%Y-%m-%d %H:%M"):
+    if not ts:
+        return ""
+    try:
+        return datetime.fromisoformat(str(ts).replace("Z", "+00:00")).strftime(fmt)
+    except Exception:
+        return str(ts)
+
+
+def _by_hand(to, payload):
+    """Lo que hacían channels.task_template_params + whatsapp._template_payload."""
+    snap = payload.get("task_snapshot") or {}
+    header = [{"type": "text", "text": payload.get("header_hint") or "15 min"}]
+    body = [
+        {"type": "text", "text": snap.get("title") or "(no title)"},
+        {"type": "text", "text": _fmt(snap.get("start_ts"))},
+        {"type": "text", "text": _fmt(snap.get("end_ts"))},
+        {"type": "text", "text": payload.get("tz_hint") or ""},
+        {"type": "text", "text": snap.get("tag") or "Other"},
+        {"type": "text", "text": snap.get("status") or "pending"},
+        {"type": "text", "text": snap.get("description") or ""},
+    ]
+    return {
+        "messaging_product": "whatsapp",
+        "to": to,
+        "type": "template",
+        "template": {
+            "name": payload.get("template_name") or "rm_task_summary",
+            "language": {"code": payload.get("lang_code") or "en"},
+            "components": [{"type": "header", "parameters": header}, {"type": "body", "parameters": body}],
+        },
+    }
+
+
+def _rendered(to, payload):
+    fields = wa_templates.task_fields(payload.get("task_snapshot") or {}, payload.get("header_hint") or "15 min",
+                                      payload.get("tz_hint"))
+    return wa_templates.renderer(payload.get("template_name") or "rm_task_summary",
+                                 payload.get("lang_code") or "en").render_fields(to, fields)
+
+
+def _texts(message):
+    return [[p["text"] for p in c.get("parameters", [])] for c in message["template"].get("components", [])]
+
+
+def _payloads(k):
+    base = datetime(2026, 3, 2, 9, 0, tzinfo=timezone.utc)
+    return [{
+        "header_hint": "15 min", "tz_hint": "PDT", "lang_code": "en",
+        "task_snapshot": {
+            "id": f"task-{i}", "title": f"Tarea {i}", "description": f"detalle {i}", "tag": "Work",
+            "status": "pending", "start_ts": (base + timedelta(minutes=i)).isoformat(),
+            "end_ts": (base + timedelta(minutes=i + 30)).isoformat(),
+        },
+    } for i in range(k)]
+
+
+def _rate(label, fn, items, n):
+    k = len(items)
+    t0 = time.perf_counter()
+    for i in range(n):
+        fn("5215550000000", items[i % k])
+    wall = time.perf_counter() - t0
+    print(f"{label:<34} {n:>8} {wall:>8.2f} {n / wall:>12,.0f} {wall / n * 1e6:>8.2f}")
+    return n / wall
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=200_000)
+    args = ap.parse_args()
+
+    export = {"data": [{
+        "name": "rm_task_link", "language": "en", "status": "APPROVED",
+        "components": [
+            {"type": "HEADER", "format": "TEXT", "text": "En {{1}}"},
+            {"type": "BODY", "text": "{{1}} a las {{2}} ({{3}})"},
+            {"type": "BUTTONS", "buttons": [
+                {"type": "QUICK_REPLY", "text": "OK"},
+                {"type": "URL", "text": "Abrir", "url": "https://app.example/t/{{1}}"},
+            ]},
+        ],
+        "fields": {"body": ["title", "start", "tz"]},
+    }]}
+    with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+        json.dump(export, f)
+    wa_templates._registry = wa_templates.TemplateRegistry(f.name)
+
+    items = _payloads(1000)
+    for p in items:
+        assert _texts(_by_hand("x", p)) == _texts(_rendered("x", p)), p
+
+    link = wa_templates.renderer("rm_task_link", "en")
+    assert link.schema.buttons == ((1, ("button",)),), link.schema
+    digest = wa_templates.renderer(wa_templates.DIGEST_TEMPLATE, "en")
+
+    def _link(to, p):
+        snap = p["task_snapshot"]
+        return link.render_fields(to, wa_templates.task_fields(snap, p["header_hint"], p["tz_hint"], snap["id"]))
+
+    def _digest(to, p):
+        return digest.render(to, [p["header_hint"]], ["3", p["task_snapshot"]["title"], p["tz_hint"]])
+
+    print(f"{args.n} payloads, 1000 tareas distintas")
+    print(f"{'camino':<34} {'n':>8} {'wall s':>8} {'payloads/s':>12} {'us/op':>8}")
+    before = _rate("rm_task_summary a mano (antes)", _by_hand, items, args.n)
+    after = _rate("rm_task_summary renderer", _rendered, items, args.n)
+    _rate("rm_task_link (botón URL) renderer", _link, items, args.n)
+    _rate("digest renderer (render posicional)", _digest, items, args.n)
+    print(f"renderer / a mano: {after / before:.2f}x (además valida cantidad y parámetros vacíos)")
+    os.unlink(f.name)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+# bench/bench_worker_modes.py
+"""
+Throughput y latencias del worker unificado (app.worker.engine) en sus tres
+modelos de concurrencia: asyncio, threads y processes (`--processes` procesos
+asyncio). Mismo PostgREST local (claim con lease / profiles / outcomes) y mock
+de Graph API con `--graph-ms` de latencia. Verifica que cada notificación se
+envía exactamente una vez en todos los modos.
+
+    python -m bench.bench_worker_modes [--n 1000] [--graph-ms 50] [--concurrency 16] [--processes 2]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import threading
+import time
+import uuid
+from collections import Counter
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from bench._standin import StandIn, percentile
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=1000)
+    ap.add_argument("--graph-ms", type=float, default=50)
+    ap.add_argument("--concurrency", type=int, default=16)
+    ap.add_argument("--processes", type=int, default=2)
+    args = ap.parse_args()
+
+    lock = threading.Lock()
+    state = {"queue": [], "sent": Counter(), "send_ms": []}
+
+    def _db(method, path, body):
+        url = urlsplit(path)
+        if url.path.endswith("/rpc/claim_notifications"):
+            req = json.loads(body)
+            with lock:
+                batch, state["queue"] = state["queue"][:req["p_limit"]], state["queue"][req["p_limit"]:]
+            return 200, [{**r, "processing": True, "claimed_by": req["p_worker"]} for r in batch], {}
+        if url.path.endswith("/profiles"):
+            ids = unquote(parse_qs(url.query)["id"][0])[4:-1].split(",")
+            return 200, [{"id": i, "phone": "5215550000000", "notify_enabled": True} for i in ids], {}
+        return 200, [], {}
+
+    def _graph(method, path, body):
+        t0 = time.perf_counter()
+        time.sleep(args.graph_ms / 1000)
+        nid = json.loads(body)["template"]["components"][1]["parameters"][0]["text"]
+        with lock:
+            state["sent"][nid] += 1
+            state["send_ms"].append((time.perf_counter() - t0) * 1000)
+        return 200, {"messages": [{"id": "wamid.bench"}]}, {}
+
+    db, graph = StandIn(_db), StandIn(_graph)
+    os.environ.update({
+        "SUPABASE_URL": db.url,
+        "SUPABASE_SERVICE_ROLE_KEY": "service-bench",
+        "META_WA_TOKEN": "bench",
+        "META_WA_PHONE_ID": "1000",
+        "META_WA_GRAPH_URL": graph.url,
+        "DISPATCHER_POLL_SECONDS": "0.2",
+        "WORKER_STATS_SECONDS": "0",
+        "META_WA_RATE_PER_SECOND": "0",  # el mock no limita; sin bucket
+    })
+    from app.worker import engine
+
+    def run(label, go):
+        state["queue"] = [
+            {"id": str(uuid.UUID(int=k + 1)), "user_id": str(uuid.UUID(int=k % 200 + 10**6)), "attempts": 0,
+             "scheduled_for": None, "payload": {"task_snapshot": {"title": str(uuid.UUID(int=k + 1))}}}
+            for k in range(args.n)
+        ]
+        state["sent"], state["send_ms"] = Counter(), []
+        t0 = time.perf_counter()
+        go()
+        wall = time.perf_counter() - t0
+        assert len(state["sent"]) == args.n and set(state["sent"].values()) == {1}, (label, len(state["sent"]))
+        print(f"{label:<28} {wall:>7.2f} {args.n / wall:>8.0f} {percentile(state['send_ms'], 50):>9.0f}")
+
+    print(f"{args.n} notificaciones, Graph {args.graph_ms:.0f} ms, concurrency={args.concurrency}")
+    print(f"{'modo':<28} {'wall s':>7} {'msg/s':>8} {'graph p50':>9}")
+    run("asyncio", lambda: asyncio.run(engine.arun(once=True, concurrency=args.concurrency, mode="asyncio")))
+    run("threads", lambda: asyncio.run(engine.arun(once=True, concurrency=args.concurrency, mode="threads")))
+    run(f"processes x{args.processes}",
+        lambda: engine.run(mode="processes", concurrency=args.concurrency, processes=args.processes, once=True))
+    db.close()
+    graph.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# bench/bench_write_round_trips.py
+"""
+Round trips a PostgREST por endpoint de escritura (create/update de tasks,
+subtasks, recurrencia, settings y reminders) y su latencia p50 contra un
+PostgREST local con `--latency-ms` de retraso por request.
+
+Los round trips se cuentan en el stand-in (no depende de la app), así que
+el mismo script sirve para comparar contra un checkout anterior.
+
+    python -m bench.bench_write_round_trips [--n 50] [--latency-ms 5]
+"""
+
+import argparse
+import json
+import os
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from bench._standin import StandIn, summary
+
+USER_ID = str(uuid.uuid4())
+TASK_ID = str(uuid.uuid4())
+NOW = datetime.now(timezone.utc)
+START = (NOW + timedelta(days=1)).isoformat()
+
+BASE_ROW = {
+    "id": TASK_ID, "user_id": USER_ID, "task_id": TASK_ID, "title": "bench",
+    "description": None, "tag": "Other", "status": "scheduled", "priority": "medium",
+    "start_ts": START, "end_ts": None, "due_at": None, "position": 1.0,
+    "channel": "whatsapp", "scheduled_for": START, "payload": {},
+    "freq": "DAILY", "interval": 1, "byweekday": None, "until": None,
+    "phone": None, "notify_enabled": True, "done": False,
+    "created_at": NOW.isoformat(), "updated_at": NOW.isoformat(), "completed_at": None,
+}
+
+ENDPOINTS = [
+    ("POST", "/api/tasks", {"title": "bench", "start_ts": START}),
+    ("PATCH", f"/api/tasks/{TASK_ID}", {"title": "bench 2"}),
+    ("PATCH", f"/api/subtasks/{TASK_ID}", {"title": "sub"}),
+    ("POST", f"/api/planner/{TASK_ID}/recurrence", {"freq": "DAILY"}),
+    ("PATCH", f"/api/planner/{TASK_ID}/recurrence", {"freq": "WEEKLY", "byweekday": [0]}),
+    ("PUT", "/api/api/settings/notifications", {"phone": "5215555555555", "notify_enabled": True}),
+    ("POST", "/api/reminders/by-task", {
+        "task_id": TASK_ID, "minutes_before": 15, "template_name": "rm_task_summary",
+    }),
+    ("PATCH", f"/api/reminders/{TASK_ID}", {"status": "canceled"}),
+]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=50)
+    ap.add_argument("--latency-ms", type=float, default=5)
+    args = ap.parse_args()
+
+    def _route(method, path, body):
+        time.sleep(args.latency_ms / 1000)
+        row = dict(BASE_ROW)
+        if body:
+            payload = json.loads(body)
+            row.update(payload[0] if isinstance(payload, list) else payload)
+        return (201 if method == "POST" else 200), [row], {}
+
+    srv = StandIn(_route)
+    os.environ.update({
+        "SUPABASE_URL": srv.url,
+        "SUPABASE_KEY": "anon-bench",
+        "SUPABASE_SERVICE_ROLE_KEY": "service-bench",
+        "SUPABASE_JWT_SECRET": "bench-secret",
+        "ALLOW_DEV_HEADER": "1",
+        "OPENAI_API_KEY": "sk-bench",
+    })
+
+    from fastapi.testclient import TestClient
+    import main as app_main
+
+    headers = {"X-User-Id": USER_ID, "Authorization": "Bearer bench-token"}
+    with TestClient(app_main.app) as client:
+        for method, path, body in ENDPOINTS:
+            client.request(method, path, headers=headers, json=body)  # warm-up
+            srv.reset_counts()
+            samples = []
+            for _ in range(args.n):
+                t0 = time.perf_counter()
+                r = client.request(method, path, headers=headers, json=body)
+                samples.append((time.perf_counter() - t0) * 1000)
+                assert r.status_code < 300, (path, r.status_code, r.text)
+            trips = srv.total_requests() / args.n
+            print(f"{summary(f'{method} {path[:22]}', samples)}  round_trips={trips:.1f}")
+
+    srv.close()
+
+
+if __name__ == "__main__":
+    main()
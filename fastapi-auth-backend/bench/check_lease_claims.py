@@ -0,0 +1,211 @@
+# bench/check_lease_claims.py
+"""
+Prueba multi-proceso del claim por lease: `--workers` procesos de
+app.worker.engine contra el mismo PostgREST local, que implementa la
+semántica de sql/notifications_lease.sql (claim atómico tipo SKIP LOCKED,
+lease_until, reclaim de leases vencidos y fencing por lease_owner al escribir
+el resultado). Antes de arrancar, un "worker caído" reclama `--orphans`
+notificaciones y nunca las procesa, y otras `--legacy` quedan con
+processing=true y sin lease (como las dejaba el dispatcher viejo).
+
+Verifica que cada notificación se entrega EXACTAMENTE una vez (mock de Graph),
+que las huérfanas se reenvían solo después de vencer su lease y que no queda
+ninguna fila con processing=true.
+
+    python -m bench.check_lease_claims [--workers 4] [--n 600] [--orphans 30] [--legacy 10] [--no-rpc]
+"""
+
+import argparse
+import json
+import multiprocessing as mp
+import os
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from bench._standin import StandIn
+
+
+def _iso(epoch: float) -> str:
+    return datetime.fromtimestamp(epoch, timezone.utc).isoformat()
+
+
+def _epoch(value: str) -> float:
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+
+def _worker_main():
+    import asyncio
+    from app.worker import engine
+
+    asyncio.run(engine.arun())
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--n", type=int, default=600)
+    ap.add_argument("--orphans", type=int, default=30)
+    ap.add_argument("--legacy", type=int, default=10, help="processing=true sin lease (dispatcher viejo)")
+    ap.add_argument("--lease", type=int, default=3)
+    ap.add_argument("--graph-ms", type=float, default=20)
+    ap.add_argument("--no-rpc", action="store_true", help="workers usan el fallback SELECT + UPDATE condicional")
+    ap.add_argument("--timeout", type=float, default=120)
+    args = ap.parse_args()
+
+    lock = threading.Lock()
+    t0 = time.time()
+    rows = {
+        str(uuid.UUID(int=k + 1)): {
+            "id": str(uuid.UUID(int=k + 1)), "user_id": str(uuid.UUID(int=k % 97 + 10**6)),
+            "due": t0, "status": "scheduled", "processing": False, "claimed_by": None, "lease_until": None,
+            "attempts": 0, "payload": {"task_snapshot": {"title": str(uuid.UUID(int=k + 1))}},
+        }
+        for k in range(args.n)
+    }
+    deliveries = []  # (id, t)
+    claims = Counter()
+
+    def _free(r, now):
+        return r["status"] == "scheduled" and r["due"] <= now and (
+            not r["processing"] or r["lease_until"] is None or r["lease_until"] < now
+        )
+
+    def _public(r):
+        out = {k: v for k, v in r.items() if k != "due"}
+        out["scheduled_for"] = _iso(r["due"])
+        out["lease_until"] = _iso(r["lease_until"]) if r["lease_until"] else None
+        return out
+
+    def _claim(worker, limit, lease):
+        now = time.time()
+        with lock:  # el lock hace de FOR UPDATE SKIP LOCKED
+            picked = sorted((r for r in rows.values() if _free(r, now)), key=lambda r: r["due"])[:limit]
+            for r in picked:
+                r.update(processing=True, claimed_by=worker, lease_until=now + lease)
+                claims[worker] += 1
+            return [_public(r) for r in picked]
+
+    def _apply(o):
+        r = rows.get(o["id"])
+        if r is None or ("lease_owner" in o and r["claimed_by"] != o["lease_owner"]):
+            return 0
+        for k in ("status", "processing", "attempts"):
+            if k in o:
+                r[k] = o[k]
+        if "lease_owner" in o:
+            r.update(claimed_by=None, lease_until=None)
+        return 1
+
+    def _db(method, path, body):
+        url = urlsplit(path)
+        qs = {k: unquote(v[0]) for k, v in parse_qs(url.query).items()}
+        payload = json.loads(body) if body else None
+        if url.path.endswith("/rpc/claim_notifications"):
+            if args.no_rpc:
+                return 404, {"code": "PGRST202", "message": "Could not find the function", "hint": None, "details": None}, {}
+            return 200, _claim(payload["p_worker"], payload["p_limit"], payload["p_lease_seconds"]), {}
+        if url.path.endswith("/rpc/apply_notification_outcomes"):
+            if args.no_rpc:
+                return 404, {"code": "PGRST202", "message": "Could not find the function", "hint": None, "details": None}, {}
+            with lock:
+                return 200, sum(_apply(o) for o in payload["p_rows"]), {}
+        if url.path.endswith("/profiles"):
+            ids = qs["id"][4:-1].split(",")
+            return 200, [{"id": i, "phone": f"52{i[-10:]}", "notify_enabled": True} for i in ids], {}
+        if url.path.endswith("/notifications") and method == "GET":
+            now = time.time()
+            with lock:
+                free = sorted((r for r in rows.values() if _free(r, now)), key=lambda r: r["due"])
+            return 200, [{"id": r["id"], "scheduled_for": _iso(r["due"]), "next_retry_at": None}
+                         for r in free[:int(qs.get("limit", 500))]], {}
+        if url.path.endswith("/notifications") and method == "PATCH":
+            with lock:
+                if payload.get("processing") is True:
+                    # claim fallback: UPDATE ... WHERE id IN (...)
+                    #   AND (processing IS NOT TRUE OR lease_until IS NULL OR lease_until < now)
+                    cutoff = _epoch(qs["or"].split("lease_until.lt.")[1].rstrip(")"))
+                    out = []
+                    for nid in qs["id"][4:-1].split(","):
+                        r = rows[nid]
+                        if not r["processing"] or r["lease_until"] is None or r["lease_until"] < cutoff:
+                            r.update(processing=True, claimed_by=payload["claimed_by"],
+                                     lease_until=_epoch(payload["lease_until"]))
+                            claims[payload["claimed_by"]] += 1
+                            out.append(_public(r))
+                    return 200, out, {}
+                o = {**payload, "id": qs["id"][3:]}
+                if "claimed_by" in qs:
+                    o["lease_owner"] = qs["claimed_by"][3:]
+                _apply(o)
+            return 200, [], {}
+        return 200, [], {}
+
+    def _graph(method, path, body):
+        time.sleep(args.graph_ms / 1000)
+        nid = json.loads(body)["template"]["components"][1]["parameters"][0]["text"]
+        with lock:
+            deliveries.append((nid, time.time()))
+        return 200, {"messages": [{"id": f"wamid.{uuid.uuid4().hex}"}]}, {}
+
+    db, graph = StandIn(_db), StandIn(_graph)
+    os.environ.update({
+        "SUPABASE_URL": db.url,
+        "SUPABASE_SERVICE_ROLE_KEY": "service-bench",
+        "META_WA_TOKEN": "bench",
+        "META_WA_PHONE_ID": "1000",
+        "META_WA_GRAPH_URL": graph.url,
+        "DISPATCHER_POLL_SECONDS": "0.5",
+        "DISPATCHER_BATCH_SIZE": "10",
+        "DISPATCHER_CONCURRENCY": "8",
+        "DISPATCHER_LEASE_SECONDS": str(args.lease),
+    })
+
+    # Worker caído: reclama y desaparece (processing=true, lease vigente)
+    orphans = {r["id"] for r in _claim("dead-worker", args.orphans, args.lease)}
+    orphaned_at = time.time()
+    # Dispatcher viejo: processing=true sin claimed_by ni lease_until
+    legacy = [r for r in rows.values() if not r["processing"]][:args.legacy]
+    for r in legacy:
+        r["processing"] = True
+
+    ctx = mp.get_context("spawn")
+    procs = [ctx.Process(target=_worker_main, daemon=True) for _ in range(args.workers)]
+    start = time.time()
+    for p in procs:
+        p.start()
+    while time.time() - start < args.timeout:
+        with lock:
+            done = all(r["status"] == "sent" and not r["processing"] for r in rows.values())
+        if done:
+            break
+        time.sleep(0.2)
+    elapsed = time.time() - start
+    for p in procs:
+        p.terminate()
+    for p in procs:
+        p.join()
+    db.close()
+    graph.close()
+
+    per_id = Counter(nid for nid, _ in deliveries)
+    dupes = {nid: c for nid, c in per_id.items() if c > 1}
+    missing = [nid for nid in rows if nid not in per_id]
+    stuck = [r["id"] for r in rows.values() if r["processing"] or r["claimed_by"]]
+    early = [nid for nid, t in deliveries if nid in orphans and t < orphaned_at + args.lease]
+
+    mode = "fallback SELECT + UPDATE condicional" if args.no_rpc else "RPC claim_notifications"
+    print(f"{args.workers} workers, {args.n} notificaciones ({args.orphans} huérfanas, {len(legacy)} sin lease, "
+          f"lease {args.lease}s), {mode}")
+    print(f"  tiempo {elapsed:.1f}s, claims por worker: {sorted(c for w, c in claims.items() if w != 'dead-worker')}")
+    print(f"  entregas {len(deliveries)}  duplicadas {len(dupes)}  faltantes {len(missing)}  "
+          f"atascadas {len(stuck)}  huérfanas antes de vencer el lease {len(early)}")
+    assert not dupes and not missing and not stuck and not early, "FALLÓ: entrega no exactamente-una-vez"
+    print("  OK: cada notificación se entregó exactamente una vez")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,10 @@
 # main.py
 
 import os
-from datetime import datetime, timezone
-from typing import Annotated, Optional, Dict, Any
+from datetime import datetime
+from typing import Annotated, Optional
 
-from fastapi import FastAPI, Depends, HTTPException, Request, status, Header, Security
+from fastapi import FastAPI, Depends, HTTPException, Request, Header, Security
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordRequestForm, HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
@@ -12,11 +12,9 @@ from dotenv import load_dotenv
 # JWT (HS256)
 import jwt
 
-# Supabase client
-from supabase import create_client, Client
-
 # Importar la clase AuthService y los modelos
 from app.api.auth.auth_service import AuthService
+from app.core.auth import get_current_user
 from app.api.models.user import UserIn, UserOut, PasswordResetRequest, PasswordUpdate
 
 # Routers del Routine Manager
@@ -26,6 +24,9 @@ from app.api.routers import subtasks, tags, reminders
 # Routers de Whatsaatp Webhooks
 from app.api.routers import notifications_whatsapp, webhook_whatsapp
 from app.api.routers import task_reminders
+from app.core.supabase_client import get_service_supabase, aclose_pools, track_round_trips
+from app.core import chat_context, metrics
+from app.api.security import login_log
 
 
 # -------------------------------------------------------------------
@@ -72,8 +73,34 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],  # cursor de paginación (app/core/pagination.py)
 )
 
+# Round trips a PostgREST por endpoint (ver /health/metrics):
+#   rest.round_trips.<router>.<endpoint>  y  rest.requests.<router>.<endpoint>
+# (p.ej. rest.round_trips.tasks.create_task). Se etiqueta por función y no por
+# path porque con routers incluidos la ruta del scope no trae el prefijo.
+@app.middleware("http")
+async def _count_rest_round_trips(request: Request, call_next):
+    box = track_round_trips()
+    response = await call_next(request)
+    endpoint = request.scope.get("endpoint")
+    if endpoint is None:  # 404s: no abrir un contador por cada path arbitrario
+        return response
+    label = f"{endpoint.__module__.rsplit('.', 1)[-1]}.{endpoint.__name__}"
+    metrics.inc(f"rest.requests.{label}")
+    metrics.inc(f"rest.round_trips.{label}", box[0])
+    return response
+
+# Cierra los pools HTTP compartidos hacia PostgREST al apagar
+# (antes vacía la cola de login_history y los snapshots de chat_context,
+# que escriben por ese pool)
+@app.on_event("shutdown")
+async def _shutdown_pools():
+    await login_log.aflush()
+    await chat_context.aflush()
+    await aclose_pools()
+
 # -------------------------------------------------------------------
 # Config Supabase / HS256
 # -------------------------------------------------------------------
@@ -86,124 +113,18 @@ ALLOW_DEV_HEADER = os.getenv("ALLOW_DEV_HEADER", "0") == "1"
 if not SUPABASE_URL or not SUPABASE_KEY:
     raise RuntimeError("Faltan SUPABASE_URL/SUPABASE_KEY en .env")
 
-# Cliente Supabase (para email real vía auth.get_user)
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-
 # Security scheme para Authorize (campo 'Bearer token')
 bearer_scheme = HTTPBearer(auto_error=False)
 
-# -------------------------------------------------------------------
-# JWT HS256 validation
-# -------------------------------------------------------------------
-def _decode_jwt_hs256(token: str) -> Dict[str, Any]:
-    """
-    MODO HS256-ONLY:
-    - Valida SIEMPRE con SUPABASE_JWT_SECRET (Legacy JWT secret).
-    - Rechaza tokens con alg != HS256.
-    - Valida 'aud' y 'iss' (si viene), y requiere 'exp' y 'sub'.
-    """
-    # 1) Header
-    try:
-        header = jwt.get_unverified_header(token)
-        alg = header.get("alg")
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail=f"[JWT] Invalid header: {e}",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-
-    if alg != "HS256":
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail=f"[HS256-mode] Token alg={alg}. Obtén un token HS256 con /auth/login de este proyecto.",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-
-    # 2) Payload sin firma (para leer iss si existe)
-    try:
-        unverified = jwt.decode(
-            token,
-            options={"verify_signature": False, "verify_aud": False, "verify_iss": False}
-        )
-        token_iss = unverified.get("iss")
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail=f"[JWT] Cannot read unverified payload: {e}",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-
-    if not SUPABASE_JWT_SECRET:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="[HS256] SUPABASE_JWT_SECRET no configurado",
-        )
-
-    # 3) Validación de firma/claims
-    try:
-        payload = jwt.decode(
-            token,
-            SUPABASE_JWT_SECRET,
-            algorithms=["HS256"],
-            audience=SUPABASE_AUD,
-            issuer=token_iss or f"{SUPABASE_URL}/auth/v1",
-            options={"require": ["exp", "sub"]},
-        )
-        return payload
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail=f"[HS256] Invalid token: {e}",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-
 # -------------------------------------------------------------------
 # Dependencias
 # -------------------------------------------------------------------
+# La validación HS256 (con cache de claims) vive en app/core/auth.py.
+# Usar la MISMA dependencia que los routers permite que FastAPI la resuelva
+# una sola vez por request aunque se declare en el router y en el endpoint.
 def get_auth_service():
     return AuthService()
 
-async def get_current_user(
-    credentials: Annotated[Optional[HTTPAuthorizationCredentials], Security(bearer_scheme)],
-    x_user_id: Optional[str] = Header(default=None, alias="X-User-Id"),
-) -> UserOut:
-    """
-    - Modo dev: X-User-Id (si ALLOW_DEV_HEADER=1)
-    - Modo productivo: Authorization: Bearer <HS256 token>
-    """
-    # Dev bypass
-    if ALLOW_DEV_HEADER and x_user_id:
-        return UserOut(id=x_user_id, email="dev@example.com", created_at=datetime.now(timezone.utc))
-
-    # Bearer requerido
-    if not credentials or credentials.scheme.lower() != "bearer":
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Missing or invalid Authorization header",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-
-    token = credentials.credentials
-
-    # Validar HS256
-    payload = _decode_jwt_hs256(token)
-    user_id = payload.get("sub")
-    if not user_id:
-        raise HTTPException(status_code=401, detail="Token payload missing 'sub'")
-
-    # Email real desde Supabase
-    try:
-        res = supabase.auth.get_user(token)
-        user = res.user
-        email = getattr(user, "email", None) or (getattr(user, "user_metadata", {}) or {}).get("email")
-        if not email:
-            email = "unknown@example.com"
-    except Exception:
-        email = "unknown@example.com"
-
-    return UserOut(id=user_id, email=email, created_at=datetime.now(timezone.utc))
-
 # -------------------------------------------------------------------
 # Routers protegidos bajo /api — SIN tags aquí para evitar duplicación
 # -------------------------------------------------------------------
@@ -300,7 +221,7 @@ ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
 def health_dispatcher(x_admin_token: str | None = Header(default=None, alias="X-Admin-Token")):
     if not ADMIN_TOKEN or x_admin_token != ADMIN_TOKEN:
         raise HTTPException(status_code=401, detail="Unauthorized")
-    sb = create_client(SUPABASE_URL, os.getenv("SUPABASE_SERVICE_ROLE_KEY",""))
+    sb = get_service_supabase()
     now = datetime.utcnow().isoformat() + "Z"
     stats = {
         "scheduled": sb.table("notifications").select("id", count="exact").eq("status","scheduled").execute().count or 0,
@@ -308,3 +229,12 @@ def health_dispatcher(x_admin_token: str | None = Header(default=None, alias="X-
         "failed_24h": sb.rpc("rpc_failed_last_24h", {} ).execute().data if False else None  # opcional si creas un RPC
     }
     return {"status":"ok","time":now,"stats":stats}
+
+@app.get("/health/metrics", tags=["Health"])
+def health_metrics(x_admin_token: str | None = Header(default=None, alias="X-Admin-Token")):
+    """
+    Contadores del proceso (p.ej. auth_server.calls debe quedarse en 0 en el hot path).
+    """
+    if not ADMIN_TOKEN or x_admin_token != ADMIN_TOKEN:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    return metrics.snapshot()
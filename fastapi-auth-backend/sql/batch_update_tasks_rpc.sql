@@ -0,0 +1,39 @@
+-- =========================================================
+-- RPC: batch_update_tasks(p_ops jsonb)
+--  - p_ops = [{"id": "<uuid>", "patch": {"position": 3.5, ...}}, ...]
+--  - Aplica N PATCH distintos en UN solo UPDATE ... FROM (un round trip),
+--    p.ej. el reordenamiento drag & drop del frontend (solo `position`).
+--  - Semántica PATCH: solo cambia las claves presentes en cada `patch`.
+--  - SECURITY INVOKER + user_id = auth.uid(): respeta RLS.
+--  - Devuelve las filas actualizadas con la forma de tasks_api;
+--    los ids que no vuelven no existen (o no son del usuario).
+-- =========================================================
+CREATE OR REPLACE FUNCTION public.batch_update_tasks(p_ops jsonb)
+RETURNS SETOF public.tasks_api
+LANGUAGE sql
+SECURITY INVOKER
+AS $$
+  WITH ops AS (
+    SELECT DISTINCT ON ((o->>'id')::uuid)
+           (o->>'id')::uuid AS id, o->'patch' AS p
+    FROM jsonb_array_elements(p_ops) o
+  )
+  UPDATE public.tasks t SET
+    title       = CASE WHEN ops.p ? 'title'       THEN ops.p->>'title'                           ELSE t.title END,
+    description = CASE WHEN ops.p ? 'description' THEN ops.p->>'description'                     ELSE t.description END,
+    tag         = CASE WHEN ops.p ? 'tag'         THEN (ops.p->>'tag')::task_tag                 ELSE t.tag END,
+    start_ts    = CASE WHEN ops.p ? 'start_ts'    THEN (ops.p->>'start_ts')::timestamptz         ELSE t.start_ts END,
+    end_ts      = CASE WHEN ops.p ? 'end_ts'      THEN (ops.p->>'end_ts')::timestamptz           ELSE t.end_ts END,
+    status      = CASE WHEN ops.p ? 'status'      THEN (ops.p->>'status')::task_status           ELSE t.status END,
+    priority    = CASE WHEN ops.p ? 'priority'    THEN (ops.p->>'priority')::task_priority       ELSE t.priority END,
+    position    = CASE WHEN ops.p ? 'position'    THEN (ops.p->>'position')::double precision    ELSE t.position END
+  FROM ops
+  WHERE t.id = ops.id
+    AND t.user_id = auth.uid()
+  RETURNING t.id, t.user_id, t.title, t.description, t.tag, t.status, t.priority,
+            t.start_ts, t.end_ts AS due_at,
+            t.position, t.created_at, t.updated_at, t.completed_at, t.deleted_at;
+$$;
+
+REVOKE ALL ON FUNCTION public.batch_update_tasks(jsonb) FROM PUBLIC, anon;
+GRANT EXECUTE ON FUNCTION public.batch_update_tasks(jsonb) TO authenticated;
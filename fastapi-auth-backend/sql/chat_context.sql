@@ -0,0 +1,28 @@
+-- =========================================================
+-- chat_context: snapshot del contexto del chat por usuario
+-- (app/core/chat_context.py)
+--  - summary : resumen incremental de la conversación fuera de la ventana
+--  - turns   : ventana de turnos recientes [{"role", "content"}, ...]
+--  - pending : turnos que salieron de la ventana y aún no entran al resumen
+--  Se reescribe entera (upsert) en background después de cada turno.
+--  RLS: cada usuario solo ve / escribe su fila (user_id = auth.uid()).
+-- =========================================================
+CREATE TABLE IF NOT EXISTS public.chat_context (
+  user_id    uuid PRIMARY KEY REFERENCES auth.users (id) ON DELETE CASCADE,
+  summary    text  NOT NULL DEFAULT '',
+  turns      jsonb NOT NULL DEFAULT '[]'::jsonb,
+  pending    jsonb NOT NULL DEFAULT '[]'::jsonb,
+  updated_at timestamptz NOT NULL DEFAULT now()
+);
+
+ALTER TABLE public.chat_context ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS chat_context_own ON public.chat_context;
+CREATE POLICY chat_context_own ON public.chat_context
+  FOR ALL
+  USING (user_id = auth.uid())
+  WITH CHECK (user_id = auth.uid());
+
+-- Arranque sin snapshot: últimos mensajes del usuario
+CREATE INDEX IF NOT EXISTS idx_chat_messages_user_created
+ON public.chat_messages (user_id, created_at DESC);
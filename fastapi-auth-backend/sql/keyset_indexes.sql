@@ -0,0 +1,24 @@
+-- =========================================================
+-- Índices para paginación por keyset (app/core/pagination.py)
+--  Cada listado ordena por (columna, id) y pide la página siguiente con
+--    columna >= v AND (columna > v OR id > last_id)
+--  Con estos índices eso es un range scan que arranca en el cursor:
+--  la página N cuesta lo mismo que la primera (sin OFFSET).
+-- =========================================================
+
+-- GET /api/tasks  (tasks_api: user_id + deleted_at IS NULL, orden start_ts, id)
+CREATE INDEX IF NOT EXISTS idx_tasks_user_start_id
+  ON public.tasks (user_id, start_ts, id)
+  WHERE deleted_at IS NULL;
+
+-- GET /api/reminders  (notifications del usuario, orden scheduled_for, id)
+CREATE INDEX IF NOT EXISTS idx_notif_user_sched_id
+  ON public.notifications (user_id, scheduled_for, id);
+
+-- GET /api/reminders?only_active=true  (status = 'scheduled')
+CREATE INDEX IF NOT EXISTS idx_notif_user_status_sched_id
+  ON public.notifications (user_id, status, scheduled_for, id);
+
+-- GET /reminders  (filtra active, orden next_fire_at, id)
+CREATE INDEX IF NOT EXISTS idx_reminders_active_fire_id
+  ON public.reminders (active, next_fire_at, id);
@@ -0,0 +1,11 @@
+-- =========================================================
+-- login_history: ubicación del intento (app/core/geoip.py, base local)
+--  - country / city        : lo que devuelve la base de rangos ("" si no hay)
+--  - latitude / longitude  : para la regla de distancia (login_rules.assess)
+--  Filas viejas quedan en NULL: se tratan como ubicación desconocida.
+-- =========================================================
+ALTER TABLE public.login_history
+  ADD COLUMN IF NOT EXISTS country text,
+  ADD COLUMN IF NOT EXISTS city text,
+  ADD COLUMN IF NOT EXISTS latitude double precision,
+  ADD COLUMN IF NOT EXISTS longitude double precision;
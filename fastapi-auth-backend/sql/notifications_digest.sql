@@ -0,0 +1,109 @@
+-- =========================================================
+-- Notifications: claim con "hermanas" para digests por usuario
+--  - Igual que claim_notifications de sql/notifications_lease.sql, más:
+--  - p_digest_window_seconds > 0: además de las vencidas, reclama las demás
+--    notificaciones libres de ESOS MISMOS usuarios que vencen dentro de la
+--    ventana, para que el worker las mande juntas en un solo digest
+--    (DISPATCHER_DIGEST_WINDOW_SECONDS)
+--  - Solo hermanas que el worker puede sumar al digest: misma digest key
+--    (notification_digest_key, igual que WhatsAppChannel.digest_key) que una
+--    vencida del usuario, venciendo dentro de la ventana desde ella, y hasta
+--    p_digest_max - 1 por usuario (DISPATCHER_DIGEST_MAX). Las que igual no
+--    entren, el worker las libera sin enviarlas (engine.SendPipeline)
+--  - Orden por (scheduled_for, user_id): las de un usuario a la misma hora
+--    caen juntas en el lote
+--  - Con p_digest_window_seconds = 0 se comporta igual que la versión anterior
+-- =========================================================
+CREATE INDEX IF NOT EXISTS idx_notif_user_due
+ON public.notifications (user_id, scheduled_for)
+WHERE status = 'scheduled'
+  AND channel = 'whatsapp';
+
+-- Key de digest de un payload (app/worker/channels.py WhatsAppChannel.digest_key):
+-- solo recordatorios template_by_task con rm_task_summary, agrupados por idioma;
+-- NULL = va siempre sola
+CREATE OR REPLACE FUNCTION public.notification_digest_key(p_payload jsonb)
+RETURNS text
+LANGUAGE sql
+IMMUTABLE
+AS $$
+  SELECT CASE
+    WHEN COALESCE(NULLIF(p_payload->>'mode', ''), 'template_by_task') = 'template_by_task'
+     AND COALESCE(NULLIF(p_payload->>'template_name', ''), 'rm_task_summary') = 'rm_task_summary'
+    THEN COALESCE(NULLIF(p_payload->>'lang_code', ''), 'en')
+  END;
+$$;
+
+DROP FUNCTION IF EXISTS public.claim_notifications(int, text, int);
+
+CREATE OR REPLACE FUNCTION public.claim_notifications(
+  p_limit int DEFAULT 20,
+  p_worker text DEFAULT NULL,
+  p_lease_seconds int DEFAULT 300,
+  p_digest_window_seconds int DEFAULT 0,
+  p_digest_max int DEFAULT 10
+)
+RETURNS SETOF public.notifications
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+  v_horizon timestamptz := now() + make_interval(secs => GREATEST(p_digest_window_seconds, 0));
+BEGIN
+  RETURN QUERY
+  WITH due AS (
+    SELECT id,
+           user_id,
+           public.notification_digest_key(payload) AS digest_key,
+           GREATEST(scheduled_for, COALESCE(next_retry_at, scheduled_for)) AS due_at
+    FROM public.notifications
+    WHERE channel = 'whatsapp'
+      AND status  = 'scheduled'
+      AND (next_retry_at IS NULL OR next_retry_at <= now())
+      AND scheduled_for <= now()
+      AND (COALESCE(processing, false) = false OR lease_until IS NULL OR lease_until < now())
+    ORDER BY scheduled_for ASC, user_id
+    LIMIT p_limit
+    FOR UPDATE SKIP LOCKED
+  ), ranked AS (
+    SELECT c.id,
+           row_number() OVER (PARTITION BY c.user_id ORDER BY c.scheduled_for, c.id) AS rn
+    FROM public.notifications c
+    WHERE p_digest_window_seconds > 0
+      AND p_digest_max > 1
+      AND c.user_id IN (SELECT user_id FROM due)
+      AND c.id NOT IN (SELECT id FROM due)
+      AND c.channel = 'whatsapp'
+      AND c.status  = 'scheduled'
+      AND (c.next_retry_at IS NULL OR c.next_retry_at <= v_horizon)
+      AND c.scheduled_for <= v_horizon
+      AND (COALESCE(c.processing, false) = false OR c.lease_until IS NULL OR c.lease_until < now())
+      AND EXISTS (
+        SELECT 1
+        FROM due d
+        WHERE d.user_id = c.user_id
+          AND d.digest_key = public.notification_digest_key(c.payload)
+          AND GREATEST(c.scheduled_for, COALESCE(c.next_retry_at, c.scheduled_for))
+              <= d.due_at + make_interval(secs => p_digest_window_seconds)
+      )
+  ), siblings AS (
+    -- FOR UPDATE no va con funciones de ventana: se bloquea aparte, re-chequeando
+    SELECT s.id
+    FROM public.notifications s
+    WHERE s.id IN (SELECT id FROM ranked WHERE rn < p_digest_max)
+      AND s.status = 'scheduled'
+      AND (COALESCE(s.processing, false) = false OR s.lease_until IS NULL OR s.lease_until < now())
+    FOR UPDATE SKIP LOCKED
+  )
+  UPDATE public.notifications n
+     SET processing  = true,
+         claimed_by  = p_worker,
+         lease_until = now() + make_interval(secs => p_lease_seconds),
+         updated_at  = now()
+   WHERE n.id IN (SELECT id FROM due UNION ALL SELECT id FROM siblings)
+  RETURNING n.*;
+END;
+$$;
+
+REVOKE ALL ON FUNCTION public.claim_notifications(int, text, int, int, int) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.claim_notifications(int, text, int, int, int) TO service_role;
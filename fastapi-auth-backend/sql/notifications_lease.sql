@@ -0,0 +1,99 @@
+-- =========================================================
+-- Notifications: claim por lease (varios workers en paralelo)
+--  - claimed_by  : id del worker dueño del claim ("host:pid:rand")
+--  - lease_until : hasta cuándo es suyo; vencido => cualquier worker lo
+--                  vuelve a reclamar (worker caído con processing=true).
+--                  NULL con processing=true (claims del dispatcher viejo,
+--                  anteriores a esta migración) cuenta como vencido
+-- =========================================================
+ALTER TABLE public.notifications
+  ADD COLUMN IF NOT EXISTS claimed_by text,
+  ADD COLUMN IF NOT EXISTS lease_until timestamptz;
+
+-- Claims abandonados (processing=true con lease vencido o sin lease)
+CREATE INDEX IF NOT EXISTS idx_notif_lease
+ON public.notifications (lease_until)
+WHERE status = 'scheduled'
+  AND channel = 'whatsapp'
+  AND processing IS TRUE;
+
+-- =========================================================
+-- RPC: claim_notifications(p_limit, p_worker, p_lease_seconds)
+--  - Vencidas y libres (no processing, o con lease vencido / NULL)
+--  - FOR UPDATE SKIP LOCKED: dos workers nunca se llevan la misma fila
+--  - Marca processing=true + claimed_by + lease_until en la misma transacción
+--  - Reemplaza a claim_notifications(int); con solo p_limit se comporta igual
+--    (lease de 5 min sin dueño)
+-- =========================================================
+DROP FUNCTION IF EXISTS public.claim_notifications(int);
+
+CREATE OR REPLACE FUNCTION public.claim_notifications(
+  p_limit int DEFAULT 20,
+  p_worker text DEFAULT NULL,
+  p_lease_seconds int DEFAULT 300
+)
+RETURNS SETOF public.notifications
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+BEGIN
+  RETURN QUERY
+  WITH candidates AS (
+    SELECT id
+    FROM public.notifications
+    WHERE channel = 'whatsapp'
+      AND status  = 'scheduled'
+      AND (next_retry_at IS NULL OR next_retry_at <= now())
+      AND scheduled_for <= now()
+      AND (COALESCE(processing, false) = false OR lease_until IS NULL OR lease_until < now())
+    ORDER BY scheduled_for ASC
+    LIMIT p_limit
+    FOR UPDATE SKIP LOCKED
+  )
+  UPDATE public.notifications n
+     SET processing  = true,
+         claimed_by  = p_worker,
+         lease_until = now() + make_interval(secs => p_lease_seconds),
+         updated_at  = now()
+    FROM candidates c
+   WHERE n.id = c.id
+  RETURNING n.*;
+END;
+$$;
+
+REVOKE ALL ON FUNCTION public.claim_notifications(int, text, int) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.claim_notifications(int, text, int) TO service_role;
+
+-- =========================================================
+-- RPC: apply_notification_outcomes(p_rows jsonb) con fencing por lease
+--  - Igual que sql/notifications_outcomes_rpc.sql, más:
+--  - Si la fila trae "lease_owner", solo se aplica si claimed_by sigue siendo
+--    ese worker (si el lease venció y otro la reclamó, el resultado viejo se
+--    descarta) y libera claimed_by / lease_until.
+-- =========================================================
+CREATE OR REPLACE FUNCTION public.apply_notification_outcomes(p_rows jsonb)
+RETURNS integer
+LANGUAGE sql
+SECURITY DEFINER
+AS $$
+  WITH o AS (
+    SELECT DISTINCT ON ((r->>'id')::uuid)
+           (r->>'id')::uuid AS id, r
+    FROM jsonb_array_elements(p_rows) r
+  ), upd AS (
+    UPDATE public.notifications n SET
+      status        = CASE WHEN o.r ? 'status'        THEN (o.r->>'status')::notif_status           ELSE n.status END,
+      processing    = CASE WHEN o.r ? 'processing'    THEN (o.r->>'processing')::boolean            ELSE n.processing END,
+      attempts      = CASE WHEN o.r ? 'attempts'      THEN (o.r->>'attempts')::int                  ELSE n.attempts END,
+      next_retry_at = CASE WHEN o.r ? 'next_retry_at' THEN (o.r->>'next_retry_at')::timestamptz     ELSE n.next_retry_at END,
+      payload       = CASE WHEN o.r ? 'payload'       THEN NULLIF(o.r->'payload', 'null'::jsonb)    ELSE n.payload END,
+      claimed_by    = CASE WHEN o.r ? 'lease_owner'   THEN NULL                                     ELSE n.claimed_by END,
+      lease_until   = CASE WHEN o.r ? 'lease_owner'   THEN NULL                                     ELSE n.lease_until END,
+      updated_at    = now()
+    FROM o
+    WHERE n.id = o.id
+      AND (NOT (o.r ? 'lease_owner') OR n.claimed_by = o.r->>'lease_owner')
+    RETURNING 1
+  )
+  SELECT count(*)::int FROM upd;
+$$;
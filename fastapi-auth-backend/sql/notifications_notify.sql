@@ -0,0 +1,33 @@
+-- =========================================================
+-- NOTIFY notifications_due: despierta a los workers al instante
+--  - Se dispara al insertar una notificación pendiente o al reprogramarla
+--    (scheduled_for / next_retry_at / status / processing).
+--  - payload = {"id": "<uuid>", "due": "<timestamptz>"}; el worker lo mete en su
+--    heap de vencimientos y duerme exactamente hasta `due`
+--    (app/worker/scheduler.py, requiere DATABASE_URL + psycopg).
+--  - Sin listener conectado el worker cae a polling; el trigger no estorba.
+-- =========================================================
+CREATE OR REPLACE FUNCTION public.notify_notification_due()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  IF NEW.status = 'scheduled'
+     AND NEW.channel = 'whatsapp'
+     AND COALESCE(NEW.processing, false) = false THEN
+    PERFORM pg_notify(
+      'notifications_due',
+      json_build_object(
+        'id',  NEW.id,
+        'due', GREATEST(NEW.scheduled_for, COALESCE(NEW.next_retry_at, NEW.scheduled_for))
+      )::text
+    );
+  END IF;
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_notifications_due ON public.notifications;
+CREATE TRIGGER trg_notifications_due
+AFTER INSERT OR UPDATE OF scheduled_for, next_retry_at, status, processing ON public.notifications
+FOR EACH ROW EXECUTE FUNCTION public.notify_notification_due();
@@ -0,0 +1,36 @@
+-- =========================================================
+-- RPC: apply_notification_outcomes(p_rows jsonb)
+--  - p_rows = [{"id": "<uuid>", "status": "sent", "processing": false,
+--               "attempts": 1, "next_retry_at": null, "payload": {...}}, ...]
+--  - Escribe el resultado de N envíos del worker en UN solo UPDATE ... FROM
+--    (antes: un UPDATE por notificación).
+--  - Solo cambia las claves presentes en cada fila; updated_at = now().
+--  - Devuelve cuántas filas se actualizaron.
+-- =========================================================
+CREATE OR REPLACE FUNCTION public.apply_notification_outcomes(p_rows jsonb)
+RETURNS integer
+LANGUAGE sql
+SECURITY DEFINER
+AS $$
+  WITH o AS (
+    SELECT DISTINCT ON ((r->>'id')::uuid)
+           (r->>'id')::uuid AS id, r
+    FROM jsonb_array_elements(p_rows) r
+  ), upd AS (
+    UPDATE public.notifications n SET
+      status        = CASE WHEN o.r ? 'status'        THEN (o.r->>'status')::notif_status           ELSE n.status END,
+      processing    = CASE WHEN o.r ? 'processing'    THEN (o.r->>'processing')::boolean            ELSE n.processing END,
+      attempts      = CASE WHEN o.r ? 'attempts'      THEN (o.r->>'attempts')::int                  ELSE n.attempts END,
+      next_retry_at = CASE WHEN o.r ? 'next_retry_at' THEN (o.r->>'next_retry_at')::timestamptz     ELSE n.next_retry_at END,
+      payload       = CASE WHEN o.r ? 'payload'       THEN NULLIF(o.r->'payload', 'null'::jsonb)    ELSE n.payload END,
+      updated_at    = now()
+    FROM o
+    WHERE n.id = o.id
+    RETURNING 1
+  )
+  SELECT count(*)::int FROM upd;
+$$;
+
+-- Solo el worker (service_role)
+REVOKE ALL ON FUNCTION public.apply_notification_outcomes(jsonb) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.apply_notification_outcomes(jsonb) TO service_role;
@@ -0,0 +1,67 @@
+-- =========================================================
+-- RPC: search_tasks_v2 (FTS + filtros + keyset)
+--  - Todos los filtros (status/tag/priority) se aplican en el server:
+--    las páginas ya no salen cortas por filtrar en Python.
+--  - Orden estable: rank DESC, start_ts ASC, id ASC
+--  - Paginación por keyset (p_after_*): sin OFFSET, el costo no crece
+--    con la profundidad de la página.
+--  - SECURITY INVOKER: corre con el JWT del usuario (respeta RLS).
+--  - Devuelve la proyección de tasks_api (+ rank para armar el cursor).
+-- Requiere la columna tasks.tsv y su índice GIN (ver supabase-guide.md §4).
+-- =========================================================
+CREATE OR REPLACE FUNCTION public.search_tasks_v2(
+  q            text,
+  p_status     text        DEFAULT NULL,
+  p_tag        text        DEFAULT NULL,
+  p_priority   text        DEFAULT NULL,
+  p_limit      int         DEFAULT 50,
+  p_after_rank real        DEFAULT NULL,
+  p_after_start timestamptz DEFAULT NULL,
+  p_after_id   uuid        DEFAULT NULL
+)
+RETURNS TABLE (
+  id           uuid,
+  user_id      uuid,
+  title        text,
+  description  text,
+  tag          task_tag,
+  status       task_status,
+  priority     task_priority,
+  start_ts     timestamptz,
+  due_at       timestamptz,
+  "position"   double precision,
+  created_at   timestamptz,
+  updated_at   timestamptz,
+  completed_at timestamptz,
+  rank         real
+)
+LANGUAGE sql
+STABLE
+SECURITY INVOKER
+AS $$
+  WITH query AS (
+    SELECT websearch_to_tsquery('simple', q) AS tsq
+  ),
+  ranked AS (
+    SELECT t.*, ts_rank(t.tsv, query.tsq) AS rank
+    FROM public.tasks t, query
+    WHERE t.user_id = auth.uid()
+      AND t.deleted_at IS NULL
+      AND t.tsv @@ query.tsq
+      AND (p_status   IS NULL OR t.status::text   = p_status)
+      AND (p_tag      IS NULL OR t.tag::text      = p_tag)
+      AND (p_priority IS NULL OR t.priority::text = p_priority)
+  )
+  SELECT r.id, r.user_id, r.title, r.description, r.tag, r.status, r.priority,
+         r.start_ts, r.end_ts AS due_at, r.position,
+         r.created_at, r.updated_at, r.completed_at, r.rank
+  FROM ranked r
+  WHERE p_after_id IS NULL
+     OR r.rank < p_after_rank
+     OR (r.rank = p_after_rank AND (r.start_ts, r.id) > (p_after_start, p_after_id))
+  ORDER BY r.rank DESC, r.start_ts ASC, r.id ASC
+  LIMIT LEAST(GREATEST(p_limit, 1), 200);
+$$;
+
+REVOKE ALL ON FUNCTION public.search_tasks_v2(text, text, text, text, int, real, timestamptz, uuid) FROM PUBLIC, anon;
+GRANT EXECUTE ON FUNCTION public.search_tasks_v2(text, text, text, text, int, real, timestamptz, uuid) TO authenticated;